@@ -0,0 +1,110 @@
+"""
+Workspace membership and the denormalized ``WorkspaceAccess`` index.
+
+A ``WorkspaceAccess`` row exists for every (user, workspace) pair where the
+user owns the workspace, is a member of it, or both. Rows are upserted on
+grant and removed once neither flag is set.
+
+``add_members``/``remove_members`` write the members through table in
+batches. Bulk queries don't send ``m2m_changed``, so they update the access
+index themselves. Membership is part of the workspace representation, so
+every change also bumps ``Workspace.updated_at`` (``touch``), which its
+ETags are derived from.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Workspace, WorkspaceAccess
+
+Membership = Workspace.members.through
+
+MEMBERSHIP_BATCH_SIZE = 1000
+
+UPSERT_OPTIONS = {
+    'update_conflicts': True,
+    'unique_fields': ['user', 'workspace'],
+}
+
+
+def grant_membership(pairs):
+    """Mark each ``(workspace_id, user_id)`` pair as a member."""
+    WorkspaceAccess.objects.bulk_create(
+        [WorkspaceAccess(workspace_id=workspace_id, user_id=user_id, is_member=True) for workspace_id, user_id in pairs],
+        update_fields=['is_member'],
+        **UPSERT_OPTIONS,
+    )
+
+
+def grant_ownership(pairs):
+    """Mark each ``(workspace_id, user_id)`` pair as the owner."""
+    WorkspaceAccess.objects.bulk_create(
+        [WorkspaceAccess(workspace_id=workspace_id, user_id=user_id, is_owner=True) for workspace_id, user_id in pairs],
+        update_fields=['is_owner'],
+        **UPSERT_OPTIONS,
+    )
+
+
+def revoke_membership(**lookup):
+    """Clear the member flag on the access rows matching ``lookup``."""
+    rows = WorkspaceAccess.objects.filter(is_member=True, **lookup)
+    rows.filter(is_owner=True).update(is_member=False)
+    rows.filter(is_owner=False).delete()
+
+
+def set_owner(workspace_id, owner_id, created=False):
+    """Make ``owner_id`` the only owner row of the workspace."""
+    if not created:
+        previous = WorkspaceAccess.objects.filter(workspace_id=workspace_id, is_owner=True).exclude(user_id=owner_id)
+        previous.filter(is_member=True).update(is_owner=False)
+        previous.filter(is_member=False).delete()
+    grant_ownership([(workspace_id, owner_id)])
+
+
+def touch(workspace_ids):
+    """Bump ``updated_at`` on workspaces whose membership changed."""
+    Workspace.objects.filter(pk__in=list(workspace_ids)).update(updated_at=timezone.now())
+
+
+def is_member(workspace_id, user_id):
+    """Single indexed probe on the members through table."""
+    return Membership.objects.filter(workspace_id=workspace_id, user_id=user_id).exists()
+
+
+def add_members(workspace_id, user_ids, batch_size=MEMBERSHIP_BATCH_SIZE):
+    """
+    Add ``user_ids`` to the workspace; users who are already members are
+    left alone. Returns the ids that were newly added.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    with transaction.atomic():
+        existing = set(
+            Membership.objects.filter(workspace_id=workspace_id, user_id__in=user_ids).values_list('user_id', flat=True)
+        )
+        added = [user_id for user_id in user_ids if user_id not in existing]
+        # ignore_conflicts keeps a concurrent add of the same user harmless
+        Membership.objects.bulk_create(
+            [Membership(workspace_id=workspace_id, user_id=user_id) for user_id in added],
+            batch_size=batch_size,
+            ignore_conflicts=True,
+        )
+        for start in range(0, len(added), batch_size):
+            grant_membership((workspace_id, user_id) for user_id in added[start:start + batch_size])
+        if added:
+            touch([workspace_id])
+    return added
+
+
+def remove_members(workspace_id, user_ids, batch_size=MEMBERSHIP_BATCH_SIZE):
+    """Remove ``user_ids`` from the workspace. Returns the ids that were members."""
+    user_ids = list(dict.fromkeys(user_ids))
+    removed = []
+    with transaction.atomic():
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            memberships = Membership.objects.filter(workspace_id=workspace_id, user_id__in=batch)
+            removed.extend(memberships.values_list('user_id', flat=True))
+            memberships.delete()
+            revoke_membership(workspace_id=workspace_id, user_id__in=batch)
+        if removed:
+            touch([workspace_id])
+    return removed
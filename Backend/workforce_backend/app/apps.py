@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        # instrumentation hooks connection_created before any connection opens
+        from . import instrumentation, schema_extensions, signals  # noqa: F401
@@ -0,0 +1,210 @@
+"""
+Async variants of the auth views, for ASGI deployments (ASYNC_AUTH_VIEWS).
+
+They accept and return exactly what their sync counterparts in
+``app.views`` do. The difference is that password hashing and TOTP
+verification are awaited on the bounded ``app.auth_pool``, while ORM work
+goes through Django's async ORM or ``sync_to_async``. A slow hash then
+occupies a pool worker, not the event loop or the thread that serves
+every sync view. Login honours ``AUTHENTICATION_BACKENDS`` and
+``user_login_failed`` like ``authenticate()``; only the default
+ModelBackend gets its hashing moved to the pool.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from django.contrib.auth.signals import user_login_failed
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
+from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView
+
+from . import mfa, outbox
+from .auth_pool import get_auth_pool
+from .models import MFABackupCode
+from .serializers import LoginSerializer, MFALoginSerializer, PasswordResetConfirmSerializer, PasswordResetRequestSerializer, UserRegistrationSerializer
+from .throttling import LoginRateThrottle, MFALoginRateThrottle, PasswordResetRateThrottle, RegisterRateThrottle
+
+User = get_user_model()
+
+
+class AsyncDispatchMixin:
+    """For APIView subclasses whose handlers are coroutines."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Mirrors APIView.dispatch; auth, permission and throttle checks may
+        # hit the cache or database, so they run off the event loop.
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncGenericAPIView(AsyncDispatchMixin, generics.GenericAPIView):
+    pass
+
+
+async def aauthenticate(request, username, password):
+    """
+    ``django.contrib.auth.aauthenticate``. With ModelBackend as the only
+    backend (the default), its work is done here instead, with the
+    hashing awaited on the auth pool; other backends hash wherever they
+    do. Either way, failures send ``user_login_failed``.
+    """
+    backends = auth.get_backends()
+    if len(backends) != 1 or type(backends[0]) is not ModelBackend:
+        return await auth.aauthenticate(request, **{User.USERNAME_FIELD: username, 'password': password})
+
+    user = await amodel_backend_authenticate(backends[0], username, password)
+    if user is None:
+        await user_login_failed.asend(
+            sender=auth.__name__, credentials={User.USERNAME_FIELD: username, 'password': '********************'}, request=request,
+        )
+        return None
+    user.backend = settings.AUTHENTICATION_BACKENDS[0]
+    return user
+
+
+async def amodel_backend_authenticate(backend, username, password):
+    """
+    ModelBackend.authenticate with the hashing awaited on the auth pool.
+    Unknown usernames still pay for one hash so timing doesn't reveal them.
+    """
+    pool = get_auth_pool()
+    user = await User._default_manager.filter(**{User.USERNAME_FIELD: username}).afirst()
+    if user is None:
+        await pool.arun(make_password, password)
+        return None
+
+    if not await pool.arun(check_password, password, user.password):
+        return None
+    if identify_hasher(user.password).must_update(user.password):
+        # Same upgrade check_password's setter would do
+        user.password = await pool.arun(make_password, password)
+        await user.asave(update_fields=['password'])
+    return user if backend.user_can_authenticate(user) else None
+
+
+class AsyncRegisterView(AsyncGenericAPIView):
+    permission_classes = (permissions.AllowAny,)
+    throttle_classes = (RegisterRateThrottle,)
+    serializer_class = UserRegistrationSerializer
+
+    async def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        password_hash = await get_auth_pool().arun(make_password, serializer.validated_data['password'])
+        await sync_to_async(serializer.save)(password_hash=password_hash)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class AsyncLoginView(AsyncDispatchMixin, TokenObtainPairView):
+    throttle_classes = (LoginRateThrottle,)
+    serializer_class = LoginSerializer
+
+    async def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            # Field checks only; LoginSerializer.validate would hash inline
+            attrs = serializer.to_internal_value(request.data)
+        except ValidationError as exc:
+            return Response(exc.detail, status=status.HTTP_401_UNAUTHORIZED)
+
+        user = await aauthenticate(request, attrs[serializer.username_field], attrs['password'])
+        if not jwt_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(serializer.error_messages['no_active_account'], 'no_active_account')
+
+        try:
+            data = await sync_to_async(serializer.token_data)(user)
+        except TokenError as e:
+            # As TokenViewBase.post does
+            raise InvalidToken(e.args[0])
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class AsyncMFALoginConfirmView(AsyncGenericAPIView):
+    permission_classes = (permissions.AllowAny,)
+    throttle_classes = (MFALoginRateThrottle,)
+    serializer_class = MFALoginSerializer
+
+    async def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            token = AccessToken(serializer.validated_data['temp_token'])
+        except TokenError:
+            return Response({"detail": "Invalid or expired session."}, status=status.HTTP_401_UNAUTHORIZED)
+        if not token.get('mfa_pending'):
+            return Response({"detail": "Invalid token type."}, status=status.HTTP_400_BAD_REQUEST)
+        user = await User.objects.filter(id=token.get('user_id')).afirst()
+        if user is None:
+            return Response({"detail": "Invalid or expired session."}, status=status.HTTP_401_UNAUTHORIZED)
+
+        code = serializer.validated_data.get('code')
+        backup_code = serializer.validated_data.get('backup_code')
+        if code:
+            is_valid = bool(user.mfa_secret) and await get_auth_pool().arun(mfa.verify_totp, user.mfa_secret, code)
+        else:
+            is_valid = await sync_to_async(MFABackupCode.objects.consume)(user, backup_code)
+
+        if not is_valid:
+            return Response({"detail": "Invalid code"}, status=status.HTTP_400_BAD_REQUEST)
+        refresh = RefreshToken.for_user(user)
+        return Response({
+            'access': str(refresh.access_token),
+            'refresh': str(refresh)
+        })
+
+
+class AsyncRequestPasswordResetView(AsyncGenericAPIView):
+    permission_classes = (permissions.AllowAny,)
+    throttle_classes = (PasswordResetRateThrottle,)
+    serializer_class = PasswordResetRequestSerializer
+
+    async def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        await sync_to_async(outbox.enqueue)('password_reset', {'email': serializer.validated_data['email']})
+        return Response({'detail': 'If an account exists, a reset link has been sent.'}, status=status.HTTP_200_OK)
+
+
+class AsyncSetNewPasswordView(AsyncGenericAPIView):
+    permission_classes = (permissions.AllowAny,)
+    serializer_class = PasswordResetConfirmSerializer
+
+    async def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        if not await sync_to_async(serializer.is_valid)():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        password_hash = await get_auth_pool().arun(make_password, serializer.validated_data['password'])
+        await sync_to_async(serializer.save)(password_hash=password_hash)
+        return Response({'detail': 'Password has been reset successfully.'}, status=status.HTTP_200_OK)
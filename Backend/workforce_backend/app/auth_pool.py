@@ -0,0 +1,126 @@
+"""
+Bounded worker pool for the CPU-bound parts of authentication.
+
+Under ASGI, Django runs sync views on a single thread-sensitive executor,
+so one PBKDF2 hash stalls every other sync request in the process. The
+async auth views (``app.async_views``) instead await password hashing and
+TOTP checks on this pool and keep the event loop free.
+
+The pool is sized by ``AUTH_WORKER_POOL``: ``MAX_WORKERS`` jobs run at once
+and at most ``MAX_QUEUE`` more wait. Past that, submissions fail with
+``PoolSaturated`` (503) rather than queueing without bound. Threads are
+the default; hashlib's PBKDF2 releases the GIL. ``KIND = 'process'``
+suits hashers that don't. Jobs must not touch the database: pool threads
+are outside the request's connection and transaction.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.signals import setting_changed
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+DEFAULTS = {
+    'KIND': 'thread',
+    'MAX_WORKERS': os.cpu_count() or 2,
+    'MAX_QUEUE': 100,
+}
+
+
+class PoolSaturated(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Authentication is busy, please retry shortly.'
+    default_code = 'auth_pool_saturated'
+
+
+class AuthWorkerPool:
+    def __init__(self, kind, max_workers, max_queue):
+        if kind == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='auth-pool')
+        elif kind == 'process':
+            # Spawned, not forked: forking a threaded server process can copy
+            # held locks into the child. django.setup() makes them usable.
+            self.executor = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup)
+        else:
+            raise ValueError(f'Unknown AUTH_WORKER_POOL kind {kind!r}')
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._peak_pending = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def submit(self, func, *args):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise PoolSaturated()
+            self._pending += 1
+            self._peak_pending = max(self._peak_pending, self._pending)
+        future = self.executor.submit(func, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+
+    async def arun(self, func, *args):
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'kind': self.kind,
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'running': min(self._pending, self.max_workers),
+                'queue_depth': max(0, self._pending - self.max_workers),
+                'peak_pending': self._peak_pending,
+                'completed': self._completed,
+                'rejected': self._rejected,
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+def build_auth_pool():
+    config = {**DEFAULTS, **getattr(settings, 'AUTH_WORKER_POOL', {})}
+    return AuthWorkerPool(config['KIND'], config['MAX_WORKERS'], config['MAX_QUEUE'])
+
+
+_auth_pool = None
+_auth_pool_lock = threading.Lock()
+
+
+def get_auth_pool():
+    global _auth_pool
+    if _auth_pool is None:
+        with _auth_pool_lock:
+            if _auth_pool is None:
+                _auth_pool = build_auth_pool()
+    return _auth_pool
+
+
+def current_auth_pool():
+    """The pool if one has been started in this process, without starting one."""
+    return _auth_pool
+
+
+def _reset_auth_pool(*, setting, **kwargs):
+    global _auth_pool
+    if setting == 'AUTH_WORKER_POOL' and _auth_pool is not None:
+        _auth_pool.shutdown()
+        _auth_pool = None
+
+
+setting_changed.connect(_reset_auth_pool)
@@ -0,0 +1,422 @@
+"""
+Benchmarks for the hot paths of the backend.
+
+Scenarios are registered with ``@scenario`` and run through
+``python manage.py benchmark``, always against a throwaway test database.
+Each scenario is called with ``iterations``, ``scale`` (``None`` means
+the scenario's own default data size) and ``concurrency`` (threads
+sharing the iterations) and returns a mapping of label -> measurement.
+
+Results can be saved as a JSON baseline and diffed against a later run
+with ``compare()``.
+"""
+import io
+import itertools
+import json
+import math
+import platform
+import random
+import subprocess
+import threading
+import time
+from datetime import timedelta
+
+import django
+import pyotp
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.db.models import Prefetch, Q
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import compression
+from .fastjson import FastJSONParser, FastJSONRenderer
+from .metrics import ingest
+from .models import Workspace, WorkspaceAccess, WorkspaceInvite
+from .serializers import WorkspaceReadSerializer, WorkspaceSerializer
+
+User = get_user_model()
+
+BENCH_PASSWORD = 'bench-Password-123'
+
+SCENARIOS = {}
+
+# Compared by compare(); True when a higher value is better
+COMPARED_STATS = {'ops_per_sec': True, 'p50_ms': False, 'p95_ms': False, 'p99_ms': False}
+
+
+def scenario(name):
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[max(1, math.ceil(pct / 100 * len(ordered))) - 1]
+
+
+def measure(func, iterations, per_call=1, concurrency=1):
+    """
+    Call ``func`` ``iterations`` times, spread over ``concurrency`` threads,
+    and report throughput and per-call latency percentiles. ``per_call``
+    is how many operations (e.g. rows) one call handles. Calls that raise
+    count as errors and are left out of the latencies.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def run(calls):
+        timings = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            try:
+                func()
+            except Exception as exc:
+                with lock:
+                    errors.append(repr(exc))
+                continue
+            timings.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(timings)
+
+    def run_in_thread(calls):
+        try:
+            run(calls)
+        finally:
+            # Each thread opened its own connection
+            connections.close_all()
+
+    start = time.perf_counter()
+    if concurrency <= 1:
+        run(iterations)
+    else:
+        shares = [iterations // concurrency + (i < iterations % concurrency) for i in range(concurrency)]
+        threads = [threading.Thread(target=run_in_thread, args=(share,)) for share in shares if share]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    result = {
+        'iterations': iterations,
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 4),
+        'ops_per_sec': round(len(latencies) * per_call / elapsed, 2) if elapsed else float('inf'),
+        'errors': len(errors),
+    }
+    for pct in (50, 95, 99):
+        value = percentile(latencies, pct)
+        result[f'p{pct}_ms'] = round(value * 1000, 3) if value is not None else None
+    if errors:
+        result['first_error'] = errors[0][:500]
+    return result
+
+
+_local = threading.local()
+
+
+def thread_client():
+    """One APIClient per benchmark thread; clients keep per-instance state."""
+    if not hasattr(_local, 'client'):
+        _local.client = APIClient()
+    return _local.client
+
+
+def expect(response, status_code):
+    assert response.status_code == status_code, f'{response.status_code}: {response.content[:200]!r}'
+    return response
+
+
+def seed_workspaces(workspaces, users, members_per_workspace=3, focus_user=None, focus_share=0.01, batch_size=5000):
+    """
+    Bulk-insert synthetic users, workspaces (with their default invites),
+    memberships and access rows.
+
+    ``focus_user`` owns and is a member of roughly ``focus_share`` of the
+    workspaces each, standing in for a large tenant.
+    """
+    rng = random.Random(42)
+    # Unusable passwords: hashing thousands of real ones would dominate seeding
+    User.objects.bulk_create(
+        [User(username=f'seed-{i}', email=f'seed-{i}@example.com', password='!') for i in range(users)],
+        batch_size=batch_size,
+    )
+    user_ids = list(User.objects.filter(username__startswith='seed-').values_list('id', flat=True))
+    Membership = Workspace.members.through
+
+    for start in range(0, workspaces, batch_size):
+        batch, invites, memberships, access = [], [], [], []
+        for i in range(start, min(start + batch_size, workspaces)):
+            owner_id = focus_user.pk if focus_user and rng.random() < focus_share else rng.choice(user_ids)
+            workspace = Workspace(name=f'Workspace {i}', owner_id=owner_id, invite_code=f'seed{i:08d}')
+            batch.append(workspace)
+            invites.append(WorkspaceInvite(workspace_id=workspace.id, code=workspace.invite_code))
+
+            member_ids = set(rng.sample(user_ids, min(members_per_workspace, len(user_ids))))
+            if focus_user and rng.random() < focus_share:
+                member_ids.add(focus_user.pk)
+            memberships.extend(Membership(workspace_id=workspace.id, user_id=user_id) for user_id in member_ids)
+            access.extend(
+                WorkspaceAccess(workspace_id=workspace.id, user_id=user_id, is_owner=user_id == owner_id, is_member=user_id in member_ids)
+                for user_id in member_ids | {owner_id}
+            )
+        Workspace.objects.bulk_create(batch, batch_size=batch_size)
+        WorkspaceInvite.objects.bulk_create(invites, batch_size=batch_size)
+        Membership.objects.bulk_create(memberships, batch_size=batch_size)
+        WorkspaceAccess.objects.bulk_create(access, batch_size=batch_size)
+
+
+def seed_metrics(workspace_ids, points_per_workspace, names=('cpu', 'tasks_completed', 'latency_ms')):
+    """Metric history through ``ingest``, so rollups and the workspace snapshot are filled in too."""
+    rng = random.Random(42)
+    now = timezone.now()
+    for workspace_id in workspace_ids:
+        ingest(workspace_id, [
+            {'name': names[i % len(names)], 'value': rng.random() * 100, 'recorded_at': now - timedelta(minutes=i)}
+            for i in range(points_per_workspace)
+        ])
+
+
+@scenario('login')
+def bench_login(iterations, scale, concurrency):
+    User.objects.create_user(username='bench-login', email='bench-login@example.com', password=BENCH_PASSWORD)
+    mfa_user = User.objects.create_user(username='bench-login-mfa', email='bench-login-mfa@example.com', password=BENCH_PASSWORD)
+    mfa_user.mfa_enabled = True
+    mfa_user.save()
+
+    url = reverse('token_obtain_pair')
+
+    def login_as(username):
+        def login():
+            expect(thread_client().post(url, {'username': username, 'password': BENCH_PASSWORD}, format='json'), 200)
+        return login
+
+    return {
+        'login': measure(login_as('bench-login'), iterations, concurrency=concurrency),
+        'login_mfa': measure(login_as('bench-login-mfa'), iterations, concurrency=concurrency),
+    }
+
+
+@scenario('workspace_access')
+def bench_workspace_access(iterations, scale, concurrency):
+    """Legacy owner-OR-member query vs. the WorkspaceAccess index."""
+    scale = scale or 100_000
+    tenant = User.objects.create_user(username='bench-tenant', email='bench-tenant@example.com', password=None)
+    seed_workspaces(scale, users=max(scale // 10, 10), focus_user=tenant)
+
+    querysets = {
+        'legacy': Workspace.objects.filter(Q(members=tenant) | Q(owner=tenant)),
+        'indexed': Workspace.objects.filter(access__user=tenant),
+    }
+    target = Workspace.objects.filter(owner=tenant).values_list('id', flat=True).last()
+
+    results = {}
+    for label, queryset in querysets.items():
+        results[f'{label}_list'] = measure(lambda: list(queryset.values_list('id', flat=True)), iterations, concurrency=concurrency)
+        # Not .get(): the legacy query returns the row once per matching branch
+        results[f'{label}_detail'] = measure(lambda: list(queryset.filter(pk=target)), iterations, concurrency=concurrency)
+    return results
+
+
+@scenario('workspace_serializer')
+def bench_workspace_serializer(iterations, scale, concurrency):
+    """Rows/sec through WorkspaceSerializer vs. WorkspaceReadSerializer, query included."""
+    rows = scale or 500
+    seed_workspaces(rows, users=50, members_per_workspace=5)
+    Workspace.objects.update(
+        active_agents=[{'id': f'agent-{i}', 'status': 'running', 'load': i / 10} for i in range(10)],
+        metrics={'tasks_completed': 1234, 'latency_ms': {'p50': 12.5, 'p95': 80.1}, 'series': list(range(50))},
+    )
+
+    def model_serializer():
+        queryset = Workspace.objects.order_by('-updated_at', '-id').prefetch_related(Prefetch('members', queryset=User.objects.only('id')))
+        WorkspaceSerializer(queryset, many=True).data
+
+    def read_serializer():
+        reader = WorkspaceReadSerializer()
+        reader.to_representation(reader.rows(Workspace.objects.order_by('-updated_at', '-id')))
+
+    return {
+        'model_serializer_rows': measure(model_serializer, iterations, per_call=rows, concurrency=concurrency),
+        'read_serializer_rows': measure(read_serializer, iterations, per_call=rows, concurrency=concurrency),
+    }
+
+
+@scenario('flows')
+def bench_flows(iterations, scale, concurrency):
+    """
+    The user-facing flows over HTTP: register, login, MFA login (password
+    then TOTP), listing workspaces and joining one by invite. ``scale`` is
+    the number of workspaces; users are half that, with five members and
+    twenty metric points per workspace.
+    """
+    scale = scale or 1000
+    tenant = User.objects.create_user(username='bench-tenant', email='bench-tenant@example.com', password=BENCH_PASSWORD)
+    mfa_user = User.objects.create_user(username='bench-mfa', email='bench-mfa@example.com', password=BENCH_PASSWORD)
+    mfa_user.mfa_secret = pyotp.random_base32()
+    mfa_user.mfa_enabled = True
+    mfa_user.save()
+    seed_workspaces(scale, users=max(scale // 2, 10), members_per_workspace=5, focus_user=tenant, focus_share=0.05)
+    seed_metrics(list(Workspace.objects.values_list('id', flat=True)), 20)
+
+    target = Workspace.objects.exclude(owner=tenant).first()
+    invite = WorkspaceInvite.objects.allocate(target)
+    # A fresh user per join, so every call takes the redeem-and-add path
+    joiners = User.objects.bulk_create(
+        [User(username=f'bench-joiner-{i}', email=f'bench-joiner-{i}@example.com', password='!') for i in range(iterations)]
+    )
+    joiner_auth = iter([f'Bearer {AccessToken.for_user(user)}' for user in joiners])
+    tenant_auth = f'Bearer {AccessToken.for_user(tenant)}'
+    registrations = itertools.count()
+
+    def register():
+        n = next(registrations)
+        expect(thread_client().post(reverse('auth_register'), {
+            'username': f'bench-new-{n}', 'email': f'bench-new-{n}@example.com', 'password': BENCH_PASSWORD,
+        }, format='json'), 201)
+
+    def login():
+        expect(thread_client().post(reverse('token_obtain_pair'), {'username': 'bench-tenant', 'password': BENCH_PASSWORD}, format='json'), 200)
+
+    def mfa_login():
+        client = thread_client()
+        temp_token = expect(client.post(reverse('token_obtain_pair'), {'username': 'bench-mfa', 'password': BENCH_PASSWORD}, format='json'), 200).data['temp_token']
+        expect(client.post(reverse('mfa_login_confirm'), {'temp_token': temp_token, 'code': pyotp.TOTP(mfa_user.mfa_secret).now()}, format='json'), 200)
+
+    def workspace_list():
+        expect(thread_client().get(reverse('workspace-list'), HTTP_AUTHORIZATION=tenant_auth), 200)
+
+    def join():
+        expect(thread_client().post(reverse('workspace-join'), {'invite_code': invite.code}, format='json', HTTP_AUTHORIZATION=next(joiner_auth)), 200)
+
+    flows = {'register': register, 'login': login, 'mfa_login': mfa_login, 'workspace_list': workspace_list, 'join': join}
+    return {label: measure(flow, iterations, concurrency=concurrency) for label, flow in flows.items()}
+
+
+@scenario('json')
+def bench_json(iterations, scale, concurrency):
+    """
+    ``scale`` workspaces with large metrics and active_agents blobs:
+    rendering and parsing them with DRF's stdlib JSON vs. the orjson
+    classes, compressing the body with each content coding, and the list
+    endpoint end to end with and without compression.
+    """
+    rows = scale or 200
+    owner = User.objects.create_user(username='bench-json', email='bench-json@example.com', password=None)
+    seed_workspaces(rows, users=50, members_per_workspace=5, focus_user=owner, focus_share=1)
+    Workspace.objects.update(
+        active_agents=[{'id': f'agent-{i}', 'status': 'running', 'load': i / 10, 'tags': ['sdr', 'emea']} for i in range(100)],
+        metrics={f'series_{i}': {'p50': i * 1.5, 'p95': i * 3.25, 'samples': list(range(10))} for i in range(100)},
+    )
+    reader = WorkspaceReadSerializer()
+    data = reader.to_representation(reader.rows(Workspace.objects.all()))
+    body = JSONRenderer().render(data)
+
+    results = {
+        'render_stdlib_rows': measure(lambda: JSONRenderer().render(data), iterations, per_call=rows, concurrency=concurrency),
+        'render_fast_rows': measure(lambda: FastJSONRenderer().render(data), iterations, per_call=rows, concurrency=concurrency),
+        'parse_stdlib_rows': measure(lambda: JSONParser().parse(io.BytesIO(body)), iterations, per_call=rows, concurrency=concurrency),
+        'parse_fast_rows': measure(lambda: FastJSONParser().parse(io.BytesIO(body)), iterations, per_call=rows, concurrency=concurrency),
+    }
+    results['render_stdlib_rows']['bytes'] = len(body)
+    levels = compression.get_config()['LEVELS']
+    for encoding, compress in compression.ENCODINGS.items():
+        level = levels[encoding]
+        results[f'compress_{encoding}'] = measure(lambda: compress(body, level), iterations, concurrency=concurrency)
+        results[f'compress_{encoding}']['bytes'] = len(compress(body, level))
+
+    url = f"{reverse('workspace-list')}?page_size=200"
+    auth = f'Bearer {AccessToken.for_user(owner)}'
+    for encoding in ['identity', *compression.ENCODINGS]:
+        def fetch(encoding=encoding):
+            return expect(thread_client().get(url, HTTP_AUTHORIZATION=auth, HTTP_ACCEPT_ENCODING=encoding), 200)
+        results[f'list_{encoding}'] = measure(fetch, iterations, concurrency=concurrency)
+        results[f'list_{encoding}']['bytes'] = len(fetch().content)
+    return results
+
+
+@scenario('provision')
+def bench_provision(iterations, scale, concurrency):
+    """
+    Creating ``scale`` users (default 100): one register request each vs.
+    one bulk provisioning request, per second of users created.
+    """
+    rows = scale or 100
+    staff = User.objects.create_user(username='bench-staff', email='bench-staff@example.com', password=None, is_staff=True)
+    auth = f'Bearer {AccessToken.for_user(staff)}'
+    batches = itertools.count()
+
+    def users(prefix):
+        n = next(batches)
+        return [
+            {'username': f'{prefix}-{n}-{i}', 'email': f'{prefix}-{n}-{i}@example.com', 'password': BENCH_PASSWORD}
+            for i in range(rows)
+        ]
+
+    def register_each():
+        for user in users('bench-seq'):
+            expect(thread_client().post(reverse('auth_register'), user, format='json'), 201)
+
+    def bulk():
+        expect(thread_client().post(reverse('users_bulk_provision'), {'users': users('bench-bulk')}, format='json', HTTP_AUTHORIZATION=auth), 200)
+
+    return {
+        'register_users': measure(register_each, iterations, per_call=rows, concurrency=concurrency),
+        'bulk_users': measure(bulk, iterations, per_call=rows, concurrency=concurrency),
+    }
+
+
+def run_metadata(options):
+    """Where and how a run happened, stored alongside its results."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'created_at': timezone.now().isoformat(),
+        'commit': commit,
+        'database': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        **options,
+    }
+
+
+def save_baseline(path, results, metadata):
+    with open(path, 'w') as handle:
+        json.dump({'meta': metadata, 'results': results}, handle, indent=2, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def compare(baseline, current, threshold):
+    """
+    Diff ``current`` results against a baseline's, both keyed by
+    ``scenario.label``. Returns ``(key, stat, before, after, change_pct,
+    regressed)`` rows; a stat regressed when it got worse by more than
+    ``threshold`` percent.
+    """
+    rows = []
+    for key in sorted(baseline.keys() & current.keys()):
+        for stat, higher_is_better in COMPARED_STATS.items():
+            before, after = baseline[key].get(stat), current[key].get(stat)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            worse = -change if higher_is_better else change
+            rows.append((key, stat, before, after, round(change, 1), worse > threshold))
+    return rows
@@ -0,0 +1,164 @@
+"""
+Content-Encoding negotiation and compression of API responses.
+
+gzip is always available; brotli (``br``) when the ``brotli`` package is
+installed. ``ENCODINGS`` lists them in the server's order of preference.
+
+``CompressionMiddleware`` compresses responses with the best coding the
+client accepts (``RESPONSE_COMPRESSION``):
+
+* only compressible content types (JSON, NDJSON, text), and only bodies of
+  at least ``MIN_SIZE`` bytes; streaming responses are compressed chunk by
+  chunk, flushed so every chunk reaches the client as it is produced;
+* responses that already have a Content-Encoding (the prebuilt schema) are
+  left as they are;
+* nothing under ``EXCLUDE_PATHS``: auth responses carry tokens, and
+  compressing secrets next to request-controlled text enables BREACH.
+
+Like Django's GZipMiddleware, it weakens strong ETags on compressed
+responses, since the bytes differ from the uncompressed representation.
+"""
+import gzip
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEFAULTS = {
+    'MIN_SIZE': 1024,
+    # Per-response levels: fast, most of the gain. Precomputed artifacts use the maximum.
+    'LEVELS': {'br': 4, 'gzip': 6},
+    'CONTENT_TYPES': ('application/json', 'application/x-ndjson', 'text/'),
+    'EXCLUDE_PATHS': ('/api/auth/',),
+}
+
+ENCODINGS = {}
+if brotli is not None:
+    ENCODINGS['br'] = lambda body, level=11: brotli.compress(body, quality=level)
+# mtime=0 keeps the output (and so any ETag over it) deterministic
+ENCODINGS['gzip'] = lambda body, level=9: gzip.compress(body, compresslevel=level, mtime=0)
+
+
+def parse_accept_encoding(header):
+    """``{coding: qvalue}`` from an Accept-Encoding header."""
+    accepted = {}
+    for item in (header or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate_encoding(header, available):
+    """
+    The coding from ``available`` (in preference order) the client rates
+    highest, or None when identity should be sent.
+    """
+    accepted = parse_accept_encoding(header)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class StreamCompressor:
+    """Incremental compressor whose every chunk is decodable on arrival."""
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk):
+        if self.encoding == 'br':
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress_stream(chunks, encoding, level):
+    compressor = StreamCompressor(encoding, level)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+async def acompress_stream(chunks, encoding, level):
+    compressor = StreamCompressor(encoding, level)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'RESPONSE_COMPRESSION', {})}
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
+        config = get_config()
+        if response.has_header('Content-Encoding') or not self.is_compressible(request, response, config):
+            return response
+        if not response.streaming and len(response.content) < config['MIN_SIZE']:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'), ENCODINGS)
+        if encoding is None:
+            return response
+        level = config['LEVELS'][encoding]
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = acompress_stream(response.streaming_content, encoding, level)
+            else:
+                response.streaming_content = compress_stream(response.streaming_content, encoding, level)
+            del response.headers['Content-Length']
+        else:
+            compressed = ENCODINGS[encoding](response.content, level)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    def is_compressible(self, request, response, config):
+        if response.status_code < 200 or response.status_code in (204, 304):
+            return False
+        if request.path.startswith(tuple(config['EXCLUDE_PATHS'])):
+            return False
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        return content_type.endswith('+json') or content_type.startswith(tuple(config['CONTENT_TYPES']))
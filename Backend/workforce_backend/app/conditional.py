@@ -0,0 +1,111 @@
+"""
+ETags and conditional requests for workspaces.
+
+A workspace's strong ETag encodes its ``updated_at`` to the microsecond,
+plus ``metrics_updated_at`` once metrics have been ingested, joined by
+``+``. If-Match only looks at the ``updated_at`` part, so it can be turned
+back into timestamps and checked by the UPDATE itself
+(``updated_at__in=...``) rather than in a separate read, and metric
+ingestion never fails an edit.
+
+Reads answer If-None-Match / If-Modified-Since with 304 from a validator
+query alone: the two timestamps for one workspace, or their maxima plus a
+count over the user's accessible set for the list.
+"""
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+ETAG_FORMAT = '%Y%m%dT%H%M%S.%fZ'
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The workspace was modified since it was fetched.'
+    default_code = 'precondition_failed'
+
+
+def _format(moment):
+    return moment.astimezone(dt_timezone.utc).strftime(ETAG_FORMAT)
+
+
+def workspace_etag(updated_at, metrics_updated_at=None):
+    if metrics_updated_at is None:
+        return '"%s"' % _format(updated_at)
+    return '"%s+%s"' % (_format(updated_at), _format(metrics_updated_at))
+
+
+def workspace_list_etag(user_id, updated_at, metrics_updated_at, count):
+    """ETag for one user's workspace list, from its validator aggregate."""
+    parts = [str(user_id), str(count)] + [_format(moment) if moment else '' for moment in (updated_at, metrics_updated_at)]
+    return '"%s"' % hashlib.sha256(':'.join(parts).encode()).hexdigest()[:32]
+
+
+def last_modified(*timestamps):
+    """The latest of ``timestamps`` (None entries ignored)."""
+    return max((moment for moment in timestamps if moment is not None), default=None)
+
+
+def if_match_timestamps(request):
+    """
+    ``updated_at`` values accepted by the request's If-Match header, or None
+    when there is no precondition (header absent or ``*``).
+    """
+    header = request.headers.get('If-Match')
+    if not header:
+        return None
+    etags = parse_etags(header)
+    if etags == ['*']:
+        return None
+    timestamps = []
+    for etag in etags:
+        # Weak tags would never match (RFC 9110 13.1.1), but ours only turn
+        # weak when a compressed response carries them (app.compression);
+        # the timestamp still pins the exact version.
+        try:
+            updated = etag.removeprefix('W/').strip('"').partition('+')[0]
+            timestamps.append(datetime.strptime(updated, ETAG_FORMAT).replace(tzinfo=dt_timezone.utc))
+        except ValueError:
+            continue
+    return timestamps
+
+
+def etag_matches(request, etag):
+    """
+    True when the request's If-None-Match lists ``etag`` (or ``*``), i.e.
+    the client's copy is current. Weak comparison, as RFC 9110 13.1.2 asks.
+    """
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    opaque = etag.removeprefix('W/')
+    return any(tag == '*' or tag.removeprefix('W/') == opaque for tag in parse_etags(header))
+
+
+def is_conditional(request):
+    return 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers
+
+
+def not_modified(request, etag, modified=None):
+    """
+    Whether a GET can be answered with 304. If-None-Match takes precedence;
+    If-Modified-Since is only consulted without it (RFC 9110 13.2.2).
+    """
+    if 'If-None-Match' in request.headers:
+        return etag_matches(request, etag)
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return since is not None and modified is not None and int(modified.timestamp()) <= since
+
+
+def validator_headers(etag, modified=None):
+    headers = {
+        'ETag': etag,
+        # Per user, and always revalidated; 304s keep that cheap
+        'Cache-Control': 'private, no-cache',
+    }
+    if modified is not None:
+        headers['Last-Modified'] = http_date(modified.timestamp())
+    return headers
@@ -0,0 +1,39 @@
+"""
+Database connection health and pool statistics.
+
+``ping`` runs a trivial query through the normal connection path (so it
+exercises the pool checkout and its pre-ping). ``pool_stats`` reports the
+psycopg pool of this process when ``DB_POOL_MODE=pool``. Both feed
+``DatabaseHealthView``.
+"""
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def ping(alias=DEFAULT_DB_ALIAS):
+    """Round-trip ``SELECT 1``; returns the latency in milliseconds."""
+    started = time.perf_counter()
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return (time.perf_counter() - started) * 1000
+
+
+def pool_stats(alias=DEFAULT_DB_ALIAS):
+    """Counters of this process's connection pool, or None when not pooling."""
+    pool = getattr(connections[alias], 'pool', None)
+    if pool is None:
+        return None
+    # pop_stats() would reset the cumulative counters for other readers
+    return pool.get_stats()
+
+
+def connection_info(alias=DEFAULT_DB_ALIAS):
+    connection = connections[alias]
+    return {
+        'vendor': connection.vendor,
+        'pool_mode': getattr(settings, 'DATABASE_POOL_MODE', None),
+        'pool': pool_stats(alias),
+    }
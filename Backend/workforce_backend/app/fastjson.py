@@ -0,0 +1,81 @@
+"""
+orjson-backed JSON renderer and parser for DRF.
+
+``FastJSONRenderer`` renders like DRF's ``JSONRenderer``: compact UTF-8,
+with dates, decimals and the like still going through DRF's encoder. The
+output is the same JSON but not always the same bytes:
+
+* NaN and infinities become ``null`` instead of raising.
+* Floats in exponent notation have no ``+`` or zero padding in the
+  exponent: orjson writes ``1e16`` and ``1e-7`` where the stdlib writes
+  ``1e+16`` and ``1e-07``. Both parse to the same value.
+
+``FastJSONParser`` accepts the same documents as ``JSONParser`` and
+parses them to the same values.
+
+Both fall back to the stdlib classes they extend when orjson isn't
+installed, and for the cases orjson doesn't cover: an ``indent`` media
+type parameter (the browsable API) or a non-UTF-8 charset. The renderer
+also falls back for integers wider than 64 bits, which orjson refuses.
+The parser can't rely on an error for those, because orjson silently
+turns them into floats. It sends any document with a run of 19 or more
+digits to the stdlib parser instead, since such a run may be an integer
+outside orjson's range.
+"""
+import io
+import re
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # Datetimes are passed to DRF's encoder so they keep rendering as
+    # '...Z' rather than orjson's '...+00:00'
+    DUMPS_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+_encoder = JSONEncoder()
+
+# orjson parses integers in [-2**63, 2**64) exactly and anything wider
+# as a float; every integer in range has at most 20 digits, the
+# out-of-range ones at least 19
+LONG_DIGIT_RUN = re.compile(rb'\d{19}')
+
+# DRF escapes these so the output is also valid JavaScript
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            rendered = orjson.dumps(data, default=_encoder.default, option=DUMPS_OPTIONS)
+        except orjson.JSONEncodeError:
+            # Out-of-range integers and the like; the stdlib path handles or reports them
+            return super().render(data, accepted_media_type, renderer_context)
+        for raw, escaped in LINE_SEPARATORS:
+            if raw in rendered:
+                rendered = rendered.replace(raw, escaped)
+        return rendered
+
+
+class FastJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        if LONG_DIGIT_RUN.search(body):
+            return super().parse(io.BytesIO(body), media_type, parser_context)
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
@@ -0,0 +1,268 @@
+"""
+Per-endpoint request metrics in Prometheus text format.
+
+``RequestMetricsMiddleware`` times every request and counts the SQL it
+runs (through an execute wrapper, so it works without DEBUG). The wrapper
+is installed on every connection as it is opened and finds the request's
+recorder in a context variable. Under ASGI, sync views run on another
+thread with a copy of the context, so their queries are counted too.
+It records latency, query count, query time and response size, labelled
+by the resolved URL name (``workspace-list``, ``token_obtain_pair``, ...;
+``unresolved`` for 404s) and method (``OTHER`` for non-standard ones, so
+clients can't create label values at will). ``render()`` serialises them together with
+gauges from the other subsystems (auth rate limiter, auth worker pool,
+DB connection pool) for ``/api/metrics/``.
+
+Metrics are per process. Scrape each worker, or aggregate in Prometheus.
+
+With ``REQUEST_METRICS['SLOW_REQUEST_THRESHOLD']`` set, requests slower
+than that many seconds are sampled (``SLOW_SAMPLE_RATE``), and their
+slowest ``SLOW_TOP_QUERIES`` statements are logged at WARNING.
+"""
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'SLOW_REQUEST_THRESHOLD': None,
+    'SLOW_SAMPLE_RATE': 1.0,
+    'SLOW_TOP_QUERIES': 5,
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'TRACE', 'CONNECT'))
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'REQUEST_METRICS', {})}
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = []
+    for name, value in zip(labelnames, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def value(self, labels=()):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[index] += 1
+            entry[-2] += 1
+            entry[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        labelnames = self.labelnames + ('le',)
+        with self._lock:
+            for labels, entry in sorted(self._values.items()):
+                for bound, count in zip(self.buckets, entry):
+                    lines.append(f'{self.name}_bucket{_format_labels(labelnames, labels + (bound,))} {count}')
+                lines.append(f'{self.name}_bucket{_format_labels(labelnames, labels + ("+Inf",))} {entry[-2]}')
+                lines.append(f'{self.name}_count{_format_labels(self.labelnames, labels)} {entry[-2]}')
+                lines.append(f'{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(entry[-1])}')
+        return lines
+
+
+REQUESTS = Counter('http_requests_total', 'Requests by URL name, method and status.', ('view', 'method', 'status'))
+LATENCY = Histogram('http_request_duration_seconds', 'Request latency by URL name.', LATENCY_BUCKETS, ('view', 'method'))
+QUERY_COUNT = Histogram('http_request_db_queries', 'SQL statements per request by URL name.', QUERY_COUNT_BUCKETS, ('view',))
+QUERY_TIME = Counter('http_request_db_seconds_total', 'Time spent in SQL by URL name.', ('view',))
+RESPONSE_SIZE = Histogram('http_response_size_bytes', 'Response body size by URL name.', SIZE_BUCKETS, ('view',))
+SLOW_SAMPLES = Counter('http_slow_requests_sampled_total', 'Slow requests whose queries were logged.', ('view',))
+
+METRICS = [REQUESTS, LATENCY, QUERY_COUNT, QUERY_TIME, RESPONSE_SIZE, SLOW_SAMPLES]
+
+
+def _gauge_lines(name, documentation, samples, kind='gauge'):
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} {kind}']
+    lines.extend(f'{name}{labels} {_format_value(value)}' for labels, value in samples)
+    return lines
+
+
+def collect_subsystems():
+    """Lines for counters owned by other modules, read at scrape time."""
+    from . import db, throttling
+    from .auth_pool import current_auth_pool
+
+    lines = _gauge_lines(
+        'auth_rate_limit_rejections_total', 'Requests rejected by the auth rate limiter.',
+        [(_format_labels(('scope', 'key'), key), count) for key, count in sorted(throttling.rejection_counts().items())],
+        kind='counter',
+    )
+    pool = current_auth_pool()
+    if pool is not None:
+        stats = pool.stats()
+        for stat in ('running', 'queue_depth', 'peak_pending', 'completed', 'rejected'):
+            lines += _gauge_lines(f'auth_pool_{stat}', f'Auth worker pool {stat.replace("_", " ")}.', [('', stats[stat])])
+    db_pool = db.pool_stats()
+    if db_pool:
+        for stat, value in sorted(db_pool.items()):
+            lines += _gauge_lines(f'db_{stat}', f'psycopg pool statistic {stat}.', [('', value)])
+    return lines
+
+
+def render():
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    lines += collect_subsystems()
+    return '\n'.join(lines) + '\n'
+
+
+class QueryRecorder:
+    """execute_wrapper collecting the count, duration and SQL of each statement."""
+
+    def __init__(self, keep_sql):
+        self.keep_sql = keep_sql
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if self.keep_sql:
+                self.queries.append((elapsed, sql))
+
+
+_recorder = ContextVar('request_metrics_recorder', default=None)
+
+
+def record_queries(execute, sql, params, many, context):
+    """execute_wrapper handing statements to the current request's recorder."""
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    # Outermost, so execute_wrapper() blocks popping the last wrapper
+    # never remove it
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_queries)
+
+
+connection_created.connect(install_query_recorder)
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder, started = self.start()
+        token = _recorder.set(recorder)
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self.finish(request, response, recorder, started)
+        return response
+
+    async def __acall__(self, request):
+        recorder, started = self.start()
+        token = _recorder.set(recorder)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self.finish(request, response, recorder, started)
+        return response
+
+    def start(self):
+        keep_sql = get_config()['SLOW_REQUEST_THRESHOLD'] is not None
+        return QueryRecorder(keep_sql), time.perf_counter()
+
+    def finish(self, request, response, recorder, started):
+        duration = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name if match else None) or 'unresolved'
+        method = request.method if request.method in METHODS else 'OTHER'
+
+        REQUESTS.inc((view, method, str(response.status_code)))
+        LATENCY.observe((view, method), duration)
+        QUERY_COUNT.observe((view,), recorder.count)
+        QUERY_TIME.inc((view,), recorder.duration)
+        if not response.streaming:
+            RESPONSE_SIZE.observe((view,), len(response.content))
+
+        config = get_config()
+        threshold = config['SLOW_REQUEST_THRESHOLD']
+        if threshold is not None and duration >= threshold and random.random() < config['SLOW_SAMPLE_RATE']:
+            SLOW_SAMPLES.inc((view,))
+            top = sorted(recorder.queries, key=lambda query: query[0], reverse=True)[:config['SLOW_TOP_QUERIES']]
+            logger.warning(
+                'Slow request %s %s (%s) took %.3fs with %d queries (%.3fs SQL); slowest:\n%s',
+                request.method, request.path, view, duration, recorder.count, recorder.duration,
+                '\n'.join(f'  {elapsed * 1000:.1f}ms  {sql[:500]}' for elapsed, sql in top) or '  (none)',
+            )
@@ -0,0 +1,163 @@
+"""
+Partial updates of JSON columns.
+
+JSON merge patches (RFC 7396) are applied inside the database with
+``json_patch`` on SQLite and the ``jsonb_merge_patch`` function (migration
+0010) on Postgres, so concurrent patches to different keys don't
+overwrite each other. JSON Patch documents (RFC 6902) are applied in
+Python while holding the row lock.
+"""
+import copy
+import json
+
+from django.db import NotSupportedError, connection
+from django.db.models import Func, JSONField, Value
+
+from .fastjson import FastJSONParser
+
+
+class MergePatchParser(FastJSONParser):
+    media_type = 'application/merge-patch+json'
+
+
+class JSONPatchParser(FastJSONParser):
+    media_type = 'application/json-patch+json'
+
+
+class JSONPatchError(ValueError):
+    pass
+
+
+def apply_merge_patch(target, patch):
+    """RFC 7396 merge of ``patch`` into ``target`` (returns a new value)."""
+    if not isinstance(patch, dict):
+        return patch
+    result = dict(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = apply_merge_patch(result.get(key), value)
+    return result
+
+
+def _parse_pointer(pointer):
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise JSONPatchError(f'Invalid JSON pointer {pointer!r}')
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def _resolve(document, tokens):
+    for token in tokens:
+        if isinstance(document, dict) and token in document:
+            document = document[token]
+        elif isinstance(document, list) and token.isdigit() and int(token) < len(document):
+            document = document[int(token)]
+        else:
+            raise JSONPatchError(f"Path '/{'/'.join(tokens)}' does not exist")
+    return document
+
+
+def _list_index(container, token, allow_end):
+    if token == '-' and allow_end:
+        return len(container)
+    if not token.isdigit() or int(token) > len(container) - (0 if allow_end else 1):
+        raise JSONPatchError(f'Invalid array index {token!r}')
+    return int(token)
+
+
+def _add(document, tokens, value):
+    if not tokens:
+        return value
+    parent = _resolve(document, tokens[:-1])
+    if isinstance(parent, dict):
+        parent[tokens[-1]] = value
+    elif isinstance(parent, list):
+        parent.insert(_list_index(parent, tokens[-1], allow_end=True), value)
+    else:
+        raise JSONPatchError('Cannot add to a scalar value')
+    return document
+
+
+def _remove(document, tokens):
+    if not tokens:
+        raise JSONPatchError('Cannot remove the whole document')
+    parent = _resolve(document, tokens[:-1])
+    if isinstance(parent, dict):
+        if tokens[-1] not in parent:
+            raise JSONPatchError(f"Path '/{'/'.join(tokens)}' does not exist")
+        return parent.pop(tokens[-1])
+    if isinstance(parent, list):
+        return parent.pop(_list_index(parent, tokens[-1], allow_end=False))
+    raise JSONPatchError('Cannot remove from a scalar value')
+
+
+def apply_json_patch(document, operations):
+    """Apply an RFC 6902 operation list to a copy of ``document``."""
+    document = copy.deepcopy(document)
+    for operation in operations:
+        if not isinstance(operation, dict) or 'op' not in operation or 'path' not in operation:
+            raise JSONPatchError("Each operation needs 'op' and 'path'")
+        op, tokens = operation['op'], _parse_pointer(operation['path'])
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise JSONPatchError(f"'{op}' needs a 'value'")
+        if op == 'add':
+            document = _add(document, tokens, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(document, tokens)
+        elif op == 'replace':
+            _resolve(document, tokens)
+            if tokens:
+                _remove(document, tokens)
+            document = _add(document, tokens, copy.deepcopy(operation['value']))
+        elif op in ('move', 'copy'):
+            source = _parse_pointer(operation.get('from', ''))
+            if op == 'move':
+                if tokens[:len(source)] == source and tokens != source:
+                    raise JSONPatchError('Cannot move a value into one of its children')
+                value = _remove(document, source)
+            else:
+                value = copy.deepcopy(_resolve(document, source))
+            document = _add(document, tokens, value)
+        elif op == 'test':
+            if _resolve(document, tokens) != operation['value']:
+                raise JSONPatchError(f"Test failed at '{operation['path']}'")
+        else:
+            raise JSONPatchError(f'Unknown operation {op!r}')
+    return document
+
+
+def supports_sql_merge_patch():
+    return connection.vendor in ('postgresql', 'sqlite')
+
+
+class JSONMergePatch(Func):
+    """
+    Database-side RFC 7396 merge, for use in ``QuerySet.update``::
+
+        Workspace.objects.filter(pk=pk).update(metrics=JSONMergePatch('metrics', {'cpu': 1}))
+
+    Only available where ``supports_sql_merge_patch()`` is true.
+    """
+    output_field = JSONField()
+
+    def __init__(self, expression, patch, **extra):
+        super().__init__(expression, Value(json.dumps(patch)), **extra)
+
+    def _compile(self, compiler):
+        (target_sql, target_params), (patch_sql, patch_params) = (compiler.compile(expression) for expression in self.source_expressions)
+        return target_sql, patch_sql, (*target_params, *patch_params)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        target, patch, params = self._compile(compiler)
+        # json_patch treats a non-object target as {}, but NULL would stay NULL
+        return f"json_patch(COALESCE({target}, '{{}}'), {patch})", params
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        target, patch, params = self._compile(compiler)
+        return f'jsonb_merge_patch({target}, ({patch})::jsonb)', params
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f'JSON merge patch is not supported on {connection.vendor}')
@@ -0,0 +1,93 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from app.benchmarks import SCENARIOS, compare, load_baseline, run_metadata, save_baseline
+
+
+class Command(BaseCommand):
+    help = 'Run backend benchmarks against a throwaway test database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run (default: all). Available: {', '.join(SCENARIOS)}")
+        parser.add_argument('--iterations', type=int, default=20, help='Iterations per measurement.')
+        parser.add_argument('--scale', type=int, help="Synthetic data size (default: each scenario's own).")
+        parser.add_argument('--concurrency', type=int, default=1, help='Threads sharing the iterations of each measurement.')
+        parser.add_argument('--output', help='Save the results as a JSON baseline at this path.')
+        parser.add_argument('--baseline', help='Compare the results with a JSON baseline saved by --output.')
+        parser.add_argument('--threshold', type=float, default=10.0, help='Percent change counted as a regression (default: 10).')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit with an error if anything regressed past --threshold.')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1.')
+        baseline = load_baseline(options['baseline']) if options['baseline'] else None
+
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        old_test_name = test_settings.get('NAME')
+        tempdir = None
+        if connection.vendor == 'sqlite' and not old_test_name:
+            # On disk rather than in memory, so worker threads share one database
+            tempdir = tempfile.TemporaryDirectory()
+            test_settings['NAME'] = os.path.join(tempdir.name, 'benchmark.sqlite3')
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        results = {}
+        try:
+            # Measure the endpoints, not the auth rate limiter turning them away
+            with override_settings(AUTH_RATE_LIMITS={**settings.AUTH_RATE_LIMITS, 'RATES': {}}):
+                for name in names:
+                    for label, result in SCENARIOS[name](options['iterations'], options['scale'], options['concurrency']).items():
+                        results[f'{name}.{label}'] = result
+                        self.report(f'{name}.{label}', result)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            if tempdir is not None:
+                test_settings['NAME'] = old_test_name
+                tempdir.cleanup()
+
+        if options['output']:
+            metadata = run_metadata({key: options[key] for key in ('iterations', 'scale', 'concurrency')})
+            save_baseline(options['output'], results, metadata)
+            self.stdout.write(f"Saved baseline to {options['output']}")
+        if baseline is not None:
+            self.diff(baseline, results, options)
+
+    def report(self, key, result):
+        line = (
+            f"{key}: {result['ops_per_sec']} ops/sec, p50 {result['p50_ms']}ms p95 {result['p95_ms']}ms "
+            f"p99 {result['p99_ms']}ms ({result['iterations']} iterations, {result['concurrency']} threads, {result['seconds']}s)"
+        )
+        if 'bytes' in result:
+            line += f", {result['bytes']} bytes"
+        if result['errors']:
+            self.stdout.write(self.style.ERROR(f"{line}, {result['errors']} errors, first: {result['first_error']}"))
+        else:
+            self.stdout.write(line)
+
+    def diff(self, baseline, results, options):
+        meta = baseline.get('meta', {})
+        self.stdout.write(f"\nCompared with {options['baseline']} (commit {meta.get('commit') or 'unknown'}, {meta.get('database', '?')}):")
+        if meta.get('concurrency') != options['concurrency'] or meta.get('scale') != options['scale']:
+            self.stdout.write(self.style.WARNING('  Baseline was run with a different --concurrency or --scale.'))
+        regressions = 0
+        for key, stat, before, after, change, regressed in compare(baseline['results'], results, options['threshold']):
+            line = f'  {key} {stat}: {before} -> {after} ({change:+.1f}%)'
+            if regressed:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(f'{line} REGRESSED'))
+            else:
+                self.stdout.write(line)
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{regressions} measurement(s) regressed by more than {options['threshold']}%.")
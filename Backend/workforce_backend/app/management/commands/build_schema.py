@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from app.schema import FILENAME, SchemaArtifact, generate_schema, get_config
+
+
+class Command(BaseCommand):
+    help = 'Generate the OpenAPI schema and its compressed variants into OPENAPI_SCHEMA_DIR.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help="Output directory (default: OPENAPI_SCHEMA['DIR']).")
+
+    def handle(self, *args, **options):
+        directory = options['dir'] or get_config()['DIR']
+        if not directory:
+            raise CommandError("No output directory: pass --dir or set OPENAPI_SCHEMA['DIR'].")
+        artifact = SchemaArtifact(generate_schema())
+        artifact.write(directory)
+        sizes = ', '.join(f'{encoding} {len(data)}' for encoding, data in artifact.variants.items())
+        self.stdout.write(f'Wrote {FILENAME} ({len(artifact.body)} bytes; {sizes}) to {directory}, ETag {artifact.etag}')
@@ -0,0 +1,34 @@
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import Workspace
+from app.transfer import export_ndjson
+
+
+class Command(BaseCommand):
+    help = 'Write workspaces with their invites, memberships, agents and metrics as NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--owner', action='append', default=[], help='Only workspaces owned by this username (repeatable).')
+        parser.add_argument('--workspace', action='append', default=[], help='Only this workspace id (repeatable).')
+        parser.add_argument('--output', help='File to write (default: stdout).')
+
+    def handle(self, *args, **options):
+        workspaces = Workspace.objects.all()
+        if options['owner']:
+            workspaces = workspaces.filter(owner__username__in=options['owner'])
+        if options['workspace']:
+            try:
+                workspace_ids = [uuid.UUID(value) for value in options['workspace']]
+            except ValueError as exc:
+                raise CommandError(f'Invalid workspace id: {exc}')
+            workspaces = workspaces.filter(pk__in=workspace_ids)
+        if options['output']:
+            with open(options['output'], 'wb') as output:
+                for chunk in export_ndjson(workspaces):
+                    output.write(chunk)
+            self.stderr.write(f"Exported to {options['output']}")
+        else:
+            for chunk in export_ndjson(workspaces):
+                self.stdout.write(chunk.decode(), ending='')
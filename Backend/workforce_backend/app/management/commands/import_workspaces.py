@@ -0,0 +1,39 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.models import ImportCheckpoint
+from app.transfer import IMPORT_BATCH_SIZE, TransferError, import_ndjson
+
+
+class Command(BaseCommand):
+    help = 'Import an NDJSON workspace export in batches, resuming from a checkpoint.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Export file, or '-' for stdin.")
+        parser.add_argument('--checkpoint', help='Name to record progress under; a rerun with the same name resumes.')
+        parser.add_argument('--restart', action='store_true', help='Discard the checkpoint and start from the first line.')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        if options['restart']:
+            if not checkpoint:
+                raise CommandError('--restart needs --checkpoint.')
+            ImportCheckpoint.objects.filter(name=checkpoint).delete()
+        try:
+            if options['path'] == '-':
+                result = import_ndjson(sys.stdin.buffer, checkpoint=checkpoint, batch_size=options['batch_size'])
+            else:
+                with open(options['path'], 'rb') as lines:
+                    result = import_ndjson(lines, checkpoint=checkpoint, batch_size=options['batch_size'])
+        except (OSError, TransferError) as exc:
+            raise CommandError(str(exc))
+
+        if result['resumed_from']:
+            self.stdout.write(f"Resumed after line {result['resumed_from']}.")
+        for kind in sorted(set(result['imported']) | set(result['skipped'])):
+            self.stdout.write(f"{kind}: {result['imported'][kind]} imported, {result['skipped'][kind]} skipped")
+        if result['conflicts']:
+            self.stdout.write(f"Skipped {len(result['conflicts'])} workspaces whose invite code is taken: {', '.join(result['conflicts'])}")
+        self.stdout.write(f"Done at line {result['line']}.")
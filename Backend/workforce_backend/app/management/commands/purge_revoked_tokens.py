@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from app.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = 'Delete revoked refresh tokens that have expired, in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = RevokedToken.objects.purge_expired(batch_size=options['batch_size'])
+        self.stdout.write(f'Deleted {deleted} expired revoked token(s).')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from app import outbox
+
+
+class Command(BaseCommand):
+    help = 'Send due outbox messages (for cron-driven deployments without a worker).'
+
+    def handle(self, *args, **options):
+        sent = outbox.drain()
+        self.stdout.write(f'Sent {sent} message(s).')
@@ -0,0 +1,143 @@
+"""
+Workspace metrics ingestion.
+
+Samples are appended to ``WorkspaceMetricPoint`` in batches. Minute, hour
+and day rollups are maintained incrementally with one upsert per bucket
+that adds to the stored count/total and widens min/max in SQL, so
+concurrent writers never lose updates. ``Workspace.metrics`` only keeps
+the latest value per metric name, merged in place in the database (see
+``app.json_updates``). Each value's recorded_at is kept alongside it in
+``metrics_recorded_at``; values from out-of-order or backfilled batches
+that are older than the stored ones are not merged. Merging bumps ``metrics_updated_at`` rather than
+``updated_at``, so frequent ingestion doesn't reorder the workspace list
+or fail If-Match edits.
+"""
+from datetime import timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .json_updates import JSONMergePatch, apply_merge_patch, supports_sql_merge_patch
+from .models import Workspace, WorkspaceMetricPoint, WorkspaceMetricRollup
+
+RESOLUTIONS = ('minute', 'hour', 'day')
+UPSERT_BATCH_SIZE = 500
+
+
+def bucket_start(moment, resolution):
+    moment = moment.astimezone(dt_timezone.utc)
+    if resolution == 'minute':
+        return moment.replace(second=0, microsecond=0)
+    if resolution == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if resolution == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f'Unknown resolution {resolution!r}')
+
+
+def ingest(workspace_id, points):
+    """
+    Record ``points`` (dicts with name, value and optional recorded_at) for
+    a workspace. Returns the number of points stored.
+    """
+    now = timezone.now()
+    rows = [
+        WorkspaceMetricPoint(workspace_id=workspace_id, name=point['name'], value=point['value'], recorded_at=point.get('recorded_at') or now)
+        for point in points
+    ]
+
+    rollups = {}
+    latest = {}
+    for row in rows:
+        for resolution in RESOLUTIONS:
+            key = (row.name, resolution, bucket_start(row.recorded_at, resolution))
+            bucket = rollups.get(key)
+            if bucket is None:
+                rollups[key] = [1, row.value, row.value, row.value]
+            else:
+                bucket[0] += 1
+                bucket[1] += row.value
+                bucket[2] = min(bucket[2], row.value)
+                bucket[3] = max(bucket[3], row.value)
+        if row.name not in latest or row.recorded_at >= latest[row.name][0]:
+            latest[row.name] = (row.recorded_at, row.value)
+
+    with transaction.atomic():
+        WorkspaceMetricPoint.objects.bulk_create(rows, batch_size=UPSERT_BATCH_SIZE)
+        upsert_rollups(workspace_id, rollups)
+        update_snapshot(workspace_id, latest)
+    return len(rows)
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def upsert_rollups(workspace_id, rollups):
+    """``rollups`` maps (name, resolution, bucket_start) -> [count, total, min, max]."""
+    if not rollups:
+        return
+    meta = WorkspaceMetricRollup._meta
+    table = _quote(meta.db_table)
+    columns = ['workspace_id', 'name', 'resolution', 'bucket_start', 'count', 'total', 'minimum', 'maximum']
+    fields = [meta.get_field(column.removesuffix('_id')) for column in columns]
+    # Two-argument MIN/MAX are scalar on SQLite; Postgres spells them LEAST/GREATEST
+    least, greatest = ('LEAST', 'GREATEST') if connection.vendor == 'postgresql' else ('MIN', 'MAX')
+    conflict = ', '.join(_quote(column) for column in columns[:4])
+    count, total, minimum, maximum = (_quote(column) for column in columns[4:])
+    assignments = (
+        f'{count} = {table}.{count} + EXCLUDED.{count}, '
+        f'{total} = {table}.{total} + EXCLUDED.{total}, '
+        f'{minimum} = {least}({table}.{minimum}, EXCLUDED.{minimum}), '
+        f'{maximum} = {greatest}({table}.{maximum}, EXCLUDED.{maximum})'
+    )
+    row_placeholder = '(' + ', '.join(['%s'] * len(columns)) + ')'
+
+    # Sorted so concurrent batches lock buckets in the same order
+    items = sorted(rollups.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), UPSERT_BATCH_SIZE):
+            batch = items[start:start + UPSERT_BATCH_SIZE]
+            params = []
+            for (name, resolution, bucket), values in batch:
+                row = [workspace_id, name, resolution, bucket, *values]
+                params.extend(field.get_db_prep_value(value, connection) for field, value in zip(fields, row))
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(_quote(column) for column in columns)}) "
+                f"VALUES {', '.join([row_placeholder] * len(batch))} "
+                f"ON CONFLICT ({conflict}) DO UPDATE SET {assignments}",
+                params,
+            )
+
+
+def update_snapshot(workspace_id, latest):
+    """
+    Merge ``latest`` (name -> (recorded_at, value)) into Workspace.metrics
+    in place, except names whose stored value was recorded later.
+    """
+    if not latest:
+        return
+    with transaction.atomic(savepoint=False):
+        # The row lock orders concurrent batches; only the small timestamp map is read
+        stored = Workspace.objects.select_for_update().filter(pk=workspace_id).values_list('metrics_recorded_at', flat=True).first() or {}
+        newer = {
+            name: (recorded_at, value) for name, (recorded_at, value) in latest.items()
+            if name not in stored or parse_datetime(stored[name]) <= recorded_at
+        }
+        if not newer:
+            return
+        values = {name: value for name, (_, value) in newer.items()}
+        recorded = {name: recorded_at.astimezone(dt_timezone.utc).isoformat() for name, (recorded_at, _) in newer.items()}
+        now = timezone.now()
+        if supports_sql_merge_patch():
+            Workspace.objects.filter(pk=workspace_id).update(
+                metrics=JSONMergePatch('metrics', values),
+                metrics_recorded_at=JSONMergePatch('metrics_recorded_at', recorded),
+                metrics_updated_at=now,
+            )
+            return
+        current = Workspace.objects.filter(pk=workspace_id).values_list('metrics', flat=True).first()
+        Workspace.objects.filter(pk=workspace_id).update(
+            metrics=apply_merge_patch(current, values), metrics_recorded_at={**stored, **recorded}, metrics_updated_at=now,
+        )
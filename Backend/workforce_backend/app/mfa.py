@@ -0,0 +1,91 @@
+"""
+MFA enrollment sessions.
+
+``MFASetupView`` starts (or resumes) an enrollment: the pending secret and
+backup codes live in the cache for ``MFA_ENROLLMENT_TTL`` seconds, so
+refreshes reuse them and nothing is written to the user row.
+``MFAVerifyView`` persists them in a single UPDATE once the user proves
+they scanned the code. QR codes are rendered lazily, once per enrollment
+and format, and cached alongside.
+
+Multi-process deployments need a shared cache (REDIS_URL) so the verify
+request can see the enrollment started by the setup request.
+"""
+import hashlib
+import io
+
+import pyotp
+import qrcode
+import qrcode.image.svg
+from django.conf import settings
+from django.core.cache import cache
+
+ISSUER_NAME = 'AI Synthetic Workforce'
+BACKUP_CODE_COUNT = 10
+
+QR_FORMATS = {
+    'svg': 'image/svg+xml',
+    'png': 'image/png',
+}
+
+
+def enrollment_ttl():
+    return getattr(settings, 'MFA_ENROLLMENT_TTL', 600)
+
+
+def _enrollment_key(user):
+    return f'mfa-enrollment:{user.pk}'
+
+
+def get_enrollment(user):
+    """The pending enrollment for ``user``, or None."""
+    return cache.get(_enrollment_key(user))
+
+
+def start_enrollment(user):
+    """Return the pending enrollment for ``user``, creating one if needed."""
+    enrollment = get_enrollment(user)
+    if enrollment is not None:
+        return enrollment
+    enrollment = {
+        'secret': pyotp.random_base32(),
+        # Generate Backup Codes (10 codes of 8 characters)
+        'backup_codes': [pyotp.random_base32()[:8] for _ in range(BACKUP_CODE_COUNT)],
+    }
+    # add() loses to a concurrent request that got there first; use theirs
+    if not cache.add(_enrollment_key(user), enrollment, enrollment_ttl()):
+        enrollment = get_enrollment(user) or enrollment
+    return enrollment
+
+
+def finish_enrollment(user):
+    cache.delete(_enrollment_key(user))
+
+
+def verify_totp(secret, code):
+    # Module-level so it can be shipped to a process pool
+    return pyotp.TOTP(secret).verify(code)
+
+
+def provisioning_uri(user, secret):
+    return pyotp.TOTP(secret).provisioning_uri(name=user.email, issuer_name=ISSUER_NAME)
+
+
+def render_qr(user, secret, image_format='svg'):
+    """QR code image bytes for the enrollment, rendered at most once per TTL."""
+    # Keyed on a digest: cache keys show up in KEYS/MONITOR output and slowlogs
+    digest = hashlib.sha256(secret.encode()).hexdigest()
+    key = f'mfa-qr:{user.pk}:{digest}:{image_format}'
+    image = cache.get(key)
+    if image is None:
+        uri = provisioning_uri(user, secret)
+        if image_format == 'svg':
+            image = qrcode.make(uri, image_factory=qrcode.image.svg.SvgPathImage).to_string()
+        elif image_format == 'png':
+            buffered = io.BytesIO()
+            qrcode.make(uri).save(buffered, format='PNG')
+            image = buffered.getvalue()
+        else:
+            raise ValueError(f'Unknown QR format {image_format!r}')
+        cache.set(key, image, enrollment_ttl())
+    return image
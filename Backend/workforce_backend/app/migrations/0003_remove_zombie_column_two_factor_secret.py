@@ -2,6 +2,14 @@
 
 from django.db import migrations
 
+DROP_COLUMN = "ALTER TABLE app_user DROP COLUMN IF EXISTS two_factor_secret;"
+
+
+def drop_column(apps, schema_editor):
+    # Postgres-only SQL; SQLite (local and test databases) never had the column
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_COLUMN)
+
 
 class Migration(migrations.Migration):
 
@@ -10,8 +18,5 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
-        migrations.RunSQL(
-            "ALTER TABLE app_user DROP COLUMN IF EXISTS two_factor_secret;",
-            reverse_sql=""
-        ),
+        migrations.RunPython(drop_column, migrations.RunPython.noop),
     ]
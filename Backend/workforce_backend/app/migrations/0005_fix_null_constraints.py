@@ -2,6 +2,35 @@
 
 from django.db import migrations
 
+DROP_NOT_NULL = """
+ALTER TABLE app_workspace ALTER COLUMN industry DROP NOT NULL;
+ALTER TABLE app_workspace ALTER COLUMN company_size DROP NOT NULL;
+ALTER TABLE app_workspace ALTER COLUMN timezone DROP NOT NULL;
+ALTER TABLE app_workspace ALTER COLUMN currency DROP NOT NULL;
+ALTER TABLE app_workspace ALTER COLUMN active_agents DROP NOT NULL;
+ALTER TABLE app_workspace ALTER COLUMN metrics DROP NOT NULL;
+"""
+
+SET_NOT_NULL = """
+ALTER TABLE app_workspace ALTER COLUMN industry SET NOT NULL;
+ALTER TABLE app_workspace ALTER COLUMN company_size SET NOT NULL;
+ALTER TABLE app_workspace ALTER COLUMN timezone SET NOT NULL;
+ALTER TABLE app_workspace ALTER COLUMN currency SET NOT NULL;
+ALTER TABLE app_workspace ALTER COLUMN active_agents SET NOT NULL;
+ALTER TABLE app_workspace ALTER COLUMN metrics SET NOT NULL;
+"""
+
+
+def drop_not_null(apps, schema_editor):
+    # Postgres-only SQL; SQLite already creates these columns as nullable
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_NOT_NULL)
+
+
+def set_not_null(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SET_NOT_NULL)
+
 
 class Migration(migrations.Migration):
 
@@ -10,22 +39,5 @@ class Migration(migrations.Migration):
     ]
 
     operations = [
-        migrations.RunSQL(
-            """
-            ALTER TABLE app_workspace ALTER COLUMN industry DROP NOT NULL;
-            ALTER TABLE app_workspace ALTER COLUMN company_size DROP NOT NULL;
-            ALTER TABLE app_workspace ALTER COLUMN timezone DROP NOT NULL;
-            ALTER TABLE app_workspace ALTER COLUMN currency DROP NOT NULL;
-            ALTER TABLE app_workspace ALTER COLUMN active_agents DROP NOT NULL;
-            ALTER TABLE app_workspace ALTER COLUMN metrics DROP NOT NULL;
-            """,
-            reverse_sql="""
-            ALTER TABLE app_workspace ALTER COLUMN industry SET NOT NULL;
-            ALTER TABLE app_workspace ALTER COLUMN company_size SET NOT NULL;
-            ALTER TABLE app_workspace ALTER COLUMN timezone SET NOT NULL;
-            ALTER TABLE app_workspace ALTER COLUMN currency SET NOT NULL;
-            ALTER TABLE app_workspace ALTER COLUMN active_agents SET NOT NULL;
-            ALTER TABLE app_workspace ALTER COLUMN metrics SET NOT NULL;
-            """
-        ),
+        migrations.RunPython(drop_not_null, set_not_null),
     ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_workspace_access(apps, schema_editor):
+    Workspace = apps.get_model('app', 'Workspace')
+    WorkspaceAccess = apps.get_model('app', 'WorkspaceAccess')
+    Membership = Workspace.members.through
+
+    rows = {}
+    for workspace_id, owner_id in Workspace.objects.values_list('id', 'owner_id').iterator(chunk_size=2000):
+        rows[(owner_id, workspace_id)] = {'is_owner': True, 'is_member': False}
+    for workspace_id, user_id in Membership.objects.values_list('workspace_id', 'user_id').iterator(chunk_size=2000):
+        rows.setdefault((user_id, workspace_id), {'is_owner': False, 'is_member': False})['is_member'] = True
+
+    WorkspaceAccess.objects.bulk_create(
+        (WorkspaceAccess(user_id=user_id, workspace_id=workspace_id, **flags) for (user_id, workspace_id), flags in rows.items()),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_fix_null_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkspaceAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_owner', models.BooleanField(default=False)),
+                ('is_member', models.BooleanField(default=False)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='workspace_access', to=settings.AUTH_USER_MODEL)),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access', to='app.workspace')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'workspace'), name='unique_workspace_access')],
+            },
+        ),
+        migrations.RunPython(backfill_workspace_access, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-17 20:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_workspaceaccess'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workspace',
+            index=models.Index(fields=['-updated_at', '-id'], name='workspace_updated_id_idx'),
+        ),
+    ]
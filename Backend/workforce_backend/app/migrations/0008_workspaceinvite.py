@@ -0,0 +1,40 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def copy_workspace_invite_codes(apps, schema_editor):
+    # Existing codes become default invites: no expiry, unlimited uses
+    Workspace = apps.get_model('app', 'Workspace')
+    WorkspaceInvite = apps.get_model('app', 'WorkspaceInvite')
+    codes = Workspace.objects.exclude(invite_code__isnull=True).exclude(invite_code='').values_list('id', 'invite_code')
+    WorkspaceInvite.objects.bulk_create(
+        (WorkspaceInvite(workspace_id=workspace_id, code=code) for workspace_id, code in codes.iterator(chunk_size=2000)),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0007_workspace_updated_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkspaceInvite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=50, unique=True)),
+                ('expires_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('max_uses', models.PositiveIntegerField(blank=True, null=True)),
+                ('use_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='invites', to='app.workspace')),
+            ],
+        ),
+        migrations.RunPython(copy_workspace_invite_codes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_workspaceinvite'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorkspaceMetricPoint',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=100)),
+                ('value', models.FloatField()),
+                ('recorded_at', models.DateTimeField()),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metric_points', to='app.workspace')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['workspace', 'name', 'recorded_at'], name='metric_point_range_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='WorkspaceMetricRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('resolution', models.CharField(choices=[('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField()),
+                ('total', models.FloatField()),
+                ('minimum', models.FloatField()),
+                ('maximum', models.FloatField()),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='metric_rollups', to='app.workspace')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('workspace', 'name', 'resolution', 'bucket_start'), name='unique_metric_rollup_bucket')],
+            },
+        ),
+    ]
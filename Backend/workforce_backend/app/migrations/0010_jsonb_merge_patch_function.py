@@ -0,0 +1,47 @@
+from django.db import migrations
+
+# RFC 7396 merge patch for jsonb, used by app.json_updates.JSONMergePatch.
+# A non-object patch replaces the target; null members delete keys; nested
+# objects merge recursively. SQLite has this built in as json_patch().
+CREATE_FUNCTION = """
+CREATE OR REPLACE FUNCTION jsonb_merge_patch(target jsonb, patch jsonb) RETURNS jsonb AS $$
+SELECT CASE
+    WHEN patch IS NULL OR jsonb_typeof(patch) <> 'object' THEN patch
+    ELSE (
+        SELECT COALESCE(jsonb_object_agg(merged.key, merged.value), '{}'::jsonb)
+        FROM (
+            SELECT t.key, t.value
+            FROM jsonb_each(CASE WHEN jsonb_typeof(target) = 'object' THEN target ELSE '{}'::jsonb END) AS t
+            WHERE NOT patch ? t.key
+            UNION ALL
+            SELECT p.key, jsonb_merge_patch(CASE WHEN jsonb_typeof(target) = 'object' THEN target -> p.key END, p.value)
+            FROM jsonb_each(patch) AS p
+            WHERE jsonb_typeof(p.value) <> 'null'
+        ) AS merged
+    )
+END
+$$ LANGUAGE sql IMMUTABLE;
+"""
+
+DROP_FUNCTION = "DROP FUNCTION IF EXISTS jsonb_merge_patch(jsonb, jsonb);"
+
+
+def create_function(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_FUNCTION)
+
+
+def drop_function(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_FUNCTION)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_workspace_metrics'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_function, drop_function),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def agent_from_json(entry):
+    # Entries were either bare type names or objects with free-form keys
+    if not isinstance(entry, dict):
+        return {'agent_type': str(entry)[:100], 'name': '', 'status': 'active', 'config': {}}
+    agent_type = entry.get('agent_type') or entry.get('type') or entry.get('name') or 'unknown'
+    return {
+        'agent_type': str(agent_type)[:100],
+        'name': str(entry.get('name') or '')[:255],
+        'status': str(entry.get('status') or 'active')[:20],
+        'config': entry,
+    }
+
+
+def copy_active_agents(apps, schema_editor):
+    Workspace = apps.get_model('app', 'Workspace')
+    AgentAssignment = apps.get_model('app', 'AgentAssignment')
+    batch = []
+    workspaces = Workspace.objects.exclude(active_agents__isnull=True).values_list('id', 'active_agents')
+    for workspace_id, agents in workspaces.iterator(chunk_size=500):
+        if not isinstance(agents, list):
+            continue
+        batch.extend(AgentAssignment(workspace_id=workspace_id, **agent_from_json(entry)) for entry in agents)
+        if len(batch) >= 2000:
+            AgentAssignment.objects.bulk_create(batch)
+            batch = []
+    AgentAssignment.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_jsonb_merge_patch_function'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agent_type', models.CharField(max_length=100)),
+                ('name', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(default='active', max_length=20)),
+                ('config', models.JSONField(blank=True, default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('workspace', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agents', to='app.workspace')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['workspace', 'status'], name='agent_workspace_status_idx'), models.Index(fields=['agent_type'], name='agent_type_idx')],
+            },
+        ),
+        migrations.RunPython(copy_active_agents, migrations.RunPython.noop),
+    ]
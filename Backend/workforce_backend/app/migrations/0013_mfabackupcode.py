@@ -0,0 +1,58 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils.crypto import salted_hmac
+
+
+# Frozen copy of app.models.hash_backup_code as of this migration, so
+# changing the live hash later can't change what this migration writes.
+# Migrated codes verify against MFABackupCode.objects.consume while the two
+# agree; a hash change needs its own migration for the stored codes.
+def hash_backup_code(user_id, code):
+    value = f"{user_id}:{''.join(str(code).split()).upper()}"
+    return salted_hmac('app.MFABackupCode', value, algorithm='sha256').hexdigest()
+
+
+def copy_backup_codes(apps, schema_editor):
+    User = apps.get_model('app', 'User')
+    MFABackupCode = apps.get_model('app', 'MFABackupCode')
+    batch = []
+    users = User.objects.exclude(backup_codes=[]).exclude(backup_codes__isnull=True).values_list('id', 'backup_codes')
+    for user_id, codes in users.iterator(chunk_size=500):
+        if not isinstance(codes, list):
+            continue
+        hashes = {hash_backup_code(user_id, str(code)) for code in codes}
+        batch.extend(MFABackupCode(user_id=user_id, code_hash=code_hash) for code_hash in hashes)
+        if len(batch) >= 2000:
+            MFABackupCode.objects.bulk_create(batch)
+            batch = []
+    MFABackupCode.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MFABackupCode',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code_hash', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backup_codes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'code_hash'), name='unique_user_backup_code')],
+            },
+        ),
+        migrations.RunPython(copy_backup_codes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='user',
+            name='backup_codes',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0014_revokedtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workspace',
+            name='metrics_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
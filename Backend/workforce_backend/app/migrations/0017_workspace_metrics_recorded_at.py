@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0016_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workspace',
+            name='metrics_recorded_at',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 21:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0017_workspace_metrics_recorded_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='existing_workspaces',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+# app.roster.ENTRY_FIELDS as of this migration
+ENTRY_FIELDS = ('id', 'agent_type', 'name', 'status', 'config')
+
+
+def derive_active_agents(apps, schema_editor):
+    # active_agents becomes a read-only view of the roster; replace whatever
+    # was written to it directly since 0011 copied it into AgentAssignment
+    Workspace = apps.get_model('app', 'Workspace')
+    AgentAssignment = apps.get_model('app', 'AgentAssignment')
+    workspace_ids = list(Workspace.objects.values_list('pk', flat=True))
+    for start in range(0, len(workspace_ids), 500):
+        chunk = workspace_ids[start:start + 500]
+        roster = defaultdict(list)
+        for agent in AgentAssignment.objects.filter(workspace_id__in=chunk).order_by('pk').values('workspace_id', *ENTRY_FIELDS):
+            roster[agent.pop('workspace_id')].append(agent)
+        Workspace.objects.bulk_update(
+            [Workspace(pk=workspace_id, active_agents=roster[workspace_id]) for workspace_id in chunk],
+            ['active_agents'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0018_importcheckpoint_existing_workspaces'),
+    ]
+
+    operations = [
+        migrations.RunPython(derive_active_agents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.1 on 2026-10-17 22:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0019_derive_active_agents'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='importcheckpoint',
+            name='existing_workspaces',
+        ),
+        migrations.AddField(
+            model_name='importcheckpoint',
+            name='last_id',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -1,7 +1,51 @@
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Q
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
+from django.utils.crypto import salted_hmac
+import secrets
 import uuid
 
+# Invite codes: unambiguous characters only (no 0/O, 1/I/L); 31**10 possible codes
+INVITE_CODE_ALPHABET = 'ABCDEFGHJKMNPQRSTUVWXYZ23456789'
+INVITE_CODE_LENGTH = 10
+INVITE_CODE_MAX_ATTEMPTS = 5
+
+class InviteCodeAllocationError(Exception):
+    pass
+
+def generate_invite_code():
+    return ''.join(secrets.choice(INVITE_CODE_ALPHABET) for _ in range(INVITE_CODE_LENGTH))
+
+def allocate_invite_code(create):
+    """
+    Call ``create(code)`` inside a savepoint with fresh random codes until one
+    does not collide with an existing code, giving up after
+    INVITE_CODE_MAX_ATTEMPTS tries.
+    """
+    for _ in range(INVITE_CODE_MAX_ATTEMPTS):
+        code = generate_invite_code()
+        try:
+            with transaction.atomic():
+                return create(code)
+        except IntegrityError:
+            # Only retry collisions; anything else is a real error
+            if not (WorkspaceInvite.objects.filter(code=code).exists() or Workspace.objects.filter(invite_code=code).exists()):
+                raise
+    raise InviteCodeAllocationError(f'Could not allocate a unique invite code in {INVITE_CODE_MAX_ATTEMPTS} attempts')
+
+# Backup codes are random, so a keyed fast hash is enough: without SECRET_KEY
+# a leaked table can't be brute-forced, and lookups stay an index seek.
+# Rotating SECRET_KEY invalidates outstanding backup codes.
+BACKUP_CODE_HASH_SALT = 'app.MFABackupCode'
+
+def normalize_backup_code(code):
+    return ''.join(code.split()).upper()
+
+def hash_backup_code(user_id, code):
+    value = f'{user_id}:{normalize_backup_code(code)}'
+    return salted_hmac(BACKUP_CODE_HASH_SALT, value, algorithm='sha256').hexdigest()
+
 class User(AbstractUser):
     # Standard AbstractUser has username, first_name, last_name, email, password
     # We will enforce email as unique and required if needed, or just rely on username/email
@@ -29,7 +73,6 @@ class User(AbstractUser):
     # MFA Fields
     mfa_secret = models.CharField(max_length=32, blank=True, null=True)
     mfa_enabled = models.BooleanField(default=False)
-    backup_codes = models.JSONField(default=list, blank=True)
 
     def __str__(self):
         return self.username
@@ -46,16 +89,240 @@ class Workspace(models.Model):
     company_size = models.CharField(max_length=20, blank=True, null=True)
     timezone = models.CharField(max_length=50, blank=True, null=True)
     currency = models.CharField(max_length=10, blank=True, null=True)
+    # Deprecated: superseded by AgentAssignment. Derived from it and
+    # read-only in the API (see app/roster.py)
     active_agents = models.JSONField(default=list, blank=True, null=True)
     metrics = models.JSONField(default=dict, blank=True, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Set by metric ingestion, which merges into ``metrics`` without bumping
+    # updated_at; read validators (ETags) need both
+    metrics_updated_at = models.DateTimeField(null=True, blank=True)
+    # recorded_at (ISO 8601) of each value in ``metrics``, so a late or
+    # backfilled batch can't overwrite a newer value. Internal, not in the API.
+    metrics_recorded_at = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order used by the workspace API
+            models.Index(fields=['-updated_at', '-id'], name='workspace_updated_id_idx'),
+        ]
+
+    # Owner as loaded from the database, so WorkspaceAccess is only re-synced
+    # when the owner actually changes (see app.signals)
+    _loaded_owner_id = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_owner_id = instance.__dict__.get('owner_id')
+        return instance
 
     def save(self, *args, **kwargs):
-        if not self.invite_code:
-            self.invite_code = str(uuid.uuid4())[:8] # Simple invite code
-        super().save(*args, **kwargs)
+        if self.invite_code:
+            super().save(*args, **kwargs)
+            return
+
+        # The default invite (no expiry, unlimited uses) is mirrored into
+        # invite_code; both columns are unique, so allocate them together.
+        def create(code):
+            self.invite_code = code
+            super(Workspace, self).save(*args, **kwargs)
+            WorkspaceInvite.objects.create(code=code, workspace=self)
+
+        allocate_invite_code(create)
 
     def __str__(self):
         return self.name
+
+class WorkspaceAccess(models.Model):
+    # Denormalized (user, workspace) pairs for everyone who can see a workspace,
+    # either as owner or member. Kept in sync from app.signals so visibility
+    # checks are a single indexed lookup instead of an OR across the members join.
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='workspace_access')
+    workspace = models.ForeignKey(Workspace, on_delete=models.CASCADE, related_name='access')
+    is_owner = models.BooleanField(default=False)
+    is_member = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'workspace'], name='unique_workspace_access'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} -> {self.workspace_id}'
+
+class WorkspaceInviteManager(models.Manager):
+    def allocate(self, workspace, created_by=None, expires_at=None, max_uses=None):
+        return allocate_invite_code(lambda code: self.create(
+            code=code, workspace=workspace, created_by=created_by, expires_at=expires_at, max_uses=max_uses,
+        ))
+
+    def usable(self, now=None):
+        now = now or timezone.now()
+        return self.filter(
+            Q(expires_at__isnull=True) | Q(expires_at__gt=now),
+            Q(max_uses__isnull=True) | Q(use_count__lt=F('max_uses')),
+        )
+
+    def redeem(self, invite_id):
+        # Conditional increment: concurrent redemptions can't exceed max_uses
+        return self.usable().filter(pk=invite_id).update(use_count=F('use_count') + 1) == 1
+
+    def purge_expired(self, batch_size=1000, now=None):
+        now = now or timezone.now()
+        deleted = 0
+        while True:
+            batch = list(self.filter(expires_at__lte=now).values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                return deleted
+            deleted += self.filter(pk__in=batch).delete()[0]
+
+class MFABackupCodeManager(models.Manager):
+    def replace(self, user, codes):
+        with transaction.atomic():
+            self.filter(user=user).delete()
+            self.bulk_create([self.model(user=user, code_hash=hash_backup_code(user.pk, code)) for code in codes])
+
+    def consume(self, user, code):
+        # Single conditional DELETE: of two concurrent uses only one removes the row
+        return self.filter(user=user, code_hash=hash_backup_code(user.pk, code)).delete()[0] == 1
+
+class MFABackupCode(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='backup_codes')
+    code_hash = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = MFABackupCodeManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'code_hash'], name='unique_user_backup_code'),
+        ]
+
+    def __str__(self):
+        return f'Backup code for {self.user_id}'
+
+class WorkspaceInvite(models.Model):
+    code = models.CharField(max_length=50, unique=True)
+    workspace = models.ForeignKey(Workspace, on_delete=models.CASCADE, related_name='invites')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Null means never expires / unlimited uses
+    expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    max_uses = models.PositiveIntegerField(null=True, blank=True)
+    use_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = WorkspaceInviteManager()
+
+    def __str__(self):
+        return self.code
+
+class WorkspaceMetricPoint(models.Model):
+    # Append-only raw samples; rows are never updated in place
+    id = models.BigAutoField(primary_key=True)
+    workspace = models.ForeignKey(Workspace, on_delete=models.CASCADE, related_name='metric_points')
+    name = models.CharField(max_length=100)
+    value = models.FloatField()
+    recorded_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['workspace', 'name', 'recorded_at'], name='metric_point_range_idx'),
+        ]
+
+class WorkspaceMetricRollup(models.Model):
+    RESOLUTION_CHOICES = [('minute', 'Minute'), ('hour', 'Hour'), ('day', 'Day')]
+
+    # Incrementally maintained aggregates of WorkspaceMetricPoint per time bucket
+    workspace = models.ForeignKey(Workspace, on_delete=models.CASCADE, related_name='metric_rollups')
+    name = models.CharField(max_length=100)
+    resolution = models.CharField(max_length=10, choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField()
+    count = models.PositiveIntegerField()
+    total = models.FloatField()
+    minimum = models.FloatField()
+    maximum = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['workspace', 'name', 'resolution', 'bucket_start'], name='unique_metric_rollup_bucket'),
+        ]
+
+class AgentAssignment(models.Model):
+    # Normalized roster of the agents running in a workspace. Supersedes the
+    # Workspace.active_agents JSON list, which is derived from these rows
+    # (app.roster) until clients move to /api/agents/.
+    workspace = models.ForeignKey(Workspace, on_delete=models.CASCADE, related_name='agents')
+    agent_type = models.CharField(max_length=100)
+    name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, default='active')
+    config = models.JSONField(default=dict, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['workspace', 'status'], name='agent_workspace_status_idx'),
+            models.Index(fields=['agent_type'], name='agent_type_idx'),
+        ]
+
+    def __str__(self):
+        return self.name or self.agent_type
+
+class OutboxMessage(models.Model):
+    STATUS_CHOICES = [('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')]
+
+    # Durable queue of outgoing email, drained by app.outbox
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.status})'
+
+class RevokedTokenManager(models.Manager):
+    def purge_expired(self, batch_size=1000, now=None):
+        # An expired token fails signature/exp checks on its own; its row is dead weight
+        now = now or timezone.now()
+        deleted = 0
+        while True:
+            batch = list(self.filter(expires_at__lte=now).values_list('pk', flat=True)[:batch_size])
+            if not batch:
+                return deleted
+            deleted += self.filter(pk__in=batch).delete()[0]
+
+class RevokedToken(models.Model):
+    # Refresh-token JTIs revoked on rotation; written in batches by app.revocation
+    jti = models.CharField(max_length=255, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = RevokedTokenManager()
+
+    def __str__(self):
+        return self.jti
+
+class ImportCheckpoint(models.Model):
+    # Progress of a resumable import (app.transfer): the last input line whose
+    # batch committed, written in the same transaction as that batch
+    name = models.CharField(max_length=255, primary_key=True)
+    line = models.PositiveBigIntegerField(default=0)
+    # Id of the record on that line, so a resume can tell it has the same file
+    last_id = models.CharField(max_length=64, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.name} @ line {self.line}'
@@ -0,0 +1,196 @@
+"""
+Durable outbox for outgoing email.
+
+Requests only insert an ``OutboxMessage`` row (``enqueue``) and return;
+delivery happens in ``drain``, which claims due rows in batches, renders
+them into ``EmailMessage``s through the renderer registered for their
+kind, and sends them over one mail connection. Failures are retried with
+exponential backoff until ``MAX_ATTEMPTS``.
+
+After the enqueuing transaction commits, the delivery trigger depends on
+``OUTBOX['MODE']``:
+
+- ``celery``: queue the ``app.tasks.send_outbox`` task (beat also retries due rows)
+- ``thread``: wake an in-process background worker (no broker needed)
+- ``eager``: drain synchronously, for tests
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MODE': 'thread',
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 8,
+    'BACKOFF_BASE': 30,
+    'BACKOFF_MAX': 60 * 60,
+    # A claimed row becomes due again if its worker dies mid-send
+    'LEASE': 5 * 60,
+    'POLL_INTERVAL': 30,
+}
+
+RENDERERS = {}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'OUTBOX', {})}
+
+
+def renderer(kind):
+    """Register ``func(payload) -> list[EmailMessage]`` for an outbox kind."""
+    def register(func):
+        RENDERERS[kind] = func
+        return func
+    return register
+
+
+@renderer('email')
+def render_email(payload):
+    return [EmailMessage(payload['subject'], payload['body'], payload.get('from_email'), payload['to'])]
+
+
+@renderer('password_reset')
+def render_password_reset(payload):
+    # The user lookup happens here rather than in the request, so the
+    # endpoint does the same work whether or not the account exists.
+    user = get_user_model().objects.filter(email=payload['email']).first()
+    if user is None:
+        return []
+    token = PasswordResetTokenGenerator().make_token(user)
+    uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
+    reset_link = f"{settings.FRONTEND_URL}/reset-password?uid={uidb64}&token={token}"
+    return [EmailMessage(
+        'Password Reset Request',
+        f'Click the link to reset your password: {reset_link}',
+        'noreply@aisyntheticworkforce.com',
+        [user.email],
+    )]
+
+
+def enqueue(kind, payload):
+    """Store a message for delivery once the current transaction commits."""
+    if kind not in RENDERERS:
+        raise ValueError(f'Unknown outbox kind {kind!r}')
+    message = OutboxMessage.objects.create(kind=kind, payload=payload)
+    transaction.on_commit(dispatch)
+    return message
+
+
+def enqueue_email(subject, body, to, from_email=None):
+    return enqueue('email', {'subject': subject, 'body': body, 'to': list(to), 'from_email': from_email})
+
+
+def dispatch():
+    mode = get_config()['MODE']
+    if mode == 'eager':
+        drain()
+    elif mode == 'celery':
+        from .tasks import send_outbox
+        send_outbox.delay()
+    elif mode == 'thread':
+        worker.wake()
+    else:
+        raise ValueError(f'Unknown outbox mode {mode!r}')
+
+
+def backoff(attempts, config):
+    return timedelta(seconds=min(config['BACKOFF_MAX'], config['BACKOFF_BASE'] * 2 ** (attempts - 1)))
+
+
+def claim(batch_size, config):
+    """Lease up to ``batch_size`` due messages to this worker."""
+    now = timezone.now()
+    with transaction.atomic():
+        due = (
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+        )
+        ids = list(due.values_list('pk', flat=True)[:batch_size])
+        OutboxMessage.objects.filter(pk__in=ids).update(
+            attempts=F('attempts') + 1, next_attempt_at=now + timedelta(seconds=config['LEASE']),
+        )
+    return list(OutboxMessage.objects.filter(pk__in=ids).order_by('pk'))
+
+
+def send_batch(messages, config):
+    sent = 0
+    connection = get_connection()
+    try:
+        connection.open()
+        for message in messages:
+            try:
+                for email in RENDERERS[message.kind](message.payload):
+                    email.connection = connection
+                    email.send()
+            except Exception as e:
+                logger.warning('Outbox message %s failed (attempt %s): %s', message.pk, message.attempts, e)
+                if message.attempts >= config['MAX_ATTEMPTS']:
+                    OutboxMessage.objects.filter(pk=message.pk).update(status='failed', last_error=str(e))
+                else:
+                    OutboxMessage.objects.filter(pk=message.pk).update(
+                        last_error=str(e), next_attempt_at=timezone.now() + backoff(message.attempts, config),
+                    )
+            else:
+                OutboxMessage.objects.filter(pk=message.pk).update(status='sent', sent_at=timezone.now(), last_error='')
+                sent += 1
+    finally:
+        connection.close()
+    return sent
+
+
+def drain(max_batches=None):
+    """Send due messages batch by batch until none are left. Returns the number sent."""
+    config = get_config()
+    sent = batches = 0
+    while max_batches is None or batches < max_batches:
+        messages = claim(config['BATCH_SIZE'], config)
+        if not messages:
+            break
+        sent += send_batch(messages, config)
+        batches += 1
+    return sent
+
+
+class OutboxWorker:
+    """Daemon thread draining the outbox when woken, and every POLL_INTERVAL for retries."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def wake(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='outbox-worker', daemon=True)
+                self._thread.start()
+        self._event.set()
+
+    def _run(self):
+        while True:
+            self._event.wait(timeout=get_config()['POLL_INTERVAL'])
+            self._event.clear()
+            try:
+                drain()
+            except Exception:
+                logger.exception('Outbox drain failed')
+            finally:
+                close_old_connections()
+
+
+worker = OutboxWorker()
@@ -0,0 +1,111 @@
+import base64
+import binascii
+from urllib import parse
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset ("seek") pagination over a compound ordering.
+
+    Each page filters on the position of the last row of the previous page
+    instead of using OFFSET, so deep pages cost the same as the first one.
+    The ordering must be unique, hence the primary key as the last field.
+    """
+    ordering = ('-pk',)
+    cursor_query_param = 'cursor'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.fields = [self.get_model_field(queryset.model, name) for name in self.ordering]
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            queryset = queryset.filter(self.seek(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        page = rows[:self.page_size]
+        self.next_position = self.position_of(page[-1]) if len(rows) > self.page_size else None
+        return page
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_model_field(self, model, name):
+        field_name = name.lstrip('-')
+        return model._meta.pk if field_name == 'pk' else model._meta.get_field(field_name)
+
+    def position_of(self, row):
+        # Rows are model instances or .values() dicts
+        values = [row[field.attname] if isinstance(row, dict) else field.value_from_object(row) for field in self.fields]
+        return [value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in values]
+
+    def seek(self, position):
+        # (a, b) after (x, y) in a descending ordering means
+        # a < x OR (a = x AND b < y); generalised to any number of fields.
+        condition = Q()
+        equal = Q()
+        for name, field, value in zip(self.ordering, self.fields, position):
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field.attname}__{lookup}': value})
+            equal &= Q(**{field.attname: value})
+        return condition
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(parse.urlencode({'p': position}, doseq=True).encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            values = parse.parse_qs(base64.urlsafe_b64decode(encoded.encode()).decode(), strict_parsing=True)['p']
+            if len(values) != len(self.fields):
+                raise ValueError(encoded)
+            return [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (binascii.Error, UnicodeDecodeError, KeyError, ValueError, TypeError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class WorkspacePagination(KeysetPagination):
+    # Most recently updated first; id breaks ties between equal timestamps
+    ordering = ('-updated_at', '-id')
+
+
+class AgentPagination(KeysetPagination):
+    ordering = ('-id',)
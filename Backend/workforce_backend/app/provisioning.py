@@ -0,0 +1,175 @@
+"""
+Bulk user provisioning for staff (``POST /api/users/bulk/``).
+
+Registering users one request at a time costs one password hash and one
+INSERT each. ``provision`` takes up to 5,000 rows at once:
+
+* Rows are validated ``BATCH_SIZE`` at a time. Field checks run per row.
+  Username and email uniqueness is checked with one query per batch,
+  plus the rows seen earlier in the same request.
+* Passwords of the valid rows are hashed in parallel on a pool of their
+  own. It is a thread pool by default: hashlib's PBKDF2 releases the GIL
+  while it hashes. ``KIND = 'process'`` is for hashers that don't. Its
+  workers are spawned rather than forked, since forking a threaded server
+  process can copy held locks into the child. The pool is separate from
+  ``app.auth_pool``: a 5,000-row upload would overflow that pool's queue
+  and starve logins. Rows without a password get an unusable one, so
+  those users sign in through a password reset.
+* Users are inserted with ``bulk_create``. If a workspace is given, they
+  join it in the same transaction.
+
+Invalid rows don't stop the rest. Each row gets a result with its index
+in the request.
+"""
+import codecs
+import csv
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.signals import setting_changed
+from django.db import transaction
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import BaseParser
+
+from . import access
+from .serializers import ProvisionUserSerializer
+
+User = get_user_model()
+
+DEFAULTS = {
+    'KIND': 'thread',
+    'MAX_WORKERS': os.cpu_count() or 2,
+    'BATCH_SIZE': 500,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'BULK_PROVISIONING', {})}
+
+
+class CSVParser(BaseParser):
+    """A header row naming the columns, then one user per row."""
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        try:
+            reader = csv.DictReader(codecs.getreader(encoding)(stream))
+            # Empty cells mean "not given", as an absent JSON key would
+            return [{key: value for key, value in row.items() if key and value} for row in reader]
+        except (csv.Error, UnicodeDecodeError) as exc:
+            raise ParseError(f'CSV parse error - {exc}')
+
+
+def build_hash_pool():
+    config = get_config()
+    if config['KIND'] == 'thread':
+        return ThreadPoolExecutor(config['MAX_WORKERS'], thread_name_prefix='provisioning')
+    if config['KIND'] == 'process':
+        return ProcessPoolExecutor(config['MAX_WORKERS'], mp_context=multiprocessing.get_context('spawn'), initializer=django.setup)
+    raise ValueError(f"Unknown BULK_PROVISIONING kind {config['KIND']!r}")
+
+
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+
+def get_hash_pool():
+    global _hash_pool
+    if _hash_pool is None:
+        with _hash_pool_lock:
+            if _hash_pool is None:
+                _hash_pool = build_hash_pool()
+    return _hash_pool
+
+
+def _reset_hash_pool(*, setting, **kwargs):
+    global _hash_pool
+    if setting == 'BULK_PROVISIONING' and _hash_pool is not None:
+        _hash_pool.shutdown(wait=False)
+        _hash_pool = None
+
+
+setting_changed.connect(_reset_hash_pool)
+
+
+def hash_passwords(passwords):
+    """``make_password`` for each password, spread over the hash pool."""
+    if not passwords:
+        return []
+    # Resolved here and shipped with each job, so workers hash with this
+    # process's PASSWORD_HASHERS rather than whatever they were started with
+    hasher = get_hasher()
+    chunksize = max(1, len(passwords) // (get_config()['MAX_WORKERS'] * 4))
+    return list(get_hash_pool().map(make_password, passwords, repeat(None), repeat(hasher), chunksize=chunksize))
+
+
+def validate_rows(rows, batch_size):
+    """``(valid rows as (index, data), {index: errors})``."""
+    serializer = ProvisionUserSerializer()
+    valid, errors = [], {}
+    seen_usernames, seen_emails = set(), set()
+    for start in range(0, len(rows), batch_size):
+        batch = []
+        for index, row in enumerate(rows[start:start + batch_size], start):
+            try:
+                batch.append((index, serializer.run_validation(row)))
+            except ValidationError as exc:
+                errors[index] = exc.detail
+
+        taken_usernames = set(User.objects.filter(username__in=[data['username'] for _, data in batch]).values_list('username', flat=True))
+        taken_emails = set(User.objects.filter(email__in=[data['email'] for _, data in batch]).values_list('email', flat=True))
+        for index, data in batch:
+            row_errors = {}
+            if data['username'] in taken_usernames or data['username'] in seen_usernames:
+                row_errors['username'] = ['A user with that username already exists.']
+            if data['email'] in taken_emails or data['email'] in seen_emails:
+                row_errors['email'] = ['A user with that email already exists.']
+            if row_errors:
+                errors[index] = row_errors
+                continue
+            seen_usernames.add(data['username'])
+            seen_emails.add(data['email'])
+            valid.append((index, data))
+    return valid, errors
+
+
+def provision(rows, workspace_id=None):
+    """
+    Create users from ``rows`` (dicts of username, email and optionally
+    password and full_name) and add them to ``workspace_id`` if given.
+    Returns one result per row, in order.
+    """
+    config = get_config()
+    valid, errors = validate_rows(rows, config['BATCH_SIZE'])
+
+    with_password = [data['password'] for _, data in valid if data.get('password')]
+    hashes = iter(hash_passwords(with_password))
+    users = [
+        User(
+            username=data['username'],
+            email=data['email'],
+            full_name=data.get('full_name', ''),
+            password=next(hashes) if data.get('password') else make_password(None),
+        )
+        for _, data in valid
+    ]
+
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=config['BATCH_SIZE'])
+        if workspace_id is not None and users:
+            access.add_members(workspace_id, [user.pk for user in users], batch_size=config['BATCH_SIZE'])
+
+    results = [{'index': index, 'status': 'invalid', 'errors': row_errors} for index, row_errors in errors.items()]
+    results += [
+        {'index': index, 'status': 'created', 'id': user.pk, 'username': user.username}
+        for (index, _), user in zip(valid, users)
+    ]
+    return sorted(results, key=lambda result: result['index'])
@@ -0,0 +1,254 @@
+"""
+Revocation store for rotated refresh tokens.
+
+``RevocableRefreshToken`` is the refresh-token class used by
+``/api/auth/token/refresh/``. With ``ROTATE_REFRESH_TOKENS`` and
+``BLACKLIST_AFTER_ROTATION``, simplejwt calls ``blacklist()`` on the token
+being rotated, and every refresh first calls ``verify()``. Both go through
+the process-wide ``RevocationStore``:
+
+* ``revoke`` adds the JTI to an in-memory Bloom filter and a pending
+  buffer. The buffer is written with one ``bulk_create`` once it holds
+  ``BATCH_SIZE`` JTIs or ``FLUSH_INTERVAL`` seconds after the first one
+  arrived. ``FLUSH_INTERVAL = 0`` writes each revocation synchronously.
+* ``is_revoked`` consults the Bloom filter first. A miss (almost every
+  refresh, since rotated tokens are rarely replayed) needs no query. A hit
+  is confirmed against the buffer and then the ``RevokedToken`` table.
+
+The filter also learns JTIs revoked by other processes by loading new rows
+every ``SYNC_INTERVAL`` seconds. A token rotated in one worker can
+therefore be replayed against another worker for up to
+``FLUSH_INTERVAL + SYNC_INTERVAL`` seconds. Within one process,
+revocation is immediate.
+
+Expired rows are removed by ``manage.py purge_revoked_tokens``.
+"""
+import atexit
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'BATCH_SIZE': 100,
+    'FLUSH_INTERVAL': 1.0,
+    'SYNC_INTERVAL': 5.0,
+    'BLOOM_CAPACITY': 1_000_000,
+    'BLOOM_ERROR_RATE': 0.001,
+}
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on one blake2b digest)."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationStore:
+    def __init__(self, config):
+        self.config = config
+        self._lock = threading.Lock()
+        self._pending = {}
+        # Batches being written: still revoked as far as is_revoked is
+        # concerned until the INSERT has committed
+        self._flushing = {}
+        self._timer = None
+        self._synced_at = None
+        self._watermark = None
+        self._rebuild_size = 0
+        self.bloom = self._new_bloom()
+
+    def _new_bloom(self):
+        return BloomFilter(self.config['BLOOM_CAPACITY'], self.config['BLOOM_ERROR_RATE'])
+
+    def revoke(self, jti, expires_at):
+        with self._lock:
+            self.bloom.add(jti)
+            self._pending[jti] = expires_at
+            flush_now = len(self._pending) >= self.config['BATCH_SIZE'] or self.config['FLUSH_INTERVAL'] <= 0
+            if not flush_now and self._timer is None:
+                self._timer = threading.Timer(self.config['FLUSH_INTERVAL'], self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+        if flush_now:
+            self.flush()
+
+    def flush(self):
+        """Write buffered revocations in one INSERT; returns how many were written."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._flushing.update(batch)
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not batch:
+            return 0
+        try:
+            RevokedToken.objects.bulk_create(
+                [RevokedToken(jti=jti, expires_at=expires_at) for jti, expires_at in batch.items()],
+                ignore_conflicts=True,
+            )
+        except Exception:
+            # Keep them for the next flush rather than silently un-revoking
+            with self._lock:
+                self._pending = {**batch, **self._pending}
+            self._discard_flushing(batch)
+            raise
+        # Immediately in autocommit mode; inside a caller's transaction, once
+        # the rows are visible to other connections
+        transaction.on_commit(lambda: self._discard_flushing(batch))
+        return len(batch)
+
+    def _discard_flushing(self, batch):
+        with self._lock:
+            for jti in batch:
+                self._flushing.pop(jti, None)
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Flushing revoked tokens failed')
+        finally:
+            # The timer thread's connection is never reused, so
+            # close_old_connections (which honours CONN_MAX_AGE) would leak it
+            connection.close()
+
+    def is_revoked(self, jti):
+        self.sync()
+        if jti not in self.bloom:
+            return False
+        with self._lock:
+            if jti in self._pending or jti in self._flushing:
+                return True
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def sync(self, force=False):
+        """Load JTIs revoked (by any process) since the last sync into the filter."""
+        now = time.monotonic()
+        if not force and self._synced_at is not None and now - self._synced_at < self.config['SYNC_INTERVAL']:
+            return
+        self._synced_at = now
+
+        started_at = timezone.now()
+        rows = RevokedToken.objects.filter(expires_at__gt=started_at)
+        # Rebuild from live rows at startup, and once expired JTIs have
+        # bloated the filter past capacity (at most once per doubling)
+        rebuild = self._watermark is None or (
+            self.bloom.count > self.bloom.capacity and self.bloom.count > 2 * self._rebuild_size
+        )
+        if not rebuild:
+            # Overlap by a sync interval so rows committed late with an
+            # older revoked_at are still picked up; re-adding is harmless
+            rows = rows.filter(revoked_at__gte=self._watermark - timedelta(seconds=self.config['SYNC_INTERVAL']))
+        watermark = started_at
+        if rebuild:
+            # Filled outside the lock, since nothing else sees it until the swap
+            bloom = self._new_bloom()
+            loaded = 0
+            for jti, revoked_at in rows.values_list('jti', 'revoked_at').iterator(chunk_size=5000):
+                bloom.add(jti)
+                watermark = max(watermark, revoked_at)
+                loaded += 1
+            with self._lock:
+                # Revocations from this process not written yet
+                for jti in [*self._pending, *self._flushing]:
+                    bloom.add(jti)
+                self.bloom = bloom
+                self._rebuild_size = loaded
+                self._watermark = watermark
+            return
+        # The shared filter is also written by revoke(); read the rows
+        # before taking the lock so revocations don't wait on the query
+        loaded = list(rows.values_list('jti', 'revoked_at'))
+        with self._lock:
+            for jti, revoked_at in loaded:
+                self.bloom.add(jti)
+                watermark = max(watermark, revoked_at)
+            self._watermark = watermark
+
+
+def build_revocation_store():
+    return RevocationStore({**DEFAULTS, **getattr(settings, 'TOKEN_REVOCATION', {})})
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_revocation_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = build_revocation_store()
+    return _store
+
+
+def _reset_revocation_store(*, setting, **kwargs):
+    global _store
+    if setting == 'TOKEN_REVOCATION':
+        _store = None
+
+
+setting_changed.connect(_reset_revocation_store)
+
+
+@atexit.register
+def _flush_on_exit():
+    if _store is not None:
+        try:
+            _store.flush()
+        except Exception:
+            logger.exception('Flushing revoked tokens at exit failed')
+
+
+class RevocableRefreshToken(RefreshToken):
+    """Refresh token checked against, and revoked into, the revocation store."""
+
+    def verify(self):
+        super().verify()
+        if get_revocation_store().is_revoked(self.payload['jti']):
+            raise TokenError('Token is blacklisted')
+
+    def blacklist(self):
+        # Called by TokenRefreshSerializer on rotation (BLACKLIST_AFTER_ROTATION)
+        expires_at = datetime.fromtimestamp(self.payload['exp'], tz=dt_timezone.utc)
+        get_revocation_store().revoke(self.payload['jti'], expires_at)
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = RevocableRefreshToken
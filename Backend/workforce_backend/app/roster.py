@@ -0,0 +1,32 @@
+"""
+The agent roster and the deprecated ``Workspace.active_agents`` list.
+
+``AgentAssignment`` rows are the roster. ``active_agents`` is kept only for
+clients that still read it: it is read-only in the API and derived from
+the roster by ``refresh_active_agents``, which every roster write calls in
+its transaction. The list is part of the workspace representation, so a
+refresh also bumps ``Workspace.updated_at`` (and with it the ETags).
+"""
+from collections import defaultdict
+
+from django.utils import timezone
+
+from .models import AgentAssignment, Workspace
+
+# Keys of each active_agents entry (also inlined in migration 0019)
+ENTRY_FIELDS = ('id', 'agent_type', 'name', 'status', 'config')
+
+
+def refresh_active_agents(workspace_ids):
+    """Rewrite ``active_agents`` of ``workspace_ids`` from their roster, in one UPDATE."""
+    workspace_ids = set(workspace_ids)
+    if not workspace_ids:
+        return
+    roster = defaultdict(list)
+    for agent in AgentAssignment.objects.filter(workspace__in=workspace_ids).order_by('pk').values('workspace_id', *ENTRY_FIELDS):
+        roster[agent.pop('workspace_id')].append(agent)
+    now = timezone.now()
+    Workspace.objects.bulk_update(
+        [Workspace(pk=workspace_id, active_agents=roster[workspace_id], updated_at=now) for workspace_id in workspace_ids],
+        ['active_agents', 'updated_at'],
+    )
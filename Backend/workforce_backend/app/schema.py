@@ -0,0 +1,116 @@
+"""
+Precomputed OpenAPI schema.
+
+drf-spectacular builds the schema by introspecting every view and
+serializer, which takes hundreds of milliseconds. ``/api/schema/json/``
+instead serves a copy built once per process: read from
+``OPENAPI_SCHEMA['DIR']`` when ``manage.py build_schema`` has written it
+there (run it on deploy, like collectstatic), otherwise generated on the
+first request. The body is held in memory together with its compressed
+variants and an ETag, so polling clients that send If-None-Match get a
+304.
+
+The directory is ignored under DEBUG so a schema built before a code
+change can't shadow it during development.
+"""
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from drf_spectacular.renderers import OpenApiJsonRenderer
+from drf_spectacular.settings import spectacular_settings
+
+from .compression import ENCODINGS
+
+DEFAULTS = {
+    'DIR': None,
+}
+
+FILENAME = 'schema.json'
+MEDIA_TYPE = OpenApiJsonRenderer.media_type
+EXTENSIONS = {'br': 'br', 'gzip': 'gz'}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'OPENAPI_SCHEMA', {})}
+
+
+def generate_schema():
+    """The schema as rendered JSON bytes, the same document SpectacularAPIView serves."""
+    generator = spectacular_settings.DEFAULT_GENERATOR_CLASS()
+    schema = generator.get_schema(request=None, public=spectacular_settings.SERVE_PUBLIC)
+    return OpenApiJsonRenderer().render(schema, renderer_context={})
+
+
+class SchemaArtifact:
+    """A rendered schema with its ETag and pre-compressed variants."""
+
+    def __init__(self, body, variants=None):
+        self.body = body
+        self.etag = '"%s"' % hashlib.sha256(body).hexdigest()[:32]
+        variants = dict(variants or {})
+        for encoding, compress in ENCODINGS.items():
+            if encoding not in variants:
+                variants[encoding] = compress(body)
+        self.variants = variants
+
+    def write(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        files = {FILENAME: self.body}
+        files.update((f'{FILENAME}.{EXTENSIONS[encoding]}', data) for encoding, data in self.variants.items())
+        for name, data in files.items():
+            # Replace atomically; other processes may be reading the old copy
+            path = os.path.join(directory, name)
+            with open(f'{path}.tmp', 'wb') as handle:
+                handle.write(data)
+            os.replace(f'{path}.tmp', path)
+
+    @classmethod
+    def read(cls, directory):
+        """The artifact stored in ``directory``, or None if it has none."""
+        try:
+            with open(os.path.join(directory, FILENAME), 'rb') as handle:
+                body = handle.read()
+        except FileNotFoundError:
+            return None
+        variants = {}
+        for encoding in ENCODINGS:
+            try:
+                with open(os.path.join(directory, f'{FILENAME}.{EXTENSIONS[encoding]}'), 'rb') as handle:
+                    variants[encoding] = handle.read()
+            except FileNotFoundError:
+                pass
+        return cls(body, variants)
+
+
+def build_schema_artifact():
+    directory = get_config()['DIR']
+    if directory and not settings.DEBUG:
+        artifact = SchemaArtifact.read(directory)
+        if artifact is not None:
+            return artifact
+    return SchemaArtifact(generate_schema())
+
+
+_artifact = None
+_artifact_lock = threading.Lock()
+
+
+def get_schema_artifact():
+    global _artifact
+    if _artifact is None:
+        with _artifact_lock:
+            if _artifact is None:
+                _artifact = build_schema_artifact()
+    return _artifact
+
+
+def _reset_schema_artifact(*, setting, **kwargs):
+    global _artifact
+    if setting in ('OPENAPI_SCHEMA', 'SPECTACULAR_SETTINGS', 'ROOT_URLCONF'):
+        _artifact = None
+
+
+setting_changed.connect(_reset_schema_artifact)
@@ -0,0 +1,26 @@
+"""
+drf-spectacular extensions for the project's own authentication classes.
+
+drf-spectacular only documents authenticators it has an extension for;
+without these, endpoints using them lose their ``security`` entries in
+the schema. Imported from ``AppConfig.ready`` so they register before the
+schema is generated.
+"""
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from drf_spectacular.extensions import OpenApiAuthenticationExtension
+from drf_spectacular.plumbing import build_bearer_security_scheme_object
+
+
+class CachedJWTScheme(SimpleJWTScheme):
+    # Same bearer JWT as simplejwt's class, so the same 'jwtAuth' scheme
+    target_class = 'app.authentication.CachedJWTAuthentication'
+
+
+class MetricsTokenScheme(OpenApiAuthenticationExtension):
+    target_class = 'app.authentication.MetricsTokenAuthentication'
+    name = 'metricsToken'
+
+    def get_security_definition(self, auto_schema):
+        scheme = build_bearer_security_scheme_object(header_name='HTTP_AUTHORIZATION', token_prefix='Bearer')
+        scheme['description'] = 'The METRICS_TOKEN setting, for scraping /api/metrics/.'
+        return scheme
@@ -1,9 +1,16 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.utils.encoding import force_str
 from django.utils.http import urlsafe_base64_decode
-from .models import Workspace
+from django.utils import timezone
+from django.contrib.auth.models import update_last_login
+from rest_framework_simplejwt.serializers import TokenObtainSerializer, TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from datetime import timedelta
+from .models import AgentAssignment, Workspace, WorkspaceAccess, WorkspaceInvite
 
 User = get_user_model()
 
@@ -15,25 +22,187 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         fields = ('id', 'username', 'email', 'password', 'full_name')
 
     def create(self, validated_data):
-        user = User.objects.create_user(
-            username=validated_data['username'],
-            email=validated_data['email'],
-            password=validated_data['password'],
-            full_name=validated_data.get('full_name', '')
+        # The async register view hashes on the auth pool and passes
+        # save(password_hash=...); otherwise hash here as create_user would.
+        password_hash = validated_data.get('password_hash') or make_password(validated_data['password'])
+        user = User(
+            username=User.normalize_username(validated_data['username']),
+            email=User.objects.normalize_email(validated_data['email']),
+            full_name=validated_data.get('full_name', ''),
+            password=password_hash,
         )
+        user.save()
         return user
 
-class WorkspaceSerializer(serializers.ModelSerializer):
+class ProvisionUserSerializer(serializers.ModelSerializer):
+    # One row of a bulk provisioning request. app.provisioning checks
+    # uniqueness a batch at a time instead of with a query per row.
+    password = serializers.CharField(write_only=True, required=False)
+
+    class Meta:
+        model = User
+        fields = ('username', 'email', 'password', 'full_name')
+        extra_kwargs = {
+            'username': {'validators': [User.username_validator]},
+            'email': {'validators': []},
+        }
+
+    def validate_username(self, value):
+        return User.normalize_username(value)
+
+    def validate_email(self, value):
+        return User.objects.normalize_email(value)
+
+class BulkUserProvisionSerializer(serializers.Serializer):
+    users = serializers.ListField(child=serializers.DictField(), allow_empty=False, max_length=5000)
+    # Optional workspace every created user joins
+    workspace = serializers.UUIDField(required=False)
+
+    def validate_workspace(self, value):
+        if not Workspace.objects.filter(pk=value).exists():
+            raise serializers.ValidationError('Workspace not found.')
+        return value
+
+class LoginSerializer(TokenObtainPairSerializer):
+    # Lifetime of the token handed to MFA users in exchange for their TOTP code
+    mfa_temp_token_lifetime = timedelta(minutes=5)
+
+    def validate(self, attrs):
+        # Authenticate exactly once (one user lookup, one password hash) and
+        # branch on the result, instead of validating again in the view.
+        TokenObtainSerializer.validate(self, attrs)
+        return self.token_data(self.user)
+
+    def token_data(self, user):
+        """Response body for an authenticated ``user``."""
+        data = {}
+        if user.mfa_enabled:
+            # Issue a temporary token (subset of Access Token with specific scope/claim)
+            temp_token = AccessToken.for_user(user)
+            temp_token.set_exp(lifetime=self.mfa_temp_token_lifetime)
+            temp_token['mfa_pending'] = True
+            data['mfa_required'] = True
+            data['temp_token'] = str(temp_token)
+            return data
+
+        refresh = self.get_token(user)
+        data['refresh'] = str(refresh)
+        data['access'] = str(refresh.access_token)
+
+        if jwt_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, user)
+
+        return data
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer that takes an optional ``fields`` argument restricting
+    which of its fields are serialized.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+class WorkspaceSerializer(DynamicFieldsModelSerializer):
     owner = serializers.PrimaryKeyRelatedField(read_only=True)
     
     class Meta:
         model = Workspace
-        fields = '__all__'
-        read_only_fields = ('invite_code', 'created_at', 'updated_at', 'members')
+        exclude = ('metrics_recorded_at',)
+        # active_agents is derived from the agent roster (app.roster)
+        read_only_fields = ('invite_code', 'active_agents', 'created_at', 'updated_at', 'metrics_updated_at', 'members')
+
+    def validate_metrics(self, value):
+        # Metric ingestion merges into it as a name -> value object
+        if value is not None and not isinstance(value, dict):
+            raise serializers.ValidationError('Must be a JSON object.')
+        return value
 
 class JoinWorkspaceSerializer(serializers.Serializer):
     invite_code = serializers.CharField(required=True)
 
+class WorkspaceInviteSerializer(serializers.ModelSerializer):
+    # Lifetime in seconds; omit for an invite that never expires
+    ttl = serializers.IntegerField(write_only=True, required=False, min_value=60, max_value=60 * 60 * 24 * 90)
+
+    class Meta:
+        model = WorkspaceInvite
+        fields = ('code', 'expires_at', 'max_uses', 'use_count', 'created_at', 'ttl')
+        read_only_fields = ('code', 'expires_at', 'use_count', 'created_at')
+        extra_kwargs = {'max_uses': {'min_value': 1}}
+
+    def create(self, validated_data):
+        ttl = validated_data.pop('ttl', None)
+        expires_at = timezone.now() + timedelta(seconds=ttl) if ttl else None
+        return WorkspaceInvite.objects.allocate(expires_at=expires_at, **validated_data)
+
+class MetricPointSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100)
+    value = serializers.FloatField()
+    # Defaults to the time of ingestion
+    recorded_at = serializers.DateTimeField(required=False)
+
+class MetricIngestSerializer(serializers.Serializer):
+    points = MetricPointSerializer(many=True, allow_empty=False, max_length=1000)
+
+class MetricQuerySerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=100)
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+    resolution = serializers.ChoiceField(choices=['raw', 'minute', 'hour', 'day'], default='minute')
+    limit = serializers.IntegerField(min_value=1, max_value=10000, default=1000)
+
+    def validate(self, attrs):
+        if attrs.get('start') and attrs.get('end') and attrs['start'] >= attrs['end']:
+            raise serializers.ValidationError("'start' must be before 'end'.")
+        return attrs
+
+class AgentAssignmentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AgentAssignment
+        fields = ('id', 'workspace', 'agent_type', 'name', 'status', 'config', 'created_at', 'updated_at')
+        read_only_fields = ('created_at', 'updated_at')
+
+    def validate_workspace(self, value):
+        if self.instance is not None and value.pk != self.instance.workspace_id:
+            raise serializers.ValidationError("Agents can't be moved between workspaces.")
+        if not WorkspaceAccess.objects.filter(workspace=value, user=self.context['request'].user).exists():
+            raise serializers.ValidationError('Workspace not found.')
+        return value
+
+class AgentStatusUpdateSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=5000)
+    status = serializers.CharField(max_length=20)
+
+class BulkMembershipSerializer(serializers.Serializer):
+    # Users may be given by id, by email, or both
+    user_ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=5000)
+    emails = serializers.ListField(child=serializers.EmailField(), required=False, max_length=5000)
+
+    def validate(self, attrs):
+        if not attrs.get('user_ids') and not attrs.get('emails'):
+            raise serializers.ValidationError("Either 'user_ids' or 'emails' is required.")
+        return attrs
+
+    def resolve_users(self):
+        """Return (user ids found, requested ids/emails with no matching user)."""
+        user_ids = self.validated_data.get('user_ids', [])
+        emails = self.validated_data.get('emails', [])
+        found, not_found = [], []
+        if user_ids:
+            existing = set(User.objects.filter(pk__in=user_ids).values_list('pk', flat=True))
+            found.extend(user_id for user_id in user_ids if user_id in existing)
+            not_found.extend(user_id for user_id in user_ids if user_id not in existing)
+        if emails:
+            by_email = dict(User.objects.filter(email__in=emails).values_list('email', 'pk'))
+            found.extend(by_email[email] for email in emails if email in by_email)
+            not_found.extend(email for email in emails if email not in by_email)
+        return list(dict.fromkeys(found)), not_found
+
 class PasswordResetRequestSerializer(serializers.Serializer):
     email = serializers.EmailField()
 
@@ -61,18 +230,24 @@ class PasswordResetConfirmSerializer(serializers.Serializer):
         attrs['user'] = user
         return attrs
 
-    def save(self):
+    def save(self, password_hash=None):
         password = self.validated_data['password']
         user = self.validated_data['user']
-        user.set_password(password)
+        if password_hash is None:
+            user.set_password(password)
+        else:
+            # Hashed by the caller (the async view's auth pool)
+            user.password = password_hash
         user.save()
         return user
 
 class MFASetupSerializer(serializers.Serializer):
     # This serializer is mainly for response documentation/structure
     secret = serializers.CharField(read_only=True)
-    qr_image = serializers.CharField(read_only=True)
+    qr_svg = serializers.CharField(read_only=True)
+    qr_url = serializers.URLField(read_only=True)
     backup_codes = serializers.ListField(child=serializers.CharField(), read_only=True)
+    expires_in = serializers.IntegerField(read_only=True)
 
 class MFAVerifySerializer(serializers.Serializer):
     code = serializers.CharField(max_length=6, min_length=6)
@@ -86,3 +261,74 @@ class MFALoginSerializer(serializers.Serializer):
         if not attrs.get('code') and not attrs.get('backup_code'):
              raise serializers.ValidationError("Either 'code' or 'backup_code' is required.")
         return attrs
+
+def _fast_converter(field):
+    """
+    Converter equivalent to ``field.to_representation`` for non-null values,
+    or None where the database value is already the representation.
+    """
+    field_type = type(field)
+    if field_type in (serializers.CharField, serializers.PrimaryKeyRelatedField) and getattr(field, 'pk_field', None) is None:
+        return None
+    if field_type is serializers.JSONField and not field.binary:
+        return None
+    if field_type is serializers.UUIDField and field.uuid_format == 'hex_verbose':
+        return str
+    return field.to_representation
+
+class WorkspaceReadSerializer:
+    """
+    Read-only fast path for Workspace list/retrieve.
+
+    Produces exactly what WorkspaceSerializer would, but from ``.values()``
+    rows with one precomputed converter per field instead of DRF's
+    per-field dispatch on model instances. Writes keep using
+    WorkspaceSerializer.
+    """
+
+    def __init__(self, fields=None):
+        template = WorkspaceSerializer(fields=fields)
+        self.include_members = False
+        # (output name, values() column or None for members, converter)
+        self.accessors = []
+        for name, field in template.fields.items():
+            if isinstance(field, serializers.ManyRelatedField):
+                assert field.source == 'members', f'Unsupported many-related field {name}'
+                self.include_members = True
+                self.accessors.append((name, None, None))
+            else:
+                column = Workspace._meta.get_field(field.source).attname
+                self.accessors.append((name, column, _fast_converter(field)))
+
+    def rows(self, queryset, extra_columns=()):
+        """Restrict ``queryset`` to the columns this serializer reads."""
+        columns = ['id'] + [column for _, column, _ in self.accessors if column] + list(extra_columns)
+        return queryset.values(*dict.fromkeys(columns))
+
+    def members_by_workspace(self, workspace_ids):
+        members = {}
+        memberships = (
+            Workspace.members.through.objects
+            .filter(workspace_id__in=workspace_ids)
+            .order_by('workspace_id', 'user_id')
+            .values_list('workspace_id', 'user_id')
+        )
+        for workspace_id, user_id in memberships:
+            members.setdefault(workspace_id, []).append(user_id)
+        return members
+
+    def to_representation(self, rows):
+        rows = list(rows)
+        members = self.members_by_workspace([row['id'] for row in rows]) if self.include_members else {}
+        accessors = self.accessors
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, convert in accessors:
+                if column is None:
+                    item[name] = members.get(row['id'], [])
+                else:
+                    value = row[column]
+                    item[name] = value if convert is None or value is None else convert(value)
+            data.append(item)
+        return data
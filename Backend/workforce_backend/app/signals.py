@@ -0,0 +1,63 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import access
+from .models import Workspace
+from .user_cache import get_user_cache
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_snapshot(sender, instance, **kwargs):
+    # Drop now, and again once the write is visible to other connections, so
+    # a concurrent request can't re-cache the pre-commit row.
+    get_user_cache().invalidate(instance.pk)
+    transaction.on_commit(lambda: get_user_cache().invalidate(instance.pk))
+
+
+@receiver(post_save, sender=Workspace)
+def sync_workspace_owner_access(sender, instance, created, **kwargs):
+    # owner_id is absent when the instance was loaded with it deferred, in
+    # which case it can't have changed.
+    owner_id = instance.__dict__.get('owner_id')
+    if owner_id is None:
+        return
+    if created or owner_id != instance._loaded_owner_id:
+        access.set_owner(instance.pk, owner_id, created=created)
+    instance._loaded_owner_id = owner_id
+
+
+@receiver(m2m_changed, sender=Workspace.members.through)
+def sync_workspace_member_access(sender, instance, action, reverse, pk_set, **kwargs):
+    # Forward: instance is a Workspace and pk_set holds user ids.
+    # Reverse (user.workspaces.add(...)): instance is a User, pk_set holds workspace ids.
+    if action == 'pre_clear' and reverse:
+        # pk_set is None for a clear; note the user's workspaces while the rows still exist
+        instance._cleared_workspace_ids = list(sender.objects.filter(user_id=instance.pk).values_list('workspace_id', flat=True))
+        return
+    if action == 'post_add' and pk_set:
+        if reverse:
+            access.grant_membership((workspace_id, instance.pk) for workspace_id in pk_set)
+        else:
+            access.grant_membership((instance.pk, user_id) for user_id in pk_set)
+    elif action == 'post_remove' and pk_set:
+        if reverse:
+            access.revoke_membership(user_id=instance.pk, workspace_id__in=pk_set)
+        else:
+            access.revoke_membership(workspace_id=instance.pk, user_id__in=pk_set)
+    elif action == 'post_clear':
+        if reverse:
+            access.revoke_membership(user_id=instance.pk)
+            pk_set = instance.__dict__.pop('_cleared_workspace_ids', ())
+        else:
+            access.revoke_membership(workspace_id=instance.pk)
+    else:
+        return
+    if not reverse:
+        access.touch([instance.pk])
+    elif pk_set:
+        access.touch(pk_set)
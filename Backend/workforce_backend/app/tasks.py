@@ -0,0 +1,14 @@
+from celery import shared_task
+
+from . import outbox
+from .models import RevokedToken
+
+
+@shared_task(ignore_result=True)
+def send_outbox():
+    return outbox.drain()
+
+
+@shared_task(ignore_result=True)
+def purge_revoked_tokens():
+    return RevokedToken.objects.purge_expired()
@@ -1,3 +1,1803 @@
-from django.test import TestCase
+import gzip
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+import uuid
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import pyotp
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import BaseBackend
+from django.contrib.auth.hashers import MD5PasswordHasher, make_password
+from django.contrib.auth.signals import user_login_failed
+from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.db import OperationalError, connection
+from django.db.models import Prefetch
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncClient, AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from . import access, fastjson, instrumentation, metrics, mfa, outbox, provisioning, schema, transfer
+from .async_views import AsyncLoginView, AsyncMFALoginConfirmView, AsyncRegisterView
+from .auth_pool import AuthWorkerPool, PoolSaturated, get_auth_pool
+from .benchmarks import compare, measure, percentile
+from .compression import CompressionMiddleware, brotli, negotiate_encoding
+from .fastjson import FastJSONParser, FastJSONRenderer
+from .json_updates import apply_merge_patch
+from .models import (
+    AgentAssignment, ImportCheckpoint, InviteCodeAllocationError, MFABackupCode, OutboxMessage, RevokedToken, Workspace,
+    WorkspaceAccess, WorkspaceInvite, WorkspaceMetricPoint, WorkspaceMetricRollup,
+)
+from .revocation import RevocationStore, get_revocation_store
+from .serializers import LoginSerializer, WorkspaceReadSerializer, WorkspaceSerializer
+from .throttling import LocalSlidingWindow, SharedSlidingWindow, get_rate_limiter, rejection_counts
+from .user_cache import get_user_cache
+
+User = get_user_model()
+
+PASSWORD = 'Str0ng-Passw0rd!'
+
+# PBKDF2 is deliberately slow; tests only care about how often we hash.
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class LoginTests(TestCase):
+    def setUp(self):
+        get_rate_limiter().clear()
+        self.client = APIClient()
+        self.url = reverse('token_obtain_pair')
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password=PASSWORD)
+
+    def login(self, password=PASSWORD):
+        return self.client.post(self.url, {'username': 'alice', 'password': password}, format='json')
+
+    def test_login_returns_token_pair(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'access', 'refresh'})
+
+    def test_login_hashes_password_once(self):
+        with mock.patch.object(MD5PasswordHasher, 'verify', autospec=True, side_effect=MD5PasswordHasher.verify) as verify:
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(verify.call_count, 1)
+
+    def test_mfa_user_gets_temp_token_only(self):
+        self.user.mfa_enabled = True
+        self.user.save()
+
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['mfa_required'])
+        self.assertNotIn('access', response.data)
+        self.assertTrue(AccessToken(response.data['temp_token'])['mfa_pending'])
+
+    def test_bad_credentials_are_rejected(self):
+        response = self.login(password='wrong')
+        self.assertEqual(response.status_code, 401)
+
+    def test_missing_fields_are_rejected(self):
+        response = self.client.post(self.url, {'username': 'alice'}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('password', response.data)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class MFAEnrollmentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password=PASSWORD)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def user_updates(self, queries):
+        return [q['sql'] for q in queries if q['sql'].startswith('UPDATE') and 'app_user' in q['sql']]
+
+    def test_setup_reuses_pending_secret_without_writing(self):
+        with CaptureQueriesContext(connection) as queries:
+            first = self.client.get(reverse('mfa_setup'))
+            second = self.client.get(reverse('mfa_setup'))
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.data['secret'], second.data['secret'])
+        self.assertEqual(first.data['backup_codes'], second.data['backup_codes'])
+        self.assertTrue(first.data['qr_svg'].startswith('<svg'))
+        self.assertEqual(self.user_updates(queries), [])
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.mfa_secret)
+
+    def test_qr_endpoint_serves_svg_and_png(self):
+        self.client.get(reverse('mfa_setup'))
+        svg = self.client.get(reverse('mfa_setup_qr'))
+        self.assertEqual(svg['Content-Type'], 'image/svg+xml')
+        png = self.client.get(reverse('mfa_setup_qr'), {'image_format': 'png'})
+        self.assertEqual(png['Content-Type'], 'image/png')
+        self.assertTrue(png.content.startswith(b'\x89PNG'))
+
+    def test_qr_cache_key_does_not_contain_the_secret(self):
+        secret = pyotp.random_base32()
+        with mock.patch.object(mfa.cache, 'set') as cache_set:
+            mfa.render_qr(self.user, secret)
+        key = cache_set.call_args.args[0]
+        self.assertTrue(key.startswith(f'mfa-qr:{self.user.pk}:'))
+        self.assertNotIn(secret, key)
+
+    def test_qr_endpoint_requires_pending_enrollment(self):
+        response = self.client.get(reverse('mfa_setup_qr'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_verify_persists_enrollment_in_one_update(self):
+        secret = self.client.get(reverse('mfa_setup')).data['secret']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('mfa_verify'), {'code': pyotp.TOTP(secret).now()}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.user_updates(queries)), 1)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.mfa_enabled)
+        self.assertEqual(self.user.mfa_secret, secret)
+        self.assertEqual(self.user.backup_codes.count(), 10)
+        # The enrollment is consumed
+        response = self.client.post(reverse('mfa_verify'), {'code': pyotp.TOTP(secret).now()}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_verify_rejects_wrong_code(self):
+        self.client.get(reverse('mfa_setup'))
+        response = self.client.post(reverse('mfa_verify'), {'code': '000000'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.mfa_enabled)
+
+    def test_verify_without_setup_is_rejected(self):
+        response = self.client.post(reverse('mfa_verify'), {'code': '123456'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class MFABackupCodeTests(TestCase):
+    def setUp(self):
+        get_rate_limiter().clear()
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password=PASSWORD)
+        self.user.mfa_secret = pyotp.random_base32()
+        self.user.mfa_enabled = True
+        self.user.save()
+        MFABackupCode.objects.replace(self.user, ['ABCD2345', 'WXYZ6789'])
+        self.client = APIClient()
+
+    def confirm(self, backup_code):
+        temp_token = self.client.post(reverse('token_obtain_pair'), {'username': 'alice', 'password': PASSWORD}, format='json').data['temp_token']
+        return self.client.post(reverse('mfa_login_confirm'), {'temp_token': temp_token, 'backup_code': backup_code}, format='json')
+
+    def test_codes_are_stored_hashed(self):
+        hashes = list(MFABackupCode.objects.values_list('code_hash', flat=True))
+        self.assertEqual(len(hashes), 2)
+        self.assertNotIn('ABCD2345', hashes)
+
+    def test_backup_code_is_single_use(self):
+        response = self.confirm('abcd 2345')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+        self.assertEqual(self.confirm('ABCD2345').status_code, 400)
+        self.assertEqual(MFABackupCode.objects.filter(user=self.user).count(), 1)
+
+    def test_consume_is_a_single_delete(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(MFABackupCode.objects.consume(self.user, 'WXYZ6789'))
+        self.assertEqual(len(queries), 1)
+        self.assertFalse(MFABackupCode.objects.consume(self.user, 'WXYZ6789'))
+
+    def test_codes_are_scoped_to_their_user(self):
+        other = User.objects.create_user(username='bob', email='bob@example.com', password=PASSWORD)
+        self.assertFalse(MFABackupCode.objects.consume(other, 'ABCD2345'))
+
+    def test_migrated_codes_are_hashed_like_new_ones(self):
+        migration = importlib.import_module('app.migrations.0013_mfabackupcode')
+        code_hash = migration.hash_backup_code(self.user.pk, 'abcd 2345')
+        self.assertTrue(MFABackupCode.objects.filter(user=self.user, code_hash=code_hash).exists())
+
+
+TEST_RATE_LIMITS = {
+    'BACKEND': 'local',
+    'RATES': {
+        'login': {'ip': '5/min', 'username': '2/min'},
+        'mfa_login': {'subject': '1/min'},
+        'register': {'ip': '1/hour'},
+    },
+}
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, AUTH_RATE_LIMITS=TEST_RATE_LIMITS)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        get_rate_limiter().clear()
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password=PASSWORD)
+        self.client = APIClient()
+
+    def login(self, username='alice', ip='10.0.0.1'):
+        return self.client.post(reverse('token_obtain_pair'), {'username': username, 'password': 'wrong'}, format='json', REMOTE_ADDR=ip)
+
+    def test_username_limit_applies_across_ips(self):
+        self.assertEqual(self.login(ip='10.0.0.1').status_code, 401)
+        self.assertEqual(self.login(ip='10.0.0.2').status_code, 401)
+        before = rejection_counts().get(('login', 'username'), 0)
+        response = self.login(username='ALICE', ip='10.0.0.3')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(rejection_counts()[('login', 'username')], before + 1)
+
+    def test_ip_limit_applies_across_usernames(self):
+        for index in range(5):
+            self.assertEqual(self.login(username=f'user{index}').status_code, 401)
+        self.assertEqual(self.login(username='someone-else').status_code, 429)
+        self.assertEqual(self.login(username='someone-else', ip='10.0.0.9').status_code, 401)
+
+    def test_rejected_before_password_hashing(self):
+        self.login()
+        self.login()
+        with mock.patch.object(MD5PasswordHasher, 'verify', autospec=True) as verify:
+            self.assertEqual(self.login().status_code, 429)
+        verify.assert_not_called()
+
+    def test_mfa_login_is_limited_per_token_subject(self):
+        self.user.mfa_secret = pyotp.random_base32()
+        self.user.mfa_enabled = True
+        self.user.save()
+        temp_token = str(AccessToken.for_user(self.user))
+        url = reverse('mfa_login_confirm')
+        self.assertEqual(self.client.post(url, {'temp_token': temp_token, 'code': '000000'}, format='json').status_code, 400)
+        response = self.client.post(url, {'temp_token': temp_token, 'code': '000000'}, format='json', REMOTE_ADDR='10.0.0.7')
+        self.assertEqual(response.status_code, 429)
+
+    def test_register_is_limited_per_ip(self):
+        url = reverse('auth_register')
+        self.client.post(url, {}, format='json')
+        self.assertEqual(self.client.post(url, {}, format='json').status_code, 429)
+
+    def test_forwarded_for_is_ignored_without_trusted_proxies(self):
+        for index in range(5):
+            self.client.post(reverse('token_obtain_pair'), {'username': f'user{index}', 'password': 'x'}, format='json', HTTP_X_FORWARDED_FOR=f'203.0.113.{index}')
+        response = self.client.post(reverse('token_obtain_pair'), {'username': 'other', 'password': 'x'}, format='json', HTTP_X_FORWARDED_FOR='203.0.113.99')
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(AUTH_RATE_LIMITS={**TEST_RATE_LIMITS, 'NUM_PROXIES': 1})
+    def test_trusted_proxy_position_in_forwarded_for_is_the_client(self):
+        def login(username, forwarded_for):
+            return self.client.post(reverse('token_obtain_pair'), {'username': username, 'password': 'x'}, format='json', HTTP_X_FORWARDED_FOR=forwarded_for)
+        for index in range(5):
+            login(f'user{index}', f'198.51.100.{index}, 10.0.0.50')
+        # The spoofable leftmost entry changes, the proxy-appended one doesn't
+        self.assertEqual(login('user5', '198.51.100.77, 10.0.0.50').status_code, 429)
+        self.assertEqual(login('user6', '10.0.0.50, 10.0.0.51').status_code, 401)
+
+    def test_local_window_evicts_within_one_key_kind(self):
+        window = LocalSlidingWindow(max_keys=2)
+        self.assertEqual(window.hit('login:username:alice', 1, 60, partition='login:username'), (True, 0))
+        for index in range(5):
+            window.hit(f'login:ip:10.0.0.{index}', 1, 60, partition='login:ip')
+        self.assertFalse(window.hit('login:username:alice', 1, 60, partition='login:username')[0])
+
+    def test_local_window_slides(self):
+        window = LocalSlidingWindow(max_keys=10)
+        with mock.patch('app.throttling.time.monotonic', return_value=100.0):
+            self.assertEqual(window.hit('k', 1, 60), (True, 0))
+            self.assertEqual(window.hit('k', 1, 60), (False, 60.0))
+        with mock.patch('app.throttling.time.monotonic', return_value=160.0):
+            self.assertEqual(window.hit('k', 1, 60), (True, 0))
+
+    def test_shared_window_counts_across_instances(self):
+        cache.clear()
+        first, second = SharedSlidingWindow('default', 'test-rate'), SharedSlidingWindow('default', 'test-rate')
+        with mock.patch('app.throttling.time.time', return_value=6000.0):
+            self.assertTrue(first.hit('k', 2, 60)[0])
+            self.assertTrue(second.hit('k', 2, 60)[0])
+            allowed, retry_after = first.hit('k', 2, 60)
+        self.assertFalse(allowed)
+        self.assertGreater(retry_after, 0)
+
+
+class EmailBackend(BaseBackend):
+    # Signs users in by email address, for the backend-dispatch test
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = User.objects.filter(email=username).first()
+        return user if user is not None and user.check_password(password) else None
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AsyncAuthViewTests(TestCase):
+    def setUp(self):
+        get_rate_limiter().clear()
+        self.factory = AsyncRequestFactory()
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password=PASSWORD)
+
+    async def post(self, view, data):
+        request = self.factory.post('/', data, content_type='application/json')
+        return await view.as_view()(request)
+
+    async def test_login_hashes_on_the_auth_pool(self):
+        completed = get_auth_pool().stats()['completed']
+        response = await self.post(AsyncLoginView, {'username': 'alice', 'password': PASSWORD})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'access', 'refresh'})
+        self.assertEqual(get_auth_pool().stats()['completed'], completed + 1)
+
+    async def test_login_rejects_bad_credentials_like_sync_view(self):
+        response = await self.post(AsyncLoginView, {'username': 'alice', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+        response = await self.post(AsyncLoginView, {'username': 'nobody', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+        response = await self.post(AsyncLoginView, {'username': 'alice'})
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('password', response.data)
+
+    async def test_failed_login_sends_user_login_failed(self):
+        failures = []
+        receiver = lambda sender, credentials, **kwargs: failures.append(credentials)
+        user_login_failed.connect(receiver)
+        try:
+            await self.post(AsyncLoginView, {'username': 'alice', 'password': 'wrong'})
+        finally:
+            user_login_failed.disconnect(receiver)
+        self.assertEqual(failures, [{'username': 'alice', 'password': '********************'}])
+
+    async def test_login_goes_through_configured_backends(self):
+        credentials = {'username': 'alice@example.com', 'password': PASSWORD}
+        self.assertEqual((await self.post(AsyncLoginView, credentials)).status_code, 401)
+        with self.settings(AUTHENTICATION_BACKENDS=['app.tests.EmailBackend']):
+            self.assertEqual((await self.post(AsyncLoginView, credentials)).status_code, 200)
+
+    async def test_token_errors_are_401(self):
+        with mock.patch.object(LoginSerializer, 'token_data', side_effect=TokenError('Token is blacklisted')):
+            response = await self.post(AsyncLoginView, {'username': 'alice', 'password': PASSWORD})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_register_stores_pool_hashed_password(self):
+        response = await self.post(AsyncRegisterView, {'username': 'bob', 'email': 'bob@example.com', 'password': 'hunter22'})
+        self.assertEqual(response.status_code, 201)
+        bob = await User.objects.aget(username='bob')
+        self.assertTrue(bob.check_password('hunter22'))
+        response = await self.post(AsyncRegisterView, {'username': 'bob', 'email': 'bob@example.com', 'password': 'hunter22'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_mfa_login_verifies_totp_on_the_pool(self):
+        self.user.mfa_secret = pyotp.random_base32()
+        self.user.mfa_enabled = True
+        await self.user.asave()
+        temp_token = (await self.post(AsyncLoginView, {'username': 'alice', 'password': PASSWORD})).data['temp_token']
+        code = pyotp.TOTP(self.user.mfa_secret).now()
+        response = await self.post(AsyncMFALoginConfirmView, {'temp_token': temp_token, 'code': code})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('access', response.data)
+
+
+class AuthWorkerPoolTests(TestCase):
+    def test_full_pool_rejects_and_reports_queue_depth(self):
+        pool = AuthWorkerPool('thread', max_workers=1, max_queue=1)
+        release = threading.Event()
+        try:
+            running = pool.submit(release.wait)
+            queued = pool.submit(release.wait)
+            self.assertEqual(pool.stats()['queue_depth'], 1)
+            with self.assertRaises(PoolSaturated):
+                pool.submit(release.wait)
+            self.assertEqual(pool.stats()['rejected'], 1)
+        finally:
+            release.set()
+        running.result(timeout=5)
+        queued.result(timeout=5)
+        self.assertEqual(pool.stats()['completed'], 2)
+        pool.shutdown()
+
+    def test_process_pool_spawns_its_workers(self):
+        pool = AuthWorkerPool('process', max_workers=1, max_queue=0)
+        try:
+            self.assertEqual(pool.submit(make_password, 'secret', None, MD5PasswordHasher()).result(timeout=60)[:4], 'md5$')
+            self.assertEqual(pool.executor._mp_context.get_start_method(), 'spawn')
+        finally:
+            pool.shutdown()
+
+
+@override_settings(TOKEN_REVOCATION={'FLUSH_INTERVAL': 0, 'BLOOM_CAPACITY': 1000})
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password=None)
+        self.client = APIClient()
+
+    def refresh(self, token):
+        return self.client.post(reverse('token_refresh'), {'refresh': str(token)}, format='json')
+
+    def test_rotated_refresh_token_is_rejected(self):
+        token = RefreshToken.for_user(self.user)
+        response = self.refresh(token)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(RevokedToken.objects.filter(jti=token['jti']).exists())
+        self.assertEqual(self.refresh(token).status_code, 401)
+        # The rotated-in token still works
+        self.assertEqual(self.refresh(response.data['refresh']).status_code, 200)
+
+    def test_bloom_miss_skips_the_database(self):
+        store = get_revocation_store()
+        store.sync(force=True)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(store.is_revoked('never-revoked'))
+        self.assertEqual(len(queries), 0)
+
+    def test_revocations_are_inserted_in_batches(self):
+        store = RevocationStore({'BATCH_SIZE': 3, 'FLUSH_INTERVAL': 60, 'SYNC_INTERVAL': 60, 'BLOOM_CAPACITY': 1000, 'BLOOM_ERROR_RATE': 0.01})
+        expires_at = timezone.now() + timedelta(days=1)
+        store.revoke('a', expires_at)
+        store.revoke('b', expires_at)
+        self.assertEqual(RevokedToken.objects.count(), 0)
+        self.assertTrue(store.is_revoked('a'))
+        with CaptureQueriesContext(connection) as queries:
+            store.revoke('c', expires_at)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(RevokedToken.objects.count(), 3)
+
+    def test_sync_picks_up_other_processes_revocations(self):
+        store = get_revocation_store()
+        store.sync(force=True)
+        RevokedToken.objects.create(jti='elsewhere', expires_at=timezone.now() + timedelta(days=1))
+        store.sync(force=True)
+        self.assertTrue(store.is_revoked('elsewhere'))
+
+    def test_batch_being_flushed_is_still_revoked(self):
+        store = RevocationStore({'BATCH_SIZE': 3, 'FLUSH_INTERVAL': 60, 'SYNC_INTERVAL': 60, 'BLOOM_CAPACITY': 1000, 'BLOOM_ERROR_RATE': 0.01})
+        store.revoke('mid-flush', timezone.now() + timedelta(days=1))
+        seen = []
+        original = RevokedToken.objects.bulk_create
+
+        def bulk_create(*args, **kwargs):
+            # Another request checks the token before the INSERT is done
+            seen.append(store.is_revoked('mid-flush'))
+            return original(*args, **kwargs)
+
+        with mock.patch.object(RevokedToken.objects, 'bulk_create', side_effect=bulk_create):
+            store.flush()
+        self.assertEqual(seen, [True])
+
+    def test_background_flush_closes_its_connection(self):
+        store = RevocationStore({'BATCH_SIZE': 3, 'FLUSH_INTERVAL': 60, 'SYNC_INTERVAL': 60, 'BLOOM_CAPACITY': 1000, 'BLOOM_ERROR_RATE': 0.01})
+        # The SQLite test database ignores close(), so check it is asked for
+        with mock.patch.object(store, 'flush', side_effect=RuntimeError), mock.patch('app.revocation.connection') as thread_connection:
+            with self.assertLogs('app.revocation', 'ERROR'):
+                store._flush_in_background()
+        thread_connection.close.assert_called_once_with()
+
+    def test_purge_deletes_only_expired_rows(self):
+        now = timezone.now()
+        RevokedToken.objects.create(jti='old', expires_at=now - timedelta(minutes=1))
+        RevokedToken.objects.create(jti='live', expires_at=now + timedelta(days=1))
+        self.assertEqual(RevokedToken.objects.purge_expired(batch_size=1), 1)
+        self.assertEqual(list(RevokedToken.objects.values_list('jti', flat=True)), ['live'])
+
+
+class DatabaseHealthTests(TestCase):
+    def test_health_reports_ok_without_pool_on_sqlite(self):
+        response = APIClient().get(reverse('health_db'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'ok')
+        self.assertEqual(response.data['vendor'], connection.vendor)
+        self.assertIsNone(response.data['pool'])
+
+    def test_health_reports_unavailable_database(self):
+        with mock.patch('app.db.ping', side_effect=OperationalError('connection refused')):
+            response = APIClient().get(reverse('health_db'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.data['status'], 'unavailable')
+
+    def test_sqlite_waits_on_locks_instead_of_failing(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite tuning only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertGreaterEqual(cursor.fetchone()[0], 1000)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='ops', email='ops@example.com', password=None, is_staff=True)
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password=None)
+        Workspace.objects.create(name='Acme', owner=self.user)
+        self.client = APIClient()
+
+    def test_records_latency_queries_and_size_per_url_name(self):
+        labels = ('workspace-list', 'GET', '200')
+        before = instrumentation.REQUESTS.value(labels)
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('workspace-list'))
+        self.assertEqual(instrumentation.REQUESTS.value(labels), before + 1)
+
+        self.client.force_authenticate(self.staff)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('http_requests_total{view="workspace-list",method="GET",status="200"}', body)
+        self.assertIn('http_request_duration_seconds_bucket{view="workspace-list",method="GET",le="+Inf"}', body)
+        self.assertIn('http_request_db_queries_count{view="workspace-list"}', body)
+        self.assertIn('http_response_size_bytes_sum{view="workspace-list"}', body)
+        self.assertGreater(len(response.content), 0)
+
+    async def test_counts_queries_of_sync_views_under_asgi(self):
+        labels = ('workspace-list',)
+        before = instrumentation.QUERY_COUNT._values.get(labels, [0.0])[-1]
+        response = await AsyncClient().get(reverse('workspace-list'), headers={'Authorization': f'Bearer {AccessToken.for_user(self.user)}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(instrumentation.QUERY_COUNT._values[labels][-1], before)
+
+    def test_unknown_methods_share_one_label(self):
+        labels = ('workspace-list', 'OTHER', '405')
+        before = instrumentation.REQUESTS.value(labels)
+        self.client.force_authenticate(self.user)
+        for method in ('FOO', 'BAR'):
+            self.client.generic(method, reverse('workspace-list'))
+        self.assertEqual(instrumentation.REQUESTS.value(labels), before + 2)
+        self.assertEqual(instrumentation.REQUESTS.value(('workspace-list', 'FOO', '405')), 0)
+
+    def test_metrics_require_staff_or_scrape_token(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.client.force_authenticate(None)
+        with override_settings(METRICS_TOKEN='scrape-secret'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    @override_settings(REQUEST_METRICS={'SLOW_REQUEST_THRESHOLD': 0, 'SLOW_TOP_QUERIES': 2})
+    def test_slow_requests_log_their_top_queries(self):
+        self.client.force_authenticate(self.user)
+        with self.assertLogs('app.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('workspace-list'))
+        self.assertIn('workspace-list', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        get_user_cache().clear()
+        self.user = User.objects.create_user(username='bob', email='bob@example.com', password=PASSWORD)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.url = reverse('workspace-list')
+
+    def user_queries(self, captured):
+        return [query['sql'] for query in captured if 'FROM "app_user"' in query['sql']]
+
+    def test_warm_request_does_not_query_user(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.user_queries(captured), [])
+
+    def test_user_save_invalidates_snapshot(self):
+        self.client.get(self.url)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_snapshots_leave_out_credentials(self):
+        self.user.mfa_secret = 'JBSWY3DPEHPK3PXP'
+        self.user.save()
+        with self.settings(USER_SNAPSHOT_CACHE={'SHARED_CACHE_ALIAS': 'default'}):
+            cache = get_user_cache()
+            cache.get_user(self.user.pk)
+            for tier in cache.tiers:
+                snapshot = tier.get(cache.key(self.user.pk))
+                self.assertNotIn('password', snapshot)
+                self.assertNotIn('mfa_secret', snapshot)
+
+            # Deferred, so still readable where they are verified
+            user = cache.get_user(self.user.pk)
+            self.assertTrue(user.check_password(PASSWORD))
+            self.assertEqual(user.mfa_secret, 'JBSWY3DPEHPK3PXP')
+            cache.invalidate(self.user.pk)
+
+    def test_shared_tier_populates_local_tier(self):
+        with self.settings(USER_SNAPSHOT_CACHE={'SHARED_CACHE_ALIAS': 'default'}):
+            cache = get_user_cache()
+            cache.get_user(self.user.pk)
+            local, shared = cache.tiers
+            local.clear()
+
+            with CaptureQueriesContext(connection) as captured:
+                user = cache.get_user(self.user.pk)
+            self.assertEqual(len(captured), 0)
+            self.assertEqual(user.username, 'bob')
+            self.assertIsNotNone(local.get(cache.key(self.user.pk)))
+            cache.invalidate(self.user.pk)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class WorkspaceAccessTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password=PASSWORD)
+        self.member = User.objects.create_user(username='member', email='member@example.com', password=PASSWORD)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def create_workspace(self, name='Acme'):
+        response = self.client.post(reverse('workspace-list'), {'name': name}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Workspace.objects.get(pk=response.data['id'])
+
+    def test_owner_who_is_member_is_listed_once(self):
+        workspace = self.create_workspace()
+
+        response = self.client.get(reverse('workspace-list'))
+        self.assertEqual([row['id'] for row in response.data['results']], [str(workspace.id)])
+        self.assertEqual(self.client.get(reverse('workspace-detail', args=[workspace.id])).status_code, 200)
+
+    def test_join_and_remove_track_member_access(self):
+        workspace = self.create_workspace()
+        self.client.force_authenticate(self.member)
+
+        response = self.client.post(reverse('workspace-join'), {'invite_code': workspace.invite_code}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(reverse('workspace-detail', args=[workspace.id])).status_code, 200)
+
+        self.member.workspaces.remove(workspace)
+        self.assertEqual(self.client.get(reverse('workspace-detail', args=[workspace.id])).status_code, 404)
+
+    def test_owner_keeps_access_after_leaving_members(self):
+        workspace = self.create_workspace()
+        workspace.members.clear()
+
+        self.assertTrue(WorkspaceAccess.objects.filter(workspace=workspace, user=self.owner, is_owner=True).exists())
+        self.assertEqual(self.client.get(reverse('workspace-detail', args=[workspace.id])).status_code, 200)
+
+    def test_clearing_a_users_workspaces_bumps_their_updated_at(self):
+        workspaces = [self.create_workspace(name) for name in ('Acme', 'Globex')]
+        for workspace in workspaces:
+            workspace.members.add(self.member)
+        Workspace.objects.update(updated_at=timezone.now() - timedelta(days=1))
+        before = dict(Workspace.objects.values_list('pk', 'updated_at'))
+
+        self.member.workspaces.clear()
+
+        for pk, updated_at in Workspace.objects.values_list('pk', 'updated_at'):
+            self.assertGreater(updated_at, before[pk])
+        self.assertFalse(WorkspaceAccess.objects.filter(user=self.member).exists())
+
+    def test_owner_change_moves_access(self):
+        workspace = Workspace.objects.create(name='Handover', owner=self.owner)
+        workspace = Workspace.objects.get(pk=workspace.pk)
+        workspace.owner = self.member
+        workspace.save()
+
+        self.assertEqual(
+            list(WorkspaceAccess.objects.filter(workspace=workspace).values_list('user__username', flat=True)),
+            ['member'],
+        )
+
+
+class WorkspaceListTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='lister', email='lister@example.com', password=None)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('workspace-list')
+
+    def test_cursor_pages_cover_every_workspace_once(self):
+        workspaces = [Workspace.objects.create(name=f'W{i}', owner=self.user) for i in range(7)]
+        # Same updated_at everywhere forces the id tie-breaker
+        Workspace.objects.update(updated_at=workspaces[0].updated_at)
+
+        seen, url = [], f'{self.url}?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 3)
+            seen.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(sorted(seen), sorted(str(workspace.id) for workspace in workspaces))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_invalid_cursor_is_404(self):
+        self.assertEqual(self.client.get(f'{self.url}?cursor=garbage').status_code, 404)
+
+    def test_fields_selects_serializer_fields_and_columns(self):
+        Workspace.objects.create(name='Sparse', owner=self.user, metrics={'big': 'blob'})
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(f'{self.url}?fields=id,name')
+        self.assertEqual(list(response.data['results'][0]), ['id', 'name'])
+        # Leaving out the ETag validator, an aggregate over timestamps
+        workspace_sql = [query['sql'] for query in captured if 'FROM "app_workspace"' in query['sql'] and 'MAX(' not in query['sql']]
+        self.assertEqual(len(workspace_sql), 1)
+        self.assertNotIn('"metrics"', workspace_sql[0])
+
+    def test_omit_drops_fields(self):
+        workspace = Workspace.objects.create(name='Omit', owner=self.user)
+
+        response = self.client.get(reverse('workspace-detail', args=[workspace.id]), {'omit': 'metrics,active_agents'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('metrics', response.data)
+        self.assertIn('name', response.data)
+
+    def test_unknown_field_is_rejected(self):
+        self.assertEqual(self.client.get(f'{self.url}?fields=nope').status_code, 400)
+
+    def test_members_are_prefetched(self):
+        for i in range(3):
+            workspace = Workspace.objects.create(name=f'W{i}', owner=self.user)
+            workspace.members.add(self.user)
+
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(self.url)
+        # Validator, page rows, members
+        self.assertEqual(len(captured), 3)
+
+
+class WorkspaceReadSerializerTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='reader', email='reader@example.com', password=None)
+        self.others = [User.objects.create_user(username=f'm{i}', email=f'm{i}@example.com', password=None) for i in range(3)]
+        self.full = Workspace.objects.create(
+            name='Ünïcode “quoted” \\ name',
+            owner=self.owner,
+            industry='tech',
+            company_size='51-200',
+            timezone='Europe/Berlin',
+            currency='EUR',
+            active_agents=[{'id': 'a1', 'status': 'running', 'tags': ['x', None]}],
+            metrics={'cpu': 0.5, 'nested': {'list': [1, 2.25, True, None]}},
+        )
+        self.full.members.add(self.owner, *self.others)
+        self.sparse = Workspace.objects.create(name='Sparse', owner=self.owner, active_agents=None, metrics=None)
+
+    def render_both(self, fields=None):
+        instances = Workspace.objects.filter(pk__in=[self.full.pk, self.sparse.pk]).order_by('name').prefetch_related(
+            Prefetch('members', queryset=User.objects.order_by('id'))
+        )
+        reader = WorkspaceReadSerializer(fields=fields)
+        rows = reader.rows(Workspace.objects.filter(pk__in=[self.full.pk, self.sparse.pk]).order_by('name'))
+        return (
+            JSONRenderer().render(WorkspaceSerializer(instances, many=True, fields=fields).data),
+            JSONRenderer().render(reader.to_representation(rows)),
+        )
+
+    def test_output_is_byte_identical(self):
+        expected, actual = self.render_both()
+        self.assertEqual(actual, expected)
+
+    def test_sparse_output_is_byte_identical(self):
+        expected, actual = self.render_both(fields=['updated_at', 'name', 'members', 'owner'])
+        self.assertEqual(actual, expected)
+
+    def test_api_detail_matches_model_serializer(self):
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        response = client.get(reverse('workspace-detail', args=[self.full.pk]))
+
+        instance = Workspace.objects.prefetch_related(Prefetch('members', queryset=User.objects.order_by('id'))).get(pk=self.full.pk)
+        self.assertEqual(response.content, JSONRenderer().render(WorkspaceSerializer(instance).data))
+
+
+class WorkspaceMembershipTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='boss', email='boss@example.com', password=None)
+        self.users = [User.objects.create_user(username=f'u{i}', email=f'u{i}@example.com', password=None) for i in range(5)]
+        self.workspace = Workspace.objects.create(name='Team', owner=self.owner)
+        self.workspace.members.add(self.owner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def test_join_is_idempotent(self):
+        self.client.force_authenticate(self.users[0])
+        url = reverse('workspace-join')
+        first = self.client.post(url, {'invite_code': self.workspace.invite_code}, format='json')
+        second = self.client.post(url, {'invite_code': self.workspace.invite_code}, format='json')
+
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual(second.data['detail'], 'Already a member')
+        self.assertEqual(self.workspace.members.filter(pk=self.users[0].pk).count(), 1)
+        self.assertTrue(WorkspaceAccess.objects.filter(workspace=self.workspace, user=self.users[0], is_member=True).exists())
+
+    def test_join_does_not_load_members(self):
+        self.client.force_authenticate(self.users[0])
+        with CaptureQueriesContext(connection) as captured:
+            self.client.post(reverse('workspace-join'), {'invite_code': self.workspace.invite_code}, format='json')
+        self.assertFalse([query['sql'] for query in captured if 'FROM "app_user"' in query['sql']])
+
+    def test_bulk_add_and_remove(self):
+        url = reverse('workspace-add-members', args=[self.workspace.pk])
+        response = self.client.post(url, {
+            'user_ids': [self.users[0].pk, self.users[1].pk, self.owner.pk, 999999],
+            'emails': ['u2@example.com', 'nobody@example.com'],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['added'], [self.users[0].pk, self.users[1].pk, self.users[2].pk])
+        self.assertEqual(response.data['already_members'], [self.owner.pk])
+        self.assertEqual(response.data['not_found'], [999999, 'nobody@example.com'])
+        self.assertEqual(WorkspaceAccess.objects.filter(workspace=self.workspace).count(), 4)
+
+        url = reverse('workspace-remove-members', args=[self.workspace.pk])
+        response = self.client.post(url, {'user_ids': [self.users[0].pk, self.users[3].pk, self.owner.pk]}, format='json')
+        self.assertEqual(response.data['removed'], [self.users[0].pk, self.owner.pk])
+        self.assertEqual(response.data['not_members'], [self.users[3].pk])
+        # The owner keeps access through ownership
+        self.assertEqual(
+            set(WorkspaceAccess.objects.filter(workspace=self.workspace).values_list('user_id', flat=True)),
+            {self.owner.pk, self.users[1].pk, self.users[2].pk},
+        )
+
+    def test_only_owner_manages_members(self):
+        self.workspace.members.add(self.users[0])
+        self.client.force_authenticate(self.users[0])
+        url = reverse('workspace-add-members', args=[self.workspace.pk])
+        self.assertEqual(self.client.post(url, {'user_ids': [self.users[1].pk]}, format='json').status_code, 403)
+
+
+class WorkspaceInviteTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='host', email='host@example.com', password=None)
+        self.guests = [User.objects.create_user(username=f'g{i}', email=f'g{i}@example.com', password=None) for i in range(3)]
+        self.workspace = Workspace.objects.create(name='Party', owner=self.owner)
+        self.client = APIClient()
+
+    def join(self, user, code):
+        self.client.force_authenticate(user)
+        return self.client.post(reverse('workspace-join'), {'invite_code': code}, format='json')
+
+    def test_workspace_gets_default_invite(self):
+        invite = WorkspaceInvite.objects.get(workspace=self.workspace)
+        self.assertEqual(invite.code, self.workspace.invite_code)
+        self.assertIsNone(invite.expires_at)
+        self.assertEqual(self.join(self.guests[0], invite.code).status_code, 200)
+
+    def test_allocation_retries_on_collision(self):
+        codes = iter([self.workspace.invite_code, 'FRESHCODE2'])
+        with mock.patch('app.models.generate_invite_code', side_effect=lambda: next(codes)):
+            invite = WorkspaceInvite.objects.allocate(self.workspace)
+        self.assertEqual(invite.code, 'FRESHCODE2')
+
+    def test_allocation_gives_up(self):
+        with mock.patch('app.models.generate_invite_code', return_value=self.workspace.invite_code):
+            with self.assertRaises(InviteCodeAllocationError):
+                WorkspaceInvite.objects.allocate(self.workspace)
+
+    def test_max_uses_is_enforced(self):
+        self.client.force_authenticate(self.owner)
+        response = self.client.post(reverse('workspace-invites', args=[self.workspace.pk]), {'max_uses': 2}, format='json')
+        self.assertEqual(response.status_code, 201)
+        code = response.data['code']
+
+        self.assertEqual(self.join(self.guests[0], code).status_code, 200)
+        # Already-member joins don't consume a use
+        self.assertEqual(self.join(self.guests[0], code).status_code, 200)
+        self.assertEqual(self.join(self.guests[1], code).status_code, 200)
+        self.assertEqual(self.join(self.guests[2], code).status_code, 410)
+        self.assertEqual(WorkspaceInvite.objects.get(code=code).use_count, 2)
+
+    def test_expired_invites_are_rejected_and_purged(self):
+        expired = WorkspaceInvite.objects.allocate(self.workspace, expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.join(self.guests[0], expired.code).status_code, 410)
+
+        self.assertEqual(WorkspaceInvite.objects.purge_expired(batch_size=1), 1)
+        self.assertFalse(WorkspaceInvite.objects.filter(pk=expired.pk).exists())
+        self.assertTrue(WorkspaceInvite.objects.filter(code=self.workspace.invite_code).exists())
+
+    def test_only_owner_creates_invites(self):
+        self.client.force_authenticate(self.guests[0])
+        self.workspace.members.add(self.guests[0])
+        response = self.client.post(reverse('workspace-invites', args=[self.workspace.pk]), {}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class WorkspaceMetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='agent', email='agent@example.com', password=None)
+        self.workspace = Workspace.objects.create(name='Fleet', owner=self.user, metrics={'legacy': 'kept'})
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('workspace-metrics', args=[self.workspace.pk])
+        self.base = datetime(2026, 3, 1, 12, 0, tzinfo=dt_timezone.utc)
+
+    def post(self, *points):
+        return self.client.post(self.url, {'points': [
+            {'name': name, 'value': value, 'recorded_at': (self.base + timedelta(seconds=offset)).isoformat()}
+            for name, value, offset in points
+        ]}, format='json')
+
+    def test_ingest_appends_and_rolls_up_incrementally(self):
+        self.assertEqual(self.post(('cpu', 1.0, 0), ('cpu', 3.0, 10)).status_code, 201)
+        self.assertEqual(self.post(('cpu', 5.0, 20), ('cpu', 2.0, 90)).status_code, 201)
+
+        self.assertEqual(WorkspaceMetricPoint.objects.filter(workspace=self.workspace).count(), 4)
+        minute = WorkspaceMetricRollup.objects.get(workspace=self.workspace, resolution='minute', bucket_start=self.base)
+        self.assertEqual((minute.count, minute.total, minute.minimum, minute.maximum), (3, 9.0, 1.0, 5.0))
+        hour = WorkspaceMetricRollup.objects.get(workspace=self.workspace, resolution='hour')
+        self.assertEqual((hour.count, hour.total, hour.minimum, hour.maximum), (4, 11.0, 1.0, 5.0))
+
+    def test_snapshot_is_merged_without_touching_updated_at(self):
+        updated_at = self.workspace.updated_at
+        self.post(('cpu', 1.0, 0), ('cpu', 3.0, 10), ('mem', 7.0, 5))
+
+        self.workspace.refresh_from_db()
+        self.assertEqual(self.workspace.metrics, {'legacy': 'kept', 'cpu': 3.0, 'mem': 7.0})
+        self.assertEqual(self.workspace.updated_at, updated_at)
+
+    def test_older_points_do_not_overwrite_newer_snapshot_values(self):
+        self.post(('cpu', 5.0, 60), ('mem', 1.0, 60))
+        # A backfill from before the stored values, plus one newer mem sample
+        self.post(('cpu', 9.0, 0), ('mem', 2.0, 30), ('mem', 3.0, 120))
+
+        self.workspace.refresh_from_db()
+        self.assertEqual(self.workspace.metrics, {'legacy': 'kept', 'cpu': 5.0, 'mem': 3.0})
+        self.assertNotIn('metrics_recorded_at', self.client.get(reverse('workspace-detail', args=[self.workspace.pk])).data)
+
+    def test_range_and_summary_queries(self):
+        self.post(('cpu', 1.0, 0), ('cpu', 3.0, 10), ('cpu', 2.0, 90), ('mem', 9.0, 0))
+
+        response = self.client.get(self.url, {'name': 'cpu', 'resolution': 'minute'})
+        self.assertEqual([row['count'] for row in response.data['results']], [2, 1])
+
+        response = self.client.get(self.url, {'name': 'cpu', 'resolution': 'raw', 'start': (self.base + timedelta(seconds=5)).isoformat()})
+        self.assertEqual([row['value'] for row in response.data['results']], [3.0, 2.0])
+
+        response = self.client.get(reverse('workspace-metrics-summary', args=[self.workspace.pk]), {'name': 'cpu', 'resolution': 'hour'})
+        self.assertEqual((response.data['count'], response.data['min'], response.data['max'], response.data['avg']), (3, 1.0, 3.0, 2.0))
+
+    def test_outsiders_cannot_post(self):
+        outsider = User.objects.create_user(username='outsider', email='outsider@example.com', password=None)
+        self.client.force_authenticate(outsider)
+        self.assertEqual(self.post(('cpu', 1.0, 0)).status_code, 404)
+
+
+class WorkspaceJSONPatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='editor', email='editor@example.com', password=None)
+        self.workspace = Workspace.objects.create(
+            name='Docs', owner=self.user,
+            metrics={'cpu': 1, 'nested': {'keep': True, 'drop': 1}},
+            active_agents=[{'id': 'a1'}],
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('workspace-patch-json', args=[self.workspace.pk])
+        self.detail_url = reverse('workspace-detail', args=[self.workspace.pk])
+
+    def etag(self):
+        return self.client.get(self.detail_url)['ETag']
+
+    def test_merge_patch_is_applied_in_database(self):
+        response = self.client.patch(
+            self.url, json.dumps({'metrics': {'cpu': 2, 'nested': {'drop': None, 'new': [1]}}}),
+            content_type='application/merge-patch+json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['metrics'], {'cpu': 2, 'nested': {'keep': True, 'new': [1]}})
+        self.assertEqual(response['ETag'], self.etag())
+
+    def test_python_merge_patch_matches_rfc7396(self):
+        self.assertEqual(apply_merge_patch({'a': 'b', 'c': {'d': 'e', 'f': 'g'}}, {'a': 'z', 'c': {'f': None}}), {'a': 'z', 'c': {'d': 'e'}})
+        self.assertEqual(apply_merge_patch(['a'], {'a': 'b'}), {'a': 'b'})
+        self.assertEqual(apply_merge_patch({'a': 'b'}, ['c']), ['c'])
+
+    def test_json_patch_operations(self):
+        operations = [
+            {'op': 'test', 'path': '/metrics/cpu', 'value': 1},
+            {'op': 'add', 'path': '/metrics/tags', 'value': ['a']},
+            {'op': 'add', 'path': '/metrics/tags/-', 'value': 'b'},
+            {'op': 'remove', 'path': '/metrics/nested/drop'},
+            {'op': 'move', 'from': '/metrics/cpu', 'path': '/metrics/load'},
+        ]
+        response = self.client.patch(self.url, json.dumps(operations), content_type='application/json-patch+json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['metrics'], {'nested': {'keep': True}, 'tags': ['a', 'b'], 'load': 1})
+
+    def test_failed_json_patch_changes_nothing(self):
+        operations = [{'op': 'replace', 'path': '/metrics/cpu', 'value': 5}, {'op': 'test', 'path': '/metrics/cpu', 'value': 1}]
+        response = self.client.patch(self.url, json.dumps(operations), content_type='application/json-patch+json')
+        self.assertEqual(response.status_code, 400)
+        self.workspace.refresh_from_db()
+        self.assertEqual(self.workspace.metrics['cpu'], 1)
+
+    def test_patched_values_must_keep_their_type(self):
+        operations = [{'op': 'replace', 'path': '/metrics', 'value': [1]}]
+        response = self.client.patch(self.url, json.dumps(operations), content_type='application/json-patch+json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('metrics', response.data)
+        response = self.client.patch(self.url, json.dumps({'metrics': 'cpu'}), content_type='application/merge-patch+json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.patch(self.detail_url, {'metrics': [1]}, format='json').status_code, 400)
+        self.workspace.refresh_from_db()
+        self.assertEqual(self.workspace.metrics['cpu'], 1)
+
+    def test_only_json_fields_can_be_patched(self):
+        response = self.client.patch(self.url, {'name': 'nope'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        # Derived from the agent roster
+        response = self.client.patch(self.url, {'active_agents': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+        operations = [{'op': 'add', 'path': '/active_agents', 'value': []}]
+        response = self.client.patch(self.url, json.dumps(operations), content_type='application/json-patch+json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_stale_if_match_is_rejected(self):
+        stale = self.etag()
+        self.client.patch(self.detail_url, {'name': 'Renamed'}, format='json')
+
+        response = self.client.patch(self.url, {'metrics': {'cpu': 3}}, format='json', HTTP_IF_MATCH=stale)
+        self.assertEqual(response.status_code, 412)
+        response = self.client.patch(self.detail_url, {'name': 'Again'}, format='json', HTTP_IF_MATCH=stale)
+        self.assertEqual(response.status_code, 412)
+        self.workspace.refresh_from_db()
+        self.assertEqual((self.workspace.name, self.workspace.metrics['cpu']), ('Renamed', 1))
+
+    def test_current_if_match_is_accepted(self):
+        response = self.client.patch(self.detail_url, {'name': 'Renamed'}, format='json', HTTP_IF_MATCH=self.etag())
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(self.url, {'metrics': {'cpu': 3}}, format='json', HTTP_IF_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+
+class AgentRosterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='operator', email='operator@example.com', password=None)
+        self.workspace = Workspace.objects.create(name='Ops', owner=self.user)
+        self.other = Workspace.objects.create(name='Other', owner=User.objects.create_user(username='x', email='x@example.com', password=None))
+        AgentAssignment.objects.bulk_create(
+            [AgentAssignment(workspace=self.workspace, agent_type='sdr' if i % 2 else 'support', status='active') for i in range(5)]
+            + [AgentAssignment(workspace=self.other, agent_type='sdr')]
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('agent-list')
+
+    def test_list_filters_and_pages_in_sql(self):
+        seen, url = [], f'{self.url}?agent_type=sdr&page_size=1'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 2)
+        self.assertTrue(all(row['workspace'] == self.workspace.pk for row in seen))
+
+    def test_invalid_workspace_filter_is_400(self):
+        self.assertEqual(self.client.get(self.url, {'workspace': 'nope'}).status_code, 400)
+
+    def test_create_requires_workspace_access(self):
+        response = self.client.post(self.url, {'workspace': str(self.other.pk), 'agent_type': 'sdr'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, {'workspace': str(self.workspace.pk), 'agent_type': 'analyst'}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_set_status_only_touches_accessible_agents(self):
+        ids = list(AgentAssignment.objects.values_list('id', flat=True))
+        response = self.client.post(reverse('agent-set-status'), {'ids': ids, 'status': 'paused'}, format='json')
+        self.assertEqual(response.data['updated'], 5)
+        self.assertEqual(AgentAssignment.objects.filter(workspace=self.other, status='active').count(), 1)
+        self.workspace.refresh_from_db()
+        self.assertEqual({agent['status'] for agent in self.workspace.active_agents}, {'paused'})
+
+    def test_active_agents_is_read_only_and_follows_the_roster(self):
+        detail_url = reverse('workspace-detail', args=[self.workspace.pk])
+        response = self.client.patch(detail_url, {'active_agents': [{'id': 'x'}]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['active_agents'], [])
+        etag = response['ETag']
+
+        agent = self.client.post(self.url, {'workspace': str(self.workspace.pk), 'agent_type': 'analyst', 'name': 'Ana'}, format='json').data
+        response = self.client.get(detail_url)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(
+            response.data['active_agents'][-1],
+            {'id': agent['id'], 'agent_type': 'analyst', 'name': 'Ana', 'status': 'active', 'config': {}},
+        )
+        self.assertEqual(len(response.data['active_agents']), 6)
+
+        self.client.delete(reverse('agent-detail', args=[agent['id']]))
+        self.assertNotIn(agent['id'], [entry['id'] for entry in self.client.get(detail_url).data['active_agents']])
+
+
+class AgentMigrationTests(TestCase):
+    def test_json_entries_are_normalized(self):
+        migration = importlib.import_module('app.migrations.0011_agentassignment')
+        self.assertEqual(migration.agent_from_json('sdr')['agent_type'], 'sdr')
+        converted = migration.agent_from_json({'type': 'support', 'name': 'Ava', 'status': 'paused', 'id': 'a1'})
+        self.assertEqual(
+            (converted['agent_type'], converted['name'], converted['status'], converted['config']['id']),
+            ('support', 'Ava', 'paused', 'a1'),
+        )
+
+
+@override_settings(OUTBOX={'MODE': 'eager', 'MAX_ATTEMPTS': 2})
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='forgetful', email='forgetful@example.com', password=None)
+        self.client = APIClient()
+        self.url = reverse('password_reset_request')
+
+    def request_reset(self, email):
+        return self.client.post(self.url, {'email': email}, format='json')
+
+    def test_reset_is_sent_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.request_reset('forgetful@example.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('/reset-password?uid=', mail.outbox[0].body)
+        self.assertEqual(OutboxMessage.objects.get().status, 'sent')
+
+    def test_request_work_does_not_depend_on_account_existing(self):
+        with CaptureQueriesContext(connection) as known:
+            self.request_reset('forgetful@example.com')
+        with CaptureQueriesContext(connection) as unknown:
+            self.request_reset('nobody@example.com')
+        self.assertEqual(len(known), len(unknown))
+
+        outbox.drain()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(OutboxMessage.objects.exclude(status='sent').exists())
+
+    def test_failures_back_off_then_give_up(self):
+        outbox.enqueue_email('Hi', 'Body', ['someone@example.com'])
+        with mock.patch.object(EmailMessage, 'send', side_effect=ConnectionError('smtp down')):
+            outbox.drain()
+            message = OutboxMessage.objects.get()
+            self.assertEqual((message.status, message.attempts, message.last_error), ('pending', 1, 'smtp down'))
+            self.assertGreater(message.next_attempt_at, timezone.now())
+
+            OutboxMessage.objects.update(next_attempt_at=timezone.now())
+            outbox.drain()
+        self.assertEqual(OutboxMessage.objects.get().status, 'failed')
+
+
+def url_names(patterns=None):
+    """Every named route in the URLconf, minus the admin site."""
+    names = set()
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        if hasattr(pattern, 'url_patterns'):
+            if getattr(pattern, 'namespace', None) != 'admin':
+                names |= url_names(pattern.url_patterns)
+        elif pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+@override_settings(
+    PASSWORD_HASHERS=FAST_HASHERS,
+    OUTBOX={'MODE': 'eager'},
+    TOKEN_REVOCATION={'FLUSH_INTERVAL': 0, 'SYNC_INTERVAL': 3600, 'BLOOM_CAPACITY': 1000},
+    BULK_PROVISIONING={'KIND': 'thread', 'MAX_WORKERS': 2},
+)
+class QueryBudgetTests(TestCase):
+    """
+    Every endpoint against realistic fixtures, with a declared maximum
+    number of queries and no statement allowed to run twice. Requests are
+    force-authenticated, so budgets exclude the (cached) user lookup.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', email='owner@example.com', password=PASSWORD)
+        cls.staff = User.objects.create_user(username='ops', email='ops@example.com', password=None, is_staff=True)
+        cls.outsider = User.objects.create_user(username='outsider', email='outsider@example.com', password=None)
+        cls.mfa_user = User.objects.create_user(username='mfa', email='mfa@example.com', password=PASSWORD)
+        cls.mfa_user.mfa_secret = pyotp.random_base32()
+        cls.mfa_user.mfa_enabled = True
+        cls.mfa_user.save()
+        MFABackupCode.objects.replace(cls.mfa_user, [f'CODE{i:04d}' for i in range(10)])
+        cls.members = User.objects.bulk_create(
+            [User(username=f'member{i}', email=f'member{i}@example.com', password='!') for i in range(40)]
+        )
+
+        cls.workspace = Workspace.objects.create(name='Main', owner=cls.owner)
+        access.add_members(cls.workspace.pk, [cls.owner.pk] + [member.pk for member in cls.members])
+        cls.spare = Workspace.objects.create(name='Spare', owner=cls.owner)
+        cls.doomed = Workspace.objects.create(name='Doomed', owner=cls.owner)
+        for index in range(8):
+            extra = Workspace.objects.create(name=f'Team {index}', owner=cls.owner)
+            access.add_members(extra.pk, [member.pk for member in cls.members[index * 5:(index + 1) * 5]])
+        cls.invite = WorkspaceInvite.objects.allocate(cls.workspace, created_by=cls.owner)
+        cls.agents = AgentAssignment.objects.bulk_create(
+            [AgentAssignment(workspace=cls.workspace, agent_type='sdr' if i % 2 else 'support') for i in range(30)]
+        )
+        now = timezone.now()
+        metrics.ingest(cls.workspace.pk, [{'name': 'calls', 'value': i, 'recorded_at': now - timedelta(minutes=i)} for i in range(50)])
+
+    def setUp(self):
+        cache.clear()
+        get_rate_limiter().clear()
+        self.client = APIClient()
+
+    # Each case: (url name, method, user, budget, expected status, request kwargs or a callable returning them)
+    def cases(self):
+        workspace_url = {'pk': self.workspace.pk}
+        member_ids = [member.pk for member in self.members[:10]]
+
+        def mfa_verify():
+            self.client.get(reverse('mfa_setup'))
+            secret = self.client.get(reverse('mfa_setup')).data['secret']
+            return {'data': {'code': pyotp.TOTP(secret).now()}}
+
+        def mfa_login():
+            temp_token = self.client.post(reverse('token_obtain_pair'), {'username': 'mfa', 'password': PASSWORD}, format='json').data['temp_token']
+            return {'data': {'temp_token': temp_token, 'code': pyotp.TOTP(self.mfa_user.mfa_secret).now()}}
+
+        def token_refresh():
+            get_revocation_store().sync(force=True)
+            return {'data': {'refresh': str(RefreshToken.for_user(self.owner))}}
+
+        def password_reset_confirm():
+            # Fresh row: logging in above changed last_login, which the token covers
+            owner = User.objects.get(pk=self.owner.pk)
+            return {'data': {
+                'uidb64': urlsafe_base64_encode(force_bytes(owner.pk)),
+                'token': PasswordResetTokenGenerator().make_token(owner),
+                'password': 'An0ther-Passw0rd!',
+            }}
+
+        def mfa_setup_qr():
+            self.client.get(reverse('mfa_setup'))
+            return {}
+
+        return [
+            ('api-root', 'get', self.owner, 0, 200, {}),
+            ('schema-json', 'get', None, 0, 200, {}),
+            ('swagger-ui', 'get', None, 0, 200, {}),
+            ('auth_register', 'post', None, 3, 201, {'data': {'username': 'newbie', 'email': 'newbie@example.com', 'password': PASSWORD}}),
+            ('token_obtain_pair', 'post', None, 2, 200, {'data': {'username': 'owner', 'password': PASSWORD}}),
+            ('token_refresh', 'post', None, 2, 200, token_refresh),
+            ('password_reset_request', 'post', None, 1, 200, {'data': {'email': 'owner@example.com'}}),
+            ('password_reset_confirm', 'post', None, 2, 200, password_reset_confirm),
+            ('mfa_setup', 'get', self.owner, 0, 200, {}),
+            ('mfa_setup_qr', 'get', self.owner, 0, 200, mfa_setup_qr),
+            ('mfa_verify', 'post', self.owner, 7, 200, mfa_verify),
+            ('mfa_login_confirm', 'post', None, 1, 200, mfa_login),
+            ('health_db', 'get', None, 1, 200, {}),
+            ('metrics', 'get', self.staff, 0, 200, {}),
+            ('users_bulk_provision', 'post', self.staff, 12, 200, {'data': {'workspace': str(self.spare.pk), 'users': [
+                {'username': f'seat{i}', 'email': f'seat{i}@example.com', 'password': PASSWORD} for i in range(20)
+            ]}}),
+            ('workspace-list', 'get', self.owner, 3, 200, {}),
+            ('workspace-list', 'post', self.owner, 12, 201, {'data': {'name': 'New'}}),
+            ('workspace-detail', 'get', self.owner, 2, 200, {'kwargs': workspace_url}),
+            ('workspace-detail', 'patch', self.owner, 5, 200, {'kwargs': workspace_url, 'data': {'name': 'Renamed'}}),
+            ('workspace-detail', 'delete', self.owner, 10, 204, {'kwargs': {'pk': self.doomed.pk}}),
+            ('workspace-join', 'post', self.outsider, 11, 200, {'data': {'invite_code': self.invite.code}}),
+            ('workspace-export', 'get', self.owner, 6, 200, {}),
+            ('workspace-add-members', 'post', self.owner, 8, 200, {'kwargs': {'pk': self.spare.pk}, 'data': {'user_ids': member_ids}}),
+            ('workspace-remove-members', 'post', self.owner, 9, 200, {'kwargs': workspace_url, 'data': {'user_ids': member_ids}}),
+            ('workspace-invites', 'get', self.owner, 2, 200, {'kwargs': workspace_url}),
+            ('workspace-invites', 'post', self.owner, 4, 201, {'kwargs': workspace_url, 'data': {'ttl': 3600, 'max_uses': 5}}),
+            ('workspace-metrics', 'get', self.owner, 2, 200, {'kwargs': workspace_url, 'query': {'name': 'calls'}}),
+            ('workspace-metrics', 'post', self.owner, 7, 201, {'kwargs': workspace_url, 'data': {'points': [{'name': 'calls', 'value': 1}]}}),
+            ('workspace-metrics-summary', 'get', self.owner, 2, 200, {'kwargs': workspace_url, 'query': {'name': 'calls'}}),
+            ('workspace-patch-json', 'patch', self.owner, 3, 200, {'kwargs': workspace_url, 'data': {'metrics': {'nps': 50}}}),
+            ('agent-list', 'get', self.owner, 1, 200, {}),
+            ('agent-list', 'post', self.owner, 7, 201, {'data': {'workspace': self.workspace.pk, 'agent_type': 'sdr'}}),
+            ('agent-detail', 'get', self.owner, 1, 200, {'kwargs': {'pk': self.agents[0].pk}}),
+            ('agent-detail', 'patch', self.owner, 6, 200, {'kwargs': {'pk': self.agents[0].pk}, 'data': {'status': 'paused'}}),
+            ('agent-set-status', 'post', self.owner, 6, 200, {'data': {'ids': [agent.pk for agent in self.agents], 'status': 'paused'}}),
+        ]
+
+    def assertQueryBudget(self, label, queries, budget):
+        statements = [query['sql'] for query in queries]
+        # Savepoint bookkeeping legitimately repeats
+        repeated = {sql: count for sql, count in Counter(statements).items() if count > 1 and 'SAVEPOINT' not in sql}
+        problems = []
+        if len(statements) > budget:
+            problems.append(f'{len(statements)} queries, budget is {budget}')
+        if repeated:
+            problems.append(f'{len(repeated)} statement(s) ran more than once')
+        if problems:
+            listing = '\n'.join(
+                f'  {index}. {"[x%d] " % repeated[sql] if sql in repeated else ""}{sql}'
+                for index, sql in enumerate(statements, 1)
+            )
+            self.fail(f'{label}: {"; ".join(problems)}\n{listing}')
+
+    def test_repeated_statement_is_reported(self):
+        queries = [{'sql': 'SELECT 1'}, {'sql': 'SELECT 2'}, {'sql': 'SELECT 1'}]
+        with self.assertRaisesMessage(AssertionError, '[x2] SELECT 1'):
+            self.assertQueryBudget('GET example', queries, budget=5)
+
+    def test_every_endpoint_has_a_budget(self):
+        covered = {case[0] for case in self.cases()}
+        self.assertEqual(url_names() - covered, set())
+
+    def test_endpoints_stay_within_query_budget(self):
+        for name, method, user, budget, expected_status, request in self.cases():
+            label = f'{method.upper()} {name}'
+            with self.subTest(label):
+                self.setUp()
+                self.client.force_authenticate(user)
+                options = request() if callable(request) else request
+                url = reverse(name, kwargs=options.get('kwargs'))
+                if options.get('query'):
+                    url = f"{url}?{'&'.join(f'{key}={value}' for key, value in options['query'].items())}"
+                with CaptureQueriesContext(connection) as queries:
+                    response = getattr(self.client, method)(url, options.get('data'), format='json')
+                    # Streamed bodies run their queries as they are consumed
+                    body = b''.join(response.streaming_content) if response.streaming else response.content
+                self.assertEqual(response.status_code, expected_status, f'{label}: {body[:500]}')
+                self.assertQueryBudget(label, queries, budget)
+
+
+class BenchmarkHelperTests(TestCase):
+    def test_percentile_is_nearest_rank(self):
+        samples = list(range(1, 101))
+        self.assertEqual([percentile(samples, pct) for pct in (50, 95, 99)], [50, 95, 99])
+        self.assertIsNone(percentile([], 50))
+
+    def test_measure_spreads_iterations_over_threads_and_counts_errors(self):
+        calls = []
+
+        def func():
+            calls.append(threading.current_thread().name)
+            if len(calls) % 5 == 0:
+                raise ValueError('boom')
+
+        result = measure(func, 20, concurrency=4)
+        self.assertEqual(len(calls), 20)
+        self.assertEqual(len(set(calls)), 4)
+        self.assertEqual(result['errors'], 4)
+        self.assertIn('boom', result['first_error'])
+        self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_compare_flags_changes_past_threshold_in_the_worse_direction(self):
+        baseline = {'flows.login': {'ops_per_sec': 100, 'p95_ms': 10.0}, 'flows.gone': {'ops_per_sec': 1}}
+        current = {'flows.login': {'ops_per_sec': 80, 'p95_ms': 9.0}, 'flows.new': {'ops_per_sec': 1}}
+        rows = {(key, stat): (change, regressed) for key, stat, _, _, change, regressed in compare(baseline, current, 10)}
+        self.assertEqual(rows, {('flows.login', 'ops_per_sec'): (-20.0, True), ('flows.login', 'p95_ms'): (-10.0, False)})
+
+
+class OpenAPISchemaTests(TestCase):
+    def setUp(self):
+        self.url = reverse('schema-json')
+
+    def test_schema_is_served_with_etag_and_revalidates_to_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], schema.MEDIA_TYPE)
+        self.assertIn('/api/workspaces/', json.loads(response.content)['paths'])
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_precompressed_variant_follows_accept_encoding(self):
+        plain = self.client.get(self.url).content
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain)
+        if brotli is not None:
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertEqual(brotli.decompress(response.content), plain)
+
+    def test_negotiate_encoding_honours_qvalues(self):
+        self.assertEqual(negotiate_encoding('gzip;q=0.5, br', ['br', 'gzip']), 'br')
+        self.assertEqual(negotiate_encoding('br;q=0, *', ['br', 'gzip']), 'gzip')
+        self.assertIsNone(negotiate_encoding('identity', ['br', 'gzip']))
+        self.assertIsNone(negotiate_encoding(None, ['gzip']))
+
+    @override_settings(OPENAPI_SCHEMA={'DIR': None})
+    def test_jwt_security_scheme_is_documented(self):
+        document = json.loads(self.client.get(self.url).content)
+        self.assertEqual(document['components']['securitySchemes']['jwtAuth']['scheme'], 'bearer')
+        self.assertIn({'jwtAuth': []}, document['paths']['/api/workspaces/']['get']['security'])
+
+    @override_settings(OPENAPI_SCHEMA={'DIR': None})
+    def test_metrics_token_security_scheme_is_documented(self):
+        document = json.loads(self.client.get(self.url).content)
+        self.assertEqual(document['components']['securitySchemes']['metricsToken']['scheme'], 'bearer')
+        self.assertIn({'metricsToken': []}, document['paths']['/api/metrics/']['get']['security'])
+        self.assertEqual(list(document['paths']['/api/metrics/']['get']['responses']['200']['content']), ['text/plain'])
+
+    @override_settings(OPENAPI_SCHEMA={'DIR': None})
+    def test_database_health_is_documented(self):
+        document = json.loads(self.client.get(self.url).content)
+        self.assertEqual(set(document['paths']['/api/health/db/']['get']['responses']), {'200', '503'})
+
+    @override_settings(OPENAPI_SCHEMA={'DIR': None})
+    def test_mfa_qr_image_is_documented(self):
+        operation = json.loads(self.client.get(self.url).content)['paths']['/api/auth/mfa/setup/qr/']['get']
+        self.assertEqual(set(operation['responses']['200']['content']), {'image/svg+xml', 'image/png'})
+        self.assertEqual(set(operation['parameters'][0]['schema']['enum']), {'svg', 'png'})
+
+    def test_built_schema_is_loaded_from_disk(self):
+        with tempfile.TemporaryDirectory() as directory:
+            call_command('build_schema', dir=directory, stdout=io.StringIO())
+            with open(os.path.join(directory, schema.FILENAME), 'rb') as handle:
+                built = handle.read()
+            with override_settings(OPENAPI_SCHEMA={'DIR': directory}), \
+                    mock.patch.object(schema, 'generate_schema', side_effect=AssertionError('regenerated')):
+                response = self.client.get(self.url)
+        self.assertEqual(response.content, built)
+
+
+class ConditionalWorkspaceReadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='poller', email='poller@example.com', password=None)
+        self.workspace = Workspace.objects.create(name='Polled', owner=self.user)
+        Workspace.objects.create(name='Other', owner=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.list_url = reverse('workspace-list')
+        self.detail_url = reverse('workspace-detail', args=[self.workspace.pk])
+
+    def test_unchanged_list_poll_runs_only_the_validator_query(self):
+        etag = self.client.get(self.list_url)['ETag']
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(len(captured), 1, [query['sql'] for query in captured])
+        self.assertIn('MAX(', captured[0]['sql'])
+
+    def test_list_etag_changes_with_edits_deletions_membership_and_metrics(self):
+        etags = [self.client.get(self.list_url)['ETag']]
+        changes = [
+            lambda: self.client.patch(self.detail_url, {'name': 'Renamed'}, format='json'),
+            lambda: metrics.ingest(self.workspace.pk, [{'name': 'cpu', 'value': 1}]),
+            lambda: access.add_members(self.workspace.pk, [User.objects.create_user(username='joiner', password=None).pk]),
+            lambda: Workspace.objects.filter(name='Other').delete(),
+        ]
+        for change in changes:
+            change()
+            response = self.client.get(self.list_url, HTTP_IF_NONE_MATCH=etags[-1])
+            self.assertEqual(response.status_code, 200)
+            etags.append(response['ETag'])
+        self.assertEqual(len(set(etags)), len(etags))
+
+    def test_detail_revalidates_with_etag_and_last_modified(self):
+        response = self.client.get(self.detail_url)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        etag, modified = response['ETag'], response['Last-Modified']
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=modified).status_code, 304)
+
+        metrics.ingest(self.workspace.pk, [{'name': 'cpu', 'value': 5}])
+        response = self.client.get(self.detail_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['metrics'], {'cpu': 5.0})
+
+    def test_if_match_ignores_metric_ingestion(self):
+        metrics.ingest(self.workspace.pk, [{'name': 'cpu', 'value': 1}])
+        etag = self.client.get(self.detail_url)['ETag']
+        metrics.ingest(self.workspace.pk, [{'name': 'cpu', 'value': 2}])
+        response = self.client.patch(self.detail_url, {'name': 'Still mine'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_inaccessible_workspace_is_404_even_when_conditional(self):
+        other = Workspace.objects.create(name='Hidden', owner=User.objects.create_user(username='stranger', password=None))
+        response = self.client.get(reverse('workspace-detail', args=[other.pk]), HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404)
+
+
+class FastJSONTests(TestCase):
+    payload = {
+        'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+        'at': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+        'day': datetime(2024, 5, 1).date(),
+        'amount': Decimal('12.50'),
+        'text': 'caf\u00e9 \u2028 end',
+        'nested': {1: [1, 2.5, True, None]},
+    }
+
+    def test_renderer_output_matches_drf(self):
+        self.assertEqual(FastJSONRenderer().render(self.payload), JSONRenderer().render(self.payload))
+
+    def test_large_and_small_floats_parse_to_the_same_values(self):
+        data = {'values': [1e16, 1e-7, 1.5e300, -2.5e-300, 123456789.125, 0.1]}
+        rendered = FastJSONRenderer().render(data)
+        self.assertEqual(json.loads(rendered), data)
+        self.assertEqual(json.loads(rendered), json.loads(JSONRenderer().render(data)))
+        if fastjson.orjson is not None:
+            # Only the exponent spelling differs from the stdlib
+            self.assertEqual(rendered, b'{"values":[1e16,1e-7,1.5e300,-2.5e-300,123456789.125,0.1]}')
+
+    def test_renderer_falls_back_without_orjson_and_for_indent(self):
+        with mock.patch('app.fastjson.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(self.payload), JSONRenderer().render(self.payload))
+        indented = FastJSONRenderer().render({'a': 1}, 'application/json; indent=2')
+        self.assertEqual(indented, b'{\n  "a": 1\n}')
+
+    def test_parser_keeps_integers_wider_than_64_bits_exact(self):
+        for value in (2 ** 64 + 1, -2 ** 63 - 1):
+            parsed = FastJSONParser().parse(io.BytesIO(b'{"bytes": %d}' % value))
+            self.assertEqual(parsed, {'bytes': value})
+            self.assertIsInstance(parsed['bytes'], int)
+
+    def test_parser_reads_json_and_rejects_garbage(self):
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(b'{"a": [1, "\\u00e9"]}')), {'a': [1, '\u00e9']})
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"a": NaN}'))
+
+
+class ResponseCompressionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='gzip', email='gzip@example.com', password=None)
+        for i in range(5):
+            Workspace.objects.create(name=f'Big {i}', owner=self.user, metrics={f'series_{n}': n for n in range(100)})
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('workspace-list')
+
+    def test_large_responses_are_compressed_per_accept_encoding(self):
+        plain = self.client.get(self.url)
+        self.assertNotIn('Content-Encoding', plain)
+
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(json.loads(gzip.decompress(response.content)), json.loads(plain.content))
+        self.assertEqual(response['ETag'], 'W/' + plain['ETag'])
+        if brotli is not None:
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, br')
+            self.assertEqual(json.loads(brotli.decompress(response.content)), json.loads(plain.content))
+
+    def test_small_and_auth_responses_are_not_compressed(self):
+        workspace = Workspace.objects.create(name='Tiny', owner=self.user)
+        response = self.client.get(reverse('workspace-detail', args=[workspace.pk]), {'fields': 'id'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+
+        request = RequestFactory().get('/api/auth/login/', HTTP_ACCEPT_ENCODING='gzip')
+        body = HttpResponse(b'{"access": "%s"}' % (b'x' * 4096), content_type='application/json')
+        self.assertNotIn('Content-Encoding', CompressionMiddleware(lambda request: body)(request))
+
+    def test_weakened_etag_still_satisfies_if_match(self):
+        workspace = Workspace.objects.create(name='Edit', owner=self.user, metrics={f'k{n}': n for n in range(200)})
+        detail_url = reverse('workspace-detail', args=[workspace.pk])
+        etag = self.client.get(detail_url, HTTP_ACCEPT_ENCODING='gzip')['ETag']
+        self.assertTrue(etag.startswith('W/'))
+        response = self.client.patch(detail_url, {'name': 'Edited'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_streaming_responses_are_compressed_chunk_by_chunk(self):
+        rows = [b'{"n": %d}\n' % n for n in range(50)]
+        request = RequestFactory().get('/api/export/', HTTP_ACCEPT_ENCODING='gzip')
+        response = CompressionMiddleware(lambda request: StreamingHttpResponse(iter(rows), content_type='application/x-ndjson'))(request)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 1)
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        # Each chunk decodes on arrival, without waiting for the end of the stream
+        self.assertEqual(decompressor.decompress(chunks[0]), rows[0])
+        self.assertEqual(b''.join(rows), rows[0] + b''.join(decompressor.decompress(chunk) for chunk in chunks[1:]))
+
+
+class WorkspaceTransferTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password=None)
+        self.member = User.objects.create_user(username='member', email='member@example.com', password=None)
+        self.workspace = Workspace.objects.create(name='Fleet', owner=self.owner)
+        access.add_members(self.workspace.pk, [self.owner.pk, self.member.pk])
+        WorkspaceInvite.objects.allocate(self.workspace, max_uses=5)
+        AgentAssignment.objects.create(workspace=self.workspace, agent_type='support', config={'tone': 'calm'})
+        base = datetime(2026, 3, 1, 12, 0, tzinfo=dt_timezone.utc)
+        metrics.ingest(self.workspace.pk, [{'name': 'cpu', 'value': float(n), 'recorded_at': base + timedelta(seconds=n)} for n in range(5)])
+        # Someone else's workspace the owner is only a member of
+        self.other = Workspace.objects.create(name='Other', owner=self.member)
+        access.add_members(self.other.pk, [self.owner.pk])
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def export_lines(self):
+        return b''.join(transfer.export_ndjson(Workspace.objects.filter(pk=self.workspace.pk))).splitlines()
+
+    def delete_workspace(self):
+        Workspace.objects.filter(pk=self.workspace.pk).delete()
+
+    def test_export_streams_owned_workspaces_as_ndjson(self):
+        response = self.client.get(reverse('workspace-export'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        self.assertEqual(records[0]['type'], 'header')
+        types = [record['type'] for record in records[1:]]
+        self.assertEqual(types, sorted(types, key=list(transfer.IMPORTERS).index))
+        self.assertEqual(Counter(types), {'workspace': 1, 'invite': 2, 'membership': 2, 'agent': 1, 'metric_point': 5, 'metric_rollup': 3})
+        self.assertEqual({record['workspace_id'] for record in records if 'workspace_id' in record}, {str(self.workspace.pk)})
+        self.assertEqual(records[1]['owner_username'], 'owner')
+
+    def test_export_is_yielded_in_buffered_chunks(self):
+        chunks = list(transfer.export_ndjson(Workspace.objects.all(), buffer_size=512))
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk.endswith(b'\n') for chunk in chunks))
+
+    def test_import_round_trips_an_export(self):
+        lines = self.export_lines()
+        created_at = self.workspace.created_at
+        self.delete_workspace()
+
+        result = transfer.import_ndjson(lines, batch_size=4)
+        self.assertEqual(result['imported']['metric_point'], 5)
+        self.assertEqual(sum(result['skipped'].values()), 0)
+
+        workspace = Workspace.objects.get(pk=self.workspace.pk)
+        self.assertEqual((workspace.name, workspace.owner_id, workspace.created_at), ('Fleet', self.owner.pk, created_at))
+        self.assertEqual(set(workspace.members.values_list('username', flat=True)), {'owner', 'member'})
+        self.assertEqual(
+            set(WorkspaceAccess.objects.filter(workspace=workspace).values_list('user__username', 'is_owner', 'is_member')),
+            {('owner', True, True), ('member', False, True)},
+        )
+        self.assertTrue(WorkspaceInvite.objects.filter(code=workspace.invite_code, workspace=workspace).exists())
+        self.assertEqual(workspace.agents.get().config, {'tone': 'calm'})
+        self.assertEqual(workspace.metric_rollups.get(resolution='minute').count, 5)
+
+        # Existing workspaces are left alone, and unknown users skipped
+        User.objects.filter(username='member').delete()
+        result = transfer.import_ndjson(lines)
+        self.assertEqual(result['imported']['workspace'], 0)
+        self.assertEqual(result['skipped']['workspace'], 1)
+
+    def test_importing_the_same_file_twice_changes_nothing(self):
+        lines = self.export_lines()
+        self.delete_workspace()
+        transfer.import_ndjson(lines, batch_size=4)
+        counts = lambda: [model.objects.filter(workspace=self.workspace.pk).count() for model in (AgentAssignment, WorkspaceInvite, WorkspaceMetricPoint)]
+        before = counts()
+        rollup = WorkspaceMetricRollup.objects.get(workspace=self.workspace.pk, resolution='minute')
+
+        result = transfer.import_ndjson(lines, batch_size=4)
+        self.assertEqual(sum(result['imported'].values()), 0)
+        self.assertEqual(counts(), before)
+        self.assertEqual(WorkspaceMetricRollup.objects.get(pk=rollup.pk).count, rollup.count)
+
+    def test_workspaces_with_a_taken_invite_code_are_skipped(self):
+        lines = self.export_lines()
+        code = self.workspace.invite_code
+        self.delete_workspace()
+        squatter = Workspace.objects.create(name='Squatter', owner=self.member, invite_code=code)
+
+        result = transfer.import_ndjson(lines, batch_size=4)
+        self.assertEqual(result['conflicts'], [str(self.workspace.pk)])
+        self.assertEqual(result['skipped']['workspace'], 1)
+        self.assertFalse(Workspace.objects.filter(pk=self.workspace.pk).exists())
+        self.assertEqual(Workspace.objects.get(invite_code=code), squatter)
+
+    def test_import_resumes_after_the_last_committed_batch(self):
+        lines = self.export_lines()
+        self.delete_workspace()
+
+        with mock.patch.dict(transfer.IMPORTERS, metric_point=mock.Mock(side_effect=OperationalError('connection lost'))):
+            with self.assertRaises(OperationalError):
+                transfer.import_ndjson(lines, checkpoint='fleet', batch_size=3)
+        line = ImportCheckpoint.objects.get(name='fleet').line
+        self.assertGreater(line, 0)
+        self.assertFalse(WorkspaceMetricPoint.objects.exists())
+
+        result = transfer.import_ndjson(lines, checkpoint='fleet', batch_size=3)
+        self.assertEqual(result['resumed_from'], line)
+        self.assertEqual(result['line'], len(lines))
+        self.assertEqual(Workspace.objects.filter(pk=self.workspace.pk).count(), 1)
+        self.assertEqual(AgentAssignment.objects.filter(workspace=self.workspace.pk).count(), 1)
+        self.assertEqual(WorkspaceMetricPoint.objects.filter(workspace=self.workspace.pk).count(), 5)
+
+    def test_resumed_import_does_not_duplicate_records_of_existing_workspaces(self):
+        lines = self.export_lines()
+        with mock.patch.dict(transfer.IMPORTERS, metric_point=mock.Mock(side_effect=OperationalError('connection lost'))):
+            with self.assertRaises(OperationalError):
+                transfer.import_ndjson(lines, checkpoint='again', batch_size=3)
+        self.assertEqual(ImportCheckpoint.objects.get(name='again').last_id, str(self.workspace.pk))
+
+        transfer.import_ndjson(lines, checkpoint='again', batch_size=3)
+        self.assertEqual(WorkspaceMetricPoint.objects.filter(workspace=self.workspace).count(), 5)
+        self.assertEqual(AgentAssignment.objects.filter(workspace=self.workspace).count(), 1)
+
+    def test_records_missing_from_an_existing_workspace_are_added(self):
+        lines = self.export_lines()
+        WorkspaceMetricPoint.objects.filter(workspace=self.workspace, value__gte=3).delete()
+
+        result = transfer.import_ndjson(lines)
+        self.assertEqual(result['imported']['metric_point'], 2)
+        self.assertEqual(result['skipped']['metric_point'], 3)
+        self.assertEqual(sorted(self.workspace.metric_points.values_list('value', flat=True)), [0, 1, 2, 3, 4])
+
+    def test_resume_rejects_a_different_file(self):
+        lines = self.export_lines()
+        ImportCheckpoint.objects.create(name='moved', line=2, last_id=str(uuid.uuid4()))
+
+        with self.assertRaisesMessage(transfer.TransferError, "Line 2: does not match checkpoint 'moved'"):
+            transfer.import_ndjson(lines, checkpoint='moved')
+
+    def test_commands_round_trip_through_a_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.ndjson')
+            call_command('export_workspaces', owner=['owner'], output=path, stderr=io.StringIO())
+            self.delete_workspace()
+            out = io.StringIO()
+            call_command('import_workspaces', path, checkpoint='file', stdout=out)
+        self.assertIn('workspace: 1 imported', out.getvalue())
+        self.assertTrue(Workspace.objects.filter(pk=self.workspace.pk).exists())
+
+    def test_rejects_unknown_formats(self):
+        with self.assertRaisesMessage(transfer.TransferError, 'Line 1'):
+            transfer.import_ndjson([b'{"type": "header", "format": "workspaces", "version": 99}'])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, BULK_PROVISIONING={'KIND': 'thread', 'MAX_WORKERS': 2, 'BATCH_SIZE': 2})
+class BulkUserProvisioningTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='ops', email='ops@example.com', password=None, is_staff=True)
+        self.workspace = Workspace.objects.create(name='Customer', owner=self.staff)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+        self.url = reverse('users_bulk_provision')
+
+    def test_creates_valid_rows_and_reports_the_rest(self):
+        rows = [
+            {'username': 'ana', 'email': 'ana@EXAMPLE.com', 'password': PASSWORD, 'full_name': 'Ana'},
+            {'username': 'ben', 'email': 'not-an-email'},
+            {'username': 'ops', 'email': 'other@example.com'},
+            {'username': 'cy', 'email': 'cy@example.com'},
+            {'username': 'ana', 'email': 'ana2@example.com'},
+        ]
+        response = self.client.post(self.url, {'users': rows, 'workspace': str(self.workspace.pk)}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['invalid']), (2, 3))
+        self.assertEqual([result['status'] for result in response.data['results']], ['created', 'invalid', 'invalid', 'created', 'invalid'])
+        self.assertIn('email', response.data['results'][1]['errors'])
+        self.assertIn('username', response.data['results'][2]['errors'])
+        self.assertIn('username', response.data['results'][4]['errors'])
+
+        ana = User.objects.get(username='ana')
+        self.assertEqual((ana.email, ana.full_name), ('ana@example.com', 'Ana'))
+        self.assertTrue(ana.check_password(PASSWORD))
+        self.assertFalse(User.objects.get(username='cy').has_usable_password())
+        self.assertEqual(set(self.workspace.members.values_list('username', flat=True)), {'ana', 'cy'})
+        self.assertTrue(WorkspaceAccess.objects.filter(workspace=self.workspace, user=ana, is_member=True).exists())
+
+    def test_accepts_csv(self):
+        body = f'username,email,password\ndee,dee@example.com,{PASSWORD}\neve,eve@example.com,\n'
+        response = self.client.post(f'{self.url}?workspace={self.workspace.pk}', body, content_type='text/csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertTrue(User.objects.get(username='dee').check_password(PASSWORD))
+        self.assertEqual(self.workspace.members.count(), 2)
+
+    def test_unknown_workspace_creates_nothing(self):
+        response = self.client.post(self.url, {'users': [{'username': 'fay', 'email': 'fay@example.com'}], 'workspace': str(uuid.uuid4())}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(username='fay').exists())
+
+    def test_staff_only(self):
+        self.client.force_authenticate(User.objects.create_user(username='user', email='user@example.com', password=None))
+        response = self.client.post(self.url, {'users': [{'username': 'gus', 'email': 'gus@example.com'}]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(BULK_PROVISIONING={})
+    def test_hashes_on_a_thread_pool_by_default(self):
+        self.assertIsInstance(provisioning.get_hash_pool(), ThreadPoolExecutor)
+
+    @override_settings(BULK_PROVISIONING={'KIND': 'process', 'MAX_WORKERS': 2})
+    def test_process_pool_hashes_with_the_callers_hasher(self):
+        hashes = provisioning.hash_passwords(['first', 'second', 'third'])
+        self.assertTrue(all(encoded.startswith('md5$') for encoded in hashes))
+        self.assertEqual([MD5PasswordHasher().verify(password, encoded) for password, encoded in zip(['first', 'second', 'third'], hashes)], [True] * 3)
@@ -0,0 +1,286 @@
+"""
+Rate limiting for the unauthenticated auth endpoints.
+
+The throttles run in ``APIView.initial()``, before the serializer touches a
+password hasher, TOTP check or the outbox, so an over-limit request costs a
+cache lookup. Each request is counted against several keys (client IP plus
+the username, email or MFA temp-token subject it targets); exceeding any of
+them rejects it with 429 and ``Retry-After``.
+
+The client IP is ``REMOTE_ADDR``. Behind ``NUM_PROXIES`` trusted reverse
+proxies it is taken from that position in ``X-Forwarded-For`` instead;
+the header is otherwise client-controlled and never trusted, or rotating
+it would dodge the per-IP limits.
+
+Two backends share one interface:
+
+* ``LocalSlidingWindow`` keeps an exact sliding-window log per key in
+  process memory, with a separate LRU per scope and key kind so churning
+  IP keys can't evict a username's counter. Limits are per worker.
+* ``SharedSlidingWindow`` approximates a sliding window with two fixed
+  window counters in a Django cache (Redis in production), so limits hold
+  across workers. Rejected attempts are counted too, which keeps a client
+  that keeps hammering locked out.
+
+Rejections are tallied per scope and key kind in ``rejection_counts()``.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from rest_framework.throttling import BaseThrottle
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+DEFAULTS = {
+    'BACKEND': 'local',
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'auth-rate',
+    # Per scope and key kind
+    'LOCAL_MAX_KEYS': 10000,
+    'NUM_PROXIES': 0,
+    'RATES': {},
+}
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'10/min' -> (10, 60), same notation as DRF's throttle rates."""
+    num, period = rate.split('/')
+    return int(num), PERIODS[period[0]]
+
+
+class LocalSlidingWindow:
+    """
+    Exact sliding-window log per key, bounded to ``max_keys`` keys (LRU)
+    in each partition.
+    """
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._partitions = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window, partition=''):
+        """Record a hit; return ``(allowed, retry_after_seconds)``."""
+        now = time.monotonic()
+        with self._lock:
+            keys = self._partitions.get(partition)
+            if keys is None:
+                keys = self._partitions[partition] = OrderedDict()
+            hits = keys.get(key)
+            if hits is None:
+                hits = keys[key] = deque()
+            keys.move_to_end(key)
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if len(hits) >= limit:
+                return False, hits[0] + window - now
+            hits.append(now)
+            while len(keys) > self.max_keys:
+                keys.popitem(last=False)
+            return True, 0
+
+    def clear(self):
+        with self._lock:
+            self._partitions.clear()
+
+
+class SharedSlidingWindow:
+    """Sliding-window counter over a Django cache: current + weighted previous window."""
+
+    def __init__(self, alias, key_prefix):
+        self.cache = caches[alias]
+        self.key_prefix = key_prefix
+
+    def _key(self, key, index):
+        # Keys embed user input; hash them into something every cache backend accepts
+        digest = hashlib.sha256(key.encode()).hexdigest()[:32]
+        return f'{self.key_prefix}:{digest}:{index}'
+
+    def hit(self, key, limit, window, partition=''):
+        # Keys are already distinct per scope and kind; one cache holds them all
+        now = time.time()
+        index, elapsed = divmod(now, window)
+        current_key = self._key(key, int(index))
+        # add() is a no-op when the counter exists; incr() is atomic on Redis
+        self.cache.add(current_key, 0, window * 2)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:
+            # Expired between add() and incr()
+            self.cache.set(current_key, 1, window * 2)
+            current = 1
+        previous = self.cache.get(self._key(key, int(index) - 1), 0)
+
+        weight = 1 - elapsed / window
+        if previous * weight + current <= limit:
+            return True, 0
+        if current <= limit:
+            # Wait for the previous window's share to decay
+            retry_after = window * (1 - (limit - current) / previous) - elapsed
+        else:
+            # Wait out this window, then for its share of the next to decay
+            retry_after = (window - elapsed) + window * (1 - limit / current)
+        return False, max(retry_after, 0)
+
+    def clear(self):
+        # Counters expire on their own; never flush a cache other services use.
+        pass
+
+
+class RateLimiter:
+    def __init__(self, backend, rates, num_proxies=0):
+        self.backend = backend
+        self.num_proxies = num_proxies
+        self.rates = {
+            scope: {kind: parse_rate(rate) for kind, rate in kinds.items()}
+            for scope, kinds in rates.items()
+        }
+
+    def check(self, scope, idents):
+        """
+        Count a request against every ``(kind, value)`` ident that has a rate
+        for ``scope``; return the ``(kind, retry_after)`` that rejected it,
+        or ``None`` when it is allowed.
+        """
+        rates = self.rates.get(scope, {})
+        for kind, value in idents:
+            if value is None or kind not in rates:
+                continue
+            allowed, retry_after = self.backend.hit(f'{scope}:{kind}:{value}', *rates[kind], partition=f'{scope}:{kind}')
+            if not allowed:
+                return kind, retry_after
+        return None
+
+    def clear(self):
+        self.backend.clear()
+
+
+_rejections = Counter()
+_rejections_lock = threading.Lock()
+
+
+def record_rejection(scope, kind):
+    with _rejections_lock:
+        _rejections[(scope, kind)] += 1
+
+
+def rejection_counts():
+    """Rejected requests in this process, keyed by ``(scope, kind)``."""
+    with _rejections_lock:
+        return dict(_rejections)
+
+
+def build_rate_limiter():
+    config = {**DEFAULTS, **getattr(settings, 'AUTH_RATE_LIMITS', {})}
+    if config['BACKEND'] == 'shared':
+        backend = SharedSlidingWindow(config['CACHE_ALIAS'], config['KEY_PREFIX'])
+    elif config['BACKEND'] == 'local':
+        backend = LocalSlidingWindow(config['LOCAL_MAX_KEYS'])
+    else:
+        raise ValueError(f"Unknown AUTH_RATE_LIMITS backend {config['BACKEND']!r}")
+    return RateLimiter(backend, config['RATES'], config['NUM_PROXIES'])
+
+
+_rate_limiter = None
+
+
+def get_rate_limiter():
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = build_rate_limiter()
+    return _rate_limiter
+
+
+def _reset_rate_limiter(*, setting, **kwargs):
+    global _rate_limiter
+    if setting in ('AUTH_RATE_LIMITS', 'CACHES'):
+        _rate_limiter = None
+
+
+setting_changed.connect(_reset_rate_limiter)
+
+
+class AuthRateThrottle(BaseThrottle):
+    """Throttle keyed by client IP plus whatever ``get_idents`` adds for the scope."""
+    scope = None
+
+    def get_ident(self, request):
+        # Unlike DRF's get_ident with NUM_PROXIES unset, never use a
+        # client-supplied X-Forwarded-For as the key
+        remote_addr = request.META.get('REMOTE_ADDR')
+        num_proxies = get_rate_limiter().num_proxies
+        forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        if not num_proxies or not forwarded_for:
+            return remote_addr
+        addresses = [address.strip() for address in forwarded_for.split(',')]
+        # The entry appended by the outermost trusted proxy
+        return addresses[-min(num_proxies, len(addresses))]
+
+    def get_idents(self, request):
+        yield 'ip', self.get_ident(request)
+
+    def request_field(self, request, name):
+        data = request.data
+        value = data.get(name) if hasattr(data, 'get') else None
+        if not isinstance(value, str) or not value.strip():
+            return None
+        return value.strip().lower()[:254]
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        rejected = get_rate_limiter().check(self.scope, self.get_idents(request))
+        if rejected is None:
+            return True
+        kind, retry_after = rejected
+        record_rejection(self.scope, kind)
+        self.retry_after = max(1, math.ceil(retry_after))
+        return False
+
+    def wait(self):
+        return self.retry_after
+
+
+class LoginRateThrottle(AuthRateThrottle):
+    scope = 'login'
+
+    def get_idents(self, request):
+        yield from super().get_idents(request)
+        yield 'username', self.request_field(request, 'username')
+
+
+class MFALoginRateThrottle(AuthRateThrottle):
+    scope = 'mfa_login'
+
+    def get_idents(self, request):
+        yield from super().get_idents(request)
+        yield 'subject', self.temp_token_subject(request)
+
+    def temp_token_subject(self, request):
+        # Signature check only (HMAC); the view still validates the token type
+        token = request.data.get('temp_token') if hasattr(request.data, 'get') else None
+        if not isinstance(token, str):
+            return None
+        try:
+            return str(AccessToken(token)['user_id'])
+        except (TokenError, KeyError):
+            return None
+
+
+class PasswordResetRateThrottle(AuthRateThrottle):
+    scope = 'password_reset'
+
+    def get_idents(self, request):
+        yield from super().get_idents(request)
+        yield 'email', self.request_field(request, 'email')
+
+
+class RegisterRateThrottle(AuthRateThrottle):
+    scope = 'register'
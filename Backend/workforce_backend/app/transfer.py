@@ -0,0 +1,356 @@
+"""
+NDJSON export and import of workspaces and the data hanging off them.
+
+An export is one JSON object per line. The first line is a header carrying
+the format version. Every following line has a ``type``: ``workspace``,
+``invite``, ``membership``, ``agent``, ``metric_point`` or
+``metric_rollup``. Types come in that order, so a record's workspace always
+precedes it. Users are referenced by username, which keeps an export
+portable between databases. The users themselves are not exported and must
+exist on the importing side.
+
+``export_ndjson`` reads each type with a chunked ``.iterator()`` and yields
+buffered chunks of lines. Memory therefore stays flat however many rows
+are exported. It serves ``GET /api/workspaces/export/`` (a
+``StreamingHttpResponse``) and ``manage.py export_workspaces``. Types are
+read one after another, not in a snapshot: a row written mid-export can
+show up without its parent, and import skips it. With
+``DISABLE_SERVER_SIDE_CURSORS`` (PgBouncer transaction pooling),
+PostgreSQL returns each query's whole result at once, so only the output
+is streamed.
+
+``import_ndjson`` (``manage.py import_workspaces``) writes records in
+batches, using one ``bulk_create`` per type per batch. It maintains the
+``WorkspaceAccess`` index itself, because bulk inserts send no signals.
+Workspaces that already exist are left untouched. The other records are
+matched against what is already stored: invites by code, memberships by
+workspace and user, and agents, metric points and rollups by their
+``*_KEY``. Only the missing ones are inserted, and memberships and
+rollups with ``ignore_conflicts`` on top. Importing the same file twice
+therefore changes nothing, and records missing from an existing
+workspace are added to it. Workspaces whose
+invite code is already taken are skipped and listed in the result's
+``conflicts``. Records whose workspace or user can't be found are skipped
+too. Given a checkpoint name, each batch commits together with the number
+of the last line it covered and the id on that line (``ImportCheckpoint``).
+A failed import then resumes after the last committed batch, once the id
+shows the input is the same file.
+"""
+import json
+import uuid
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import access, roster
+from .fastjson import FastJSONRenderer
+from .models import AgentAssignment, ImportCheckpoint, Workspace, WorkspaceInvite, WorkspaceMetricPoint, WorkspaceMetricRollup
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+User = get_user_model()
+Membership = access.Membership
+
+FORMAT = 'workspaces'
+VERSION = 1
+MEDIA_TYPE = 'application/x-ndjson'
+
+ITERATOR_CHUNK_SIZE = 2000
+# Lines are yielded in chunks of about this many bytes: one write (and one
+# compressor flush) per chunk rather than per line
+BUFFER_SIZE = 64 * 1024
+IMPORT_BATCH_SIZE = 1000
+
+TIMESTAMP_FIELDS = {'created_at', 'updated_at', 'metrics_updated_at', 'expires_at', 'recorded_at', 'bucket_start'}
+
+# active_agents is derived from the agent records on import (app.roster)
+WORKSPACE_FIELDS = (
+    'id', 'name', 'invite_code', 'industry', 'company_size', 'timezone', 'currency',
+    'metrics', 'metrics_recorded_at', 'created_at', 'updated_at', 'metrics_updated_at',
+)
+INVITE_FIELDS = ('workspace_id', 'code', 'expires_at', 'max_uses', 'use_count', 'created_at')
+AGENT_FIELDS = ('workspace_id', 'agent_type', 'name', 'status', 'config', 'created_at', 'updated_at')
+METRIC_POINT_FIELDS = ('workspace_id', 'name', 'value', 'recorded_at')
+METRIC_ROLLUP_FIELDS = ('workspace_id', 'name', 'resolution', 'bucket_start', 'count', 'total', 'minimum', 'maximum')
+
+# What makes a record already imported; rollups and memberships also have
+# these as unique constraints, agents and metric points have no natural key
+AGENT_KEY = ('workspace_id', 'agent_type', 'name', 'created_at')
+METRIC_POINT_KEY = ('workspace_id', 'name', 'recorded_at', 'value')
+METRIC_ROLLUP_KEY = ('workspace_id', 'name', 'resolution', 'bucket_start')
+
+
+class TransferError(Exception):
+    pass
+
+
+def export_sections(workspace_ids):
+    """``(type, queryset)`` per record type, in import order, for the given workspaces."""
+    return [
+        ('workspace', Workspace.objects.filter(pk__in=workspace_ids).values(*WORKSPACE_FIELDS, owner_username=F('owner__username'))),
+        ('invite', WorkspaceInvite.objects.filter(workspace__in=workspace_ids).values(*INVITE_FIELDS)),
+        ('membership', Membership.objects.filter(workspace__in=workspace_ids).values('workspace_id', username=F('user__username'))),
+        ('agent', AgentAssignment.objects.filter(workspace__in=workspace_ids).values(*AGENT_FIELDS)),
+        ('metric_point', WorkspaceMetricPoint.objects.filter(workspace__in=workspace_ids).values(*METRIC_POINT_FIELDS)),
+        ('metric_rollup', WorkspaceMetricRollup.objects.filter(workspace__in=workspace_ids).values(*METRIC_ROLLUP_FIELDS)),
+    ]
+
+
+def export_records(workspaces):
+    """The header, then every record of ``workspaces`` (a queryset), as dicts."""
+    yield {'type': 'header', 'format': FORMAT, 'version': VERSION, 'exported_at': timezone.now()}
+    # A subquery, so the workspace ids are never held in memory
+    workspace_ids = workspaces.values('pk')
+    for kind, rows in export_sections(workspace_ids):
+        for row in rows.order_by('pk').iterator(chunk_size=ITERATOR_CHUNK_SIZE):
+            yield {'type': kind, **row}
+
+
+def export_ndjson(workspaces, buffer_size=BUFFER_SIZE):
+    """NDJSON export of ``workspaces``, as bytes chunks of about ``buffer_size``."""
+    renderer = FastJSONRenderer()
+    buffer = bytearray()
+    for record in export_records(workspaces):
+        buffer += renderer.render(record)
+        buffer += b'\n'
+        if len(buffer) >= buffer_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def loads(line):
+    return orjson.loads(line) if orjson is not None else json.loads(line)
+
+
+def build_row(record, fields):
+    """Model field values for ``fields`` from an exported record."""
+    row = {}
+    for name in fields:
+        if name not in record:
+            # e.g. a field added since the export was made: the model default
+            continue
+        value = record[name]
+        if name in TIMESTAMP_FIELDS and value is not None:
+            value = parse_datetime(value)
+        elif name in ('id', 'workspace_id'):
+            value = uuid.UUID(value)
+        row[name] = value
+    return row
+
+
+def insert(model, objects, timestamps=()):
+    """
+    ``bulk_create`` then put back the exported ``timestamps``, which
+    auto_now/auto_now_add overwrite on insert.
+    """
+    exported = [[getattr(obj, name) for name in timestamps] for obj in objects]
+    model.objects.bulk_create(objects)
+    if timestamps and objects:
+        for obj, values in zip(objects, exported):
+            for name, value in zip(timestamps, values):
+                setattr(obj, name, value)
+        model.objects.bulk_update(objects, timestamps)
+
+
+def user_ids_by_username(usernames):
+    return dict(User.objects.filter(username__in=set(usernames)).values_list('username', 'pk'))
+
+
+def importable_workspace_ids(rows):
+    """Workspaces of ``rows`` that exist, whether or not this import created them."""
+    ids = {row['workspace_id'] for row in rows}
+    return set(Workspace.objects.filter(pk__in=ids).values_list('pk', flat=True))
+
+
+def new_rows(model, rows, key, lookup):
+    """
+    The ``rows`` (of importable workspaces) whose ``key`` isn't in the
+    table yet. ``lookup`` names the key field that narrows the probe.
+    """
+    workspace_ids = importable_workspace_ids(rows)
+    rows = [row for row in rows if row['workspace_id'] in workspace_ids]
+    existing = set(model.objects.filter(
+        workspace__in=workspace_ids, **{f'{lookup}__in': {row.get(lookup) for row in rows}},
+    ).values_list(*key))
+    return [row for row in rows if tuple(row.get(name) for name in key) not in existing]
+
+
+def taken_invite_codes(codes):
+    # Workspace and invite codes share one namespace (see allocate_invite_code)
+    return set(Workspace.objects.filter(invite_code__in=codes).values_list('invite_code', flat=True)) | set(
+        WorkspaceInvite.objects.filter(code__in=codes).values_list('code', flat=True)
+    )
+
+
+def import_workspaces(records, state):
+    owners = user_ids_by_username(record.get('owner_username') for record in records)
+    rows = [build_row(record, WORKSPACE_FIELDS) for record in records]
+    existing = set(Workspace.objects.filter(pk__in=[row['id'] for row in rows]).values_list('pk', flat=True))
+    taken = taken_invite_codes([row['invite_code'] for row in rows if row.get('invite_code')])
+    workspaces = []
+    for record, row in zip(records, rows):
+        if row['id'] in existing or record.get('owner_username') not in owners:
+            continue
+        code = row.get('invite_code')
+        if code and code in taken:
+            # Inserting it would abort the whole batch on the unique constraint
+            state['conflicts'].append(str(row['id']))
+            continue
+        if code:
+            taken.add(code)
+        workspaces.append(Workspace(owner_id=owners[record['owner_username']], **row))
+    insert(Workspace, workspaces, ('created_at', 'updated_at'))
+    access.grant_ownership((workspace.pk, workspace.owner_id) for workspace in workspaces)
+    return len(workspaces)
+
+
+def import_invites(records, state):
+    rows = [build_row(record, INVITE_FIELDS) for record in records]
+    workspace_ids = importable_workspace_ids(rows)
+    taken = set(WorkspaceInvite.objects.filter(code__in=[row['code'] for row in rows]).values_list('code', flat=True))
+    invites = [WorkspaceInvite(**row) for row in rows if row['workspace_id'] in workspace_ids and row['code'] not in taken]
+    insert(WorkspaceInvite, invites, ('created_at',))
+    return len(invites)
+
+
+def import_memberships(records, state):
+    users = user_ids_by_username(record.get('username') for record in records)
+    rows = [build_row(record, ('workspace_id',)) for record in records]
+    workspace_ids = importable_workspace_ids(rows)
+    pairs = [
+        (row['workspace_id'], users[record['username']])
+        for record, row in zip(records, rows)
+        if row['workspace_id'] in workspace_ids and record.get('username') in users
+    ]
+    existing = set(Membership.objects.filter(workspace__in=workspace_ids).values_list('workspace_id', 'user_id'))
+    pairs = [pair for pair in pairs if pair not in existing]
+    Membership.objects.bulk_create(
+        [Membership(workspace_id=workspace_id, user_id=user_id) for workspace_id, user_id in pairs],
+        ignore_conflicts=True,
+    )
+    access.grant_membership(pairs)
+    return len(pairs)
+
+
+def import_agents(records, state):
+    rows = [build_row(record, AGENT_FIELDS) for record in records]
+    agents = [AgentAssignment(**row) for row in new_rows(AgentAssignment, rows, AGENT_KEY, 'created_at')]
+    insert(AgentAssignment, agents, ('created_at', 'updated_at'))
+    roster.refresh_active_agents(agent.workspace_id for agent in agents)
+    return len(agents)
+
+
+def import_metric_points(records, state):
+    rows = [build_row(record, METRIC_POINT_FIELDS) for record in records]
+    points = [WorkspaceMetricPoint(**row) for row in new_rows(WorkspaceMetricPoint, rows, METRIC_POINT_KEY, 'recorded_at')]
+    insert(WorkspaceMetricPoint, points)
+    return len(points)
+
+
+def import_metric_rollups(records, state):
+    rows = [build_row(record, METRIC_ROLLUP_FIELDS) for record in records]
+    rollups = [WorkspaceMetricRollup(**row) for row in new_rows(WorkspaceMetricRollup, rows, METRIC_ROLLUP_KEY, 'bucket_start')]
+    WorkspaceMetricRollup.objects.bulk_create(rollups, ignore_conflicts=True)
+    return len(rollups)
+
+
+# In dependency order; a batch spanning two types writes parents first
+IMPORTERS = {
+    'workspace': import_workspaces,
+    'invite': import_invites,
+    'membership': import_memberships,
+    'agent': import_agents,
+    'metric_point': import_metric_points,
+    'metric_rollup': import_metric_rollups,
+}
+
+
+def record_id(record):
+    """The id a checkpoint keeps of the record on its line."""
+    if not isinstance(record, dict):
+        return ''
+    return str(record.get('id') or record.get('workspace_id') or '')
+
+
+def ends_checkpoint(line, last_id):
+    """Whether ``line`` is (or may be) the line a checkpoint with ``last_id`` ended on."""
+    if not line.strip():
+        return True
+    try:
+        return record_id(loads(line)) == last_id
+    except ValueError:
+        return False
+
+
+def apply_batch(batch, line_number, checkpoint, result, state):
+    by_type = defaultdict(list)
+    for kind, record in batch:
+        by_type[kind].append(record)
+    with transaction.atomic():
+        for kind, importer in IMPORTERS.items():
+            records = by_type.get(kind)
+            if records:
+                imported = importer(records, state)
+                result['imported'][kind] += imported
+                result['skipped'][kind] += len(records) - imported
+        if checkpoint:
+            ImportCheckpoint.objects.update_or_create(name=checkpoint, defaults={
+                'line': line_number,
+                'last_id': record_id(batch[-1][1]) if batch else '',
+            })
+    result['line'] = line_number
+
+
+def import_ndjson(lines, checkpoint=None, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Import an ``export_ndjson`` export from an iterable of lines. With a
+    ``checkpoint`` name, lines up to that checkpoint's committed line are
+    skipped, after checking the last of them is the record the checkpoint
+    ended on. Returns the records imported and skipped per type, the ids of
+    workspaces skipped for an invite code conflict, and the last line
+    committed.
+    """
+    start, last_id = 0, ''
+    if checkpoint:
+        saved = ImportCheckpoint.objects.filter(name=checkpoint).values_list('line', 'last_id').first()
+        if saved:
+            start, last_id = saved
+    result = {'imported': Counter(), 'skipped': Counter(), 'conflicts': [], 'resumed_from': start, 'line': start}
+    # Workspaces skipped for a taken invite code
+    state = {'conflicts': result['conflicts']}
+
+    batch = []
+    line_number = 0
+    for line_number, line in enumerate(lines, 1):
+        if line_number == start and last_id and not ends_checkpoint(line, last_id):
+            raise TransferError(f'Line {line_number}: does not match checkpoint {checkpoint!r}; is this the same file?')
+        if line_number <= start or not line.strip():
+            continue
+        try:
+            record = loads(line)
+        except ValueError as exc:
+            raise TransferError(f'Line {line_number}: invalid JSON ({exc})')
+        kind = record.pop('type', None) if isinstance(record, dict) else None
+        if kind == 'header':
+            if record.get('format') != FORMAT or record.get('version') != VERSION:
+                raise TransferError(f"Line {line_number}: unsupported export {record.get('format')!r} version {record.get('version')!r}")
+            continue
+        if kind not in IMPORTERS:
+            raise TransferError(f'Line {line_number}: unknown record type {kind!r}')
+        batch.append((kind, record))
+        if len(batch) >= batch_size:
+            apply_batch(batch, line_number, checkpoint, result, state)
+            batch = []
+    if line_number > start:
+        # Also records trailing blank or header lines in the checkpoint
+        apply_batch(batch, line_number, checkpoint, result, state)
+    return result
@@ -0,0 +1,174 @@
+"""
+Snapshot cache for resolving the ``User`` behind an authenticated request.
+
+Lookups go through an in-process LRU tier first and an optional shared
+(Django cache) tier second, falling back to the database. Snapshots are
+plain dicts of the ``SNAPSHOT_FIELDS`` that authentication and permission
+checks read, and every hit is rebuilt into a fresh ``User`` instance so
+requests never share a mutable object. Credentials (the password hash,
+the TOTP secret) are never cached: they are deferred on restored users,
+so the few places that verify them load them from the database.
+
+Entries are dropped by the ``User`` signal handlers in ``app.signals``.
+Writes that bypass signals (``QuerySet.update``) must call
+``user_cache.invalidate`` themselves; the local tier TTL bounds how long
+another process can keep serving a stale snapshot.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS
+
+DEFAULTS = {
+    'LOCAL_MAX_ENTRIES': 1024,
+    'LOCAL_TTL': 60,
+    'SHARED_CACHE_ALIAS': None,
+    'SHARED_TTL': 300,
+    'KEY_PREFIX': 'user-snapshot',
+}
+
+# Cached per user; any other field is deferred on a restored User
+SNAPSHOT_FIELDS = (
+    'id', 'username', 'email', 'full_name', 'first_name', 'last_name',
+    'is_active', 'is_staff', 'is_superuser', 'mfa_enabled',
+)
+
+
+class LocalLRUTier:
+    """Thread-safe, size-bounded LRU with per-entry expiry."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedCacheTier:
+    """Tier backed by a configured Django cache (e.g. Redis)."""
+
+    def __init__(self, alias, ttl, key_prefix):
+        self.cache = caches[alias]
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+
+    def _key(self, key):
+        return f'{self.key_prefix}:{key}'
+
+    def get(self, key):
+        return self.cache.get(self._key(key))
+
+    def set(self, key, value):
+        self.cache.set(self._key(key), value, self.ttl)
+
+    def delete(self, key):
+        self.cache.delete(self._key(key))
+
+    def clear(self):
+        # Shared entries expire on their own; never flush a cache other
+        # services may be using.
+        pass
+
+
+class UserSnapshotCache:
+    def __init__(self, tiers):
+        self.tiers = tiers
+        self.user_model = get_user_model()
+        # In model order, which from_db expects for a partial row
+        self.field_names = [field.attname for field in self.user_model._meta.concrete_fields if field.attname in SNAPSHOT_FIELDS]
+
+    def key(self, user_id):
+        # Token claims carry the id as a string, signal handlers as the pk.
+        return str(user_id)
+
+    def snapshot(self, user):
+        return {name: getattr(user, name) for name in self.field_names}
+
+    def restore(self, snapshot):
+        return self.user_model.from_db(DEFAULT_DB_ALIAS, self.field_names, [snapshot[name] for name in self.field_names])
+
+    def get_user(self, user_id):
+        """Return a ``User`` for ``user_id``, or ``None`` if no such row exists."""
+        key = self.key(user_id)
+        for index, tier in enumerate(self.tiers):
+            snapshot = tier.get(key)
+            if snapshot is not None:
+                # Promote into the faster tiers we missed on the way down.
+                for faster in self.tiers[:index]:
+                    faster.set(key, snapshot)
+                return self.restore(snapshot)
+
+        user = self.user_model.objects.filter(pk=user_id).first()
+        if user is not None:
+            snapshot = self.snapshot(user)
+            for tier in self.tiers:
+                tier.set(key, snapshot)
+        return user
+
+    def invalidate(self, user_id):
+        key = self.key(user_id)
+        for tier in self.tiers:
+            tier.delete(key)
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+
+def build_user_cache():
+    config = {**DEFAULTS, **getattr(settings, 'USER_SNAPSHOT_CACHE', {})}
+    tiers = [LocalLRUTier(config['LOCAL_MAX_ENTRIES'], config['LOCAL_TTL'])]
+    if config['SHARED_CACHE_ALIAS']:
+        tiers.append(SharedCacheTier(config['SHARED_CACHE_ALIAS'], config['SHARED_TTL'], config['KEY_PREFIX']))
+    return UserSnapshotCache(tiers)
+
+
+_user_cache = None
+
+
+def get_user_cache():
+    global _user_cache
+    if _user_cache is None:
+        _user_cache = build_user_cache()
+    return _user_cache
+
+
+def _reset_user_cache(*, setting, **kwargs):
+    global _user_cache
+    if setting in ('USER_SNAPSHOT_CACHE', 'CACHES'):
+        _user_cache = None
+
+
+setting_changed.connect(_reset_user_cache)
@@ -1,86 +1,427 @@
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework import generics, permissions, status, viewsets
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
+from rest_framework.views import APIView
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from django.contrib.auth import get_user_model
-from django.contrib.auth.tokens import PasswordResetTokenGenerator
-from django.utils.encoding import force_bytes
-from django.utils.http import urlsafe_base64_encode
-from django.core.mail import send_mail
 from django.conf import settings
-from .serializers import UserRegistrationSerializer, WorkspaceSerializer, JoinWorkspaceSerializer, PasswordResetRequestSerializer, PasswordResetConfirmSerializer, MFASetupSerializer, MFAVerifySerializer, MFALoginSerializer
-from .models import Workspace
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils import timezone
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Count, Max, Min, Sum
+from .serializers import UserRegistrationSerializer, WorkspaceSerializer, JoinWorkspaceSerializer, PasswordResetRequestSerializer, PasswordResetConfirmSerializer, MFASetupSerializer, MFAVerifySerializer, MFALoginSerializer, LoginSerializer, WorkspaceReadSerializer, BulkMembershipSerializer, WorkspaceInviteSerializer, MetricIngestSerializer, MetricQuerySerializer, AgentAssignmentSerializer, AgentStatusUpdateSerializer, BulkUserProvisionSerializer
+from .models import AgentAssignment, MFABackupCode, Workspace, WorkspaceAccess, WorkspaceInvite, WorkspaceMetricPoint, WorkspaceMetricRollup
+from . import access, db, instrumentation, mfa, outbox, provisioning, roster, schema, transfer
+from .authentication import CachedJWTAuthentication, MetricsTokenAuthentication
+from .metrics import ingest as ingest_metrics
+from .compression import negotiate_encoding
+from .fastjson import FastJSONParser
+from .conditional import PreconditionFailed, etag_matches, if_match_timestamps, is_conditional, last_modified, not_modified, validator_headers, workspace_etag, workspace_list_etag
+from .json_updates import JSONMergePatch, JSONPatchError, JSONPatchParser, MergePatchParser, apply_json_patch, apply_merge_patch, supports_sql_merge_patch
+from .pagination import AgentPagination, WorkspacePagination
+from .throttling import LoginRateThrottle, MFALoginRateThrottle, PasswordResetRateThrottle, RegisterRateThrottle
 import pyotp
-import qrcode
-import io
-import base64
-from datetime import timedelta
 from rest_framework_simplejwt.views import TokenObtainPairView
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 
 User = get_user_model()
 
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = (permissions.AllowAny,)
+    throttle_classes = (RegisterRateThrottle,)
     serializer_class = UserRegistrationSerializer
 
 class WorkspaceViewSet(viewsets.ModelViewSet):
     queryset = Workspace.objects.all()
     serializer_class = WorkspaceSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = WorkspacePagination
+    # Reads accept ?fields=a,b or ?omit=a,b to select serializer fields. They
+    # are served by WorkspaceReadSerializer, which only reads the selected
+    # columns, so unselected JSON blobs never leave the database.
+    sparse_fieldset_actions = ('list', 'retrieve')
+    # Fields editable through the patch_json action. active_agents is
+    # derived from the agent roster (app.roster), so it is read-only.
+    json_fields = ('metrics',)
+
+    def get_sparse_fields(self):
+        """Serializer field names requested through ?fields= / ?omit=, or None for all."""
+        if self.action not in self.sparse_fieldset_actions:
+            return None
+        if not hasattr(self, '_sparse_fields'):
+            available = list(self.get_serializer_class()().fields)
+            params = self.request.query_params
+            fields = [name for name in params.get('fields', '').split(',') if name]
+            omit = [name for name in params.get('omit', '').split(',') if name]
+            unknown = sorted(set(fields + omit) - set(available))
+            if unknown:
+                raise ValidationError({'fields': [f"Unknown field(s): {', '.join(unknown)}"]})
+            selected = [name for name in (fields or available) if name not in omit]
+            self._sparse_fields = selected if (fields or omit) else None
+        return self._sparse_fields
+
+    def list(self, request, *args, **kwargs):
+        workspaces = self.filter_queryset(self.get_queryset())
+        # The validator comes first, so an unchanged poll is one aggregate
+        # query and no serialization. Every page shares it.
+        validator = workspaces.aggregate(updated_at=Max('updated_at'), metrics_updated_at=Max('metrics_updated_at'), count=Count('id'))
+        headers = validator_headers(workspace_list_etag(request.user.pk, **validator))
+        if not_modified(request, headers['ETag']):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        reader = WorkspaceReadSerializer(fields=self.get_sparse_fields())
+        # Pagination seeks on updated_at, so it has to be in the rows
+        queryset = reader.rows(workspaces, extra_columns=('updated_at',))
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            response = self.get_paginated_response(reader.to_representation(page))
+        else:
+            response = Response(reader.to_representation(queryset))
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = {self.lookup_field: kwargs[self.lookup_url_kwarg or self.lookup_field]}
+        if is_conditional(request):
+            versions = get_object_or_404(self.get_queryset().values_list('updated_at', 'metrics_updated_at'), **lookup)
+            headers = validator_headers(workspace_etag(*versions), last_modified(*versions))
+            if not_modified(request, headers['ETag'], last_modified(*versions)):
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        reader = WorkspaceReadSerializer(fields=self.get_sparse_fields())
+        rows = reader.rows(self.get_queryset(), extra_columns=('updated_at', 'metrics_updated_at'))
+        row = get_object_or_404(rows, **lookup)
+        versions = (row['updated_at'], row['metrics_updated_at'])
+        return Response(reader.to_representation([row])[0], headers=validator_headers(workspace_etag(*versions), last_modified(*versions)))
+
+    def check_if_match(self, workspace_id):
+        """
+        Enforce If-Match for a write to ``workspace_id``. Must run inside the
+        write's transaction: it locks the row until the write commits.
+        """
+        expected = if_match_timestamps(self.request)
+        if expected is None:
+            return
+        current = Workspace.objects.select_for_update().filter(pk=workspace_id).values_list('updated_at', flat=True).first()
+        if current not in expected:
+            raise PreconditionFailed()
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        response['ETag'] = workspace_etag(*self.versions)
+        return response
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            self.check_if_match(serializer.instance.pk)
+            workspace = serializer.save()
+            self.versions = (workspace.updated_at, workspace.metrics_updated_at)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            self.check_if_match(instance.pk)
+            instance.delete()
+
+    @action(detail=True, methods=['patch'], url_path='json', parser_classes=[JSONPatchParser, MergePatchParser, FastJSONParser])
+    def patch_json(self, request, pk=None):
+        """
+        Partially update the JSON fields, treating them as one document
+        ``{"metrics": ...}``. Accepts a JSON merge
+        patch (application/merge-patch+json or application/json) or a JSON
+        Patch (application/json-patch+json). Honours If-Match.
+        """
+        workspace_id = self.get_accessible_workspace_id()
+        fields = list(self.json_fields)
+        expected = if_match_timestamps(request)
+        now = timezone.now()
+
+        if request.content_type.startswith(JSONPatchParser.media_type):
+            if not isinstance(request.data, list):
+                raise ValidationError({'detail': 'A JSON Patch document must be a list of operations.'})
+            with transaction.atomic():
+                self.check_if_match(workspace_id)
+                current = Workspace.objects.filter(pk=workspace_id).values(*fields).get()
+                try:
+                    document = apply_json_patch(current, request.data)
+                except JSONPatchError as e:
+                    raise ValidationError({'detail': str(e)})
+                if not isinstance(document, dict) or set(document) != set(fields):
+                    raise ValidationError({'detail': f"Only {', '.join(fields)} can be patched."})
+                Workspace.objects.filter(pk=workspace_id).update(updated_at=now, **self.validate_json_fields(document))
+        else:
+            patch = request.data
+            if not isinstance(patch, dict) or not patch or set(patch) - set(fields):
+                raise ValidationError({'detail': f"A merge patch must be an object with keys from: {', '.join(fields)}."})
+            if supports_sql_merge_patch():
+                # A merge result has its patch's type (null, object or the
+                # replacing value), so checking it against no target suffices
+                self.validate_json_fields({field: apply_merge_patch(None, value) for field, value in patch.items()})
+                rows = Workspace.objects.filter(pk=workspace_id)
+                if expected is not None:
+                    rows = rows.filter(updated_at__in=expected)
+                if not rows.update(updated_at=now, **{field: JSONMergePatch(field, value) for field, value in patch.items()}):
+                    raise PreconditionFailed()
+            else:
+                with transaction.atomic():
+                    self.check_if_match(workspace_id)
+                    current = Workspace.objects.filter(pk=workspace_id).values(*patch).get()
+                    document = {field: apply_merge_patch(current[field], value) for field, value in patch.items()}
+                    Workspace.objects.filter(pk=workspace_id).update(updated_at=now, **self.validate_json_fields(document))
+
+        result = Workspace.objects.filter(pk=workspace_id).values(*fields, 'updated_at', 'metrics_updated_at').get()
+        return Response({field: result[field] for field in fields}, headers={'ETag': workspace_etag(result['updated_at'], result['metrics_updated_at'])})
+
+    def validate_json_fields(self, document):
+        """Check patched JSON field values against WorkspaceSerializer's rules."""
+        serializer = WorkspaceSerializer(data=document, partial=True, fields=list(document))
+        serializer.is_valid(raise_exception=True)
+        return {field: serializer.validated_data[field] for field in document}
 
     def perform_create(self, serializer):
-        workspace = serializer.save(owner=self.request.user)
-        workspace.members.add(self.request.user)
+        # Workspace, membership and their WorkspaceAccess rows commit together
+        with transaction.atomic():
+            workspace = serializer.save(owner=self.request.user)
+            workspace.members.add(self.request.user)
 
     def get_queryset(self):
-        # Return workspaces where user is owner or member
-        return self.request.user.workspaces.all() | self.request.user.owned_workspaces.all()
+        # Return workspaces where user is owner or member, via the access index
+        return Workspace.objects.filter(access__user=self.request.user)
 
     @action(detail=False, methods=['post'])
     def join(self, request):
         serializer = JoinWorkspaceSerializer(data=request.data)
         if serializer.is_valid():
             invite_code = serializer.validated_data['invite_code']
-            try:
-                workspace = Workspace.objects.get(invite_code=invite_code)
-                if request.user in workspace.members.all():
-                     return Response({'detail': 'Already a member'}, status=status.HTTP_400_BAD_REQUEST)
-                
-                workspace.members.add(request.user)
-                return Response({'detail': 'Successfully joined workspace', 'workspace_id': workspace.id})
-            except Workspace.DoesNotExist:
+            invite = WorkspaceInvite.objects.filter(code=invite_code).values('id', 'workspace_id').first()
+            if invite is None:
                 return Response({'detail': 'Invalid invite code'}, status=status.HTTP_404_NOT_FOUND)
+            workspace_id = invite['workspace_id']
+
+            # Joining twice is a no-op rather than an error, and doesn't use up the invite
+            if access.is_member(workspace_id, request.user.pk):
+                return Response({'detail': 'Already a member', 'workspace_id': workspace_id})
+
+            with transaction.atomic():
+                if not WorkspaceInvite.objects.redeem(invite['id']):
+                    return Response({'detail': 'Invite code has expired or reached its usage limit'}, status=status.HTTP_410_GONE)
+                access.add_members(workspace_id, [request.user.pk])
+            return Response({'detail': 'Successfully joined workspace', 'workspace_id': workspace_id})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        # Streams the caller's own workspaces; rows are read in chunks as the
+        # client consumes the body (see app.transfer)
+        workspaces = Workspace.objects.filter(owner=request.user)
+        response = StreamingHttpResponse(transfer.export_ndjson(workspaces), content_type=transfer.MEDIA_TYPE)
+        response['Content-Disposition'] = 'attachment; filename="workspaces.ndjson"'
+        return response
+
+    def get_owned_workspace(self):
+        workspace = self.get_object()
+        if workspace.owner_id != self.request.user.pk:
+            raise PermissionDenied('Only the workspace owner can manage members.')
+        return workspace
+
+    def get_accessible_workspace_id(self):
+        # Access check without loading the row (and its JSON blobs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return get_object_or_404(self.get_queryset().values_list('id', flat=True), pk=self.kwargs[lookup_url_kwarg])
+
+    def get_metric_rows(self, query):
+        """Points or rollup buckets for a validated MetricQuerySerializer."""
+        data = query.validated_data
+        workspace_id = self.get_accessible_workspace_id()
+        if data['resolution'] == 'raw':
+            rows = WorkspaceMetricPoint.objects.filter(workspace_id=workspace_id, name=data['name'])
+            time_field = 'recorded_at'
+        else:
+            rows = WorkspaceMetricRollup.objects.filter(workspace_id=workspace_id, name=data['name'], resolution=data['resolution'])
+            time_field = 'bucket_start'
+        if data.get('start'):
+            rows = rows.filter(**{f'{time_field}__gte': data['start']})
+        if data.get('end'):
+            rows = rows.filter(**{f'{time_field}__lt': data['end']})
+        return rows.order_by(time_field)
+
+    @action(detail=True, methods=['get', 'post'])
+    def metrics(self, request, pk=None):
+        if request.method == 'POST':
+            workspace_id = self.get_accessible_workspace_id()
+            serializer = MetricIngestSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            stored = ingest_metrics(workspace_id, serializer.validated_data['points'])
+            return Response({'stored': stored}, status=status.HTTP_201_CREATED)
+
+        query = MetricQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        rows = self.get_metric_rows(query)[:query.validated_data['limit']]
+        if query.validated_data['resolution'] == 'raw':
+            results = [{'recorded_at': recorded_at, 'value': value} for recorded_at, value in rows.values_list('recorded_at', 'value')]
+        else:
+            results = [
+                {'bucket_start': bucket, 'count': count, 'sum': total, 'min': minimum, 'max': maximum, 'avg': total / count}
+                for bucket, count, total, minimum, maximum in rows.values_list('bucket_start', 'count', 'total', 'minimum', 'maximum')
+            ]
+        return Response({'name': query.validated_data['name'], 'resolution': query.validated_data['resolution'], 'results': results})
+
+    @action(detail=True, methods=['get'], url_path='metrics/summary')
+    def metrics_summary(self, request, pk=None):
+        # Aggregates over rollup buckets, so start/end are effectively
+        # aligned to the chosen resolution.
+        query = MetricQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        rows = self.get_metric_rows(query)
+        if query.validated_data['resolution'] == 'raw':
+            summary = rows.aggregate(count=Count('id'), sum=Sum('value'), min=Min('value'), max=Max('value'))
+        else:
+            summary = rows.aggregate(count=Sum('count'), sum=Sum('total'), min=Min('minimum'), max=Max('maximum'))
+        summary['count'] = summary['count'] or 0
+        summary['avg'] = summary['sum'] / summary['count'] if summary['count'] else None
+        return Response({'name': query.validated_data['name'], 'resolution': query.validated_data['resolution'], **summary})
+
+    @action(detail=True, methods=['get', 'post'], serializer_class=WorkspaceInviteSerializer)
+    def invites(self, request, pk=None):
+        workspace = self.get_owned_workspace()
+        if request.method == 'GET':
+            invites = WorkspaceInvite.objects.usable().filter(workspace=workspace).order_by('-created_at')
+            return Response(WorkspaceInviteSerializer(invites, many=True).data)
+
+        serializer = WorkspaceInviteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(workspace=workspace, created_by=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], url_path='members/add', serializer_class=BulkMembershipSerializer)
+    def add_members(self, request, pk=None):
+        workspace = self.get_owned_workspace()
+        serializer = BulkMembershipSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        user_ids, not_found = serializer.resolve_users()
+        added = access.add_members(workspace.pk, user_ids)
+        added_set = set(added)
+        return Response({
+            'added': added,
+            'already_members': [user_id for user_id in user_ids if user_id not in added_set],
+            'not_found': not_found,
+        })
+
+    @action(detail=True, methods=['post'], url_path='members/remove', serializer_class=BulkMembershipSerializer)
+    def remove_members(self, request, pk=None):
+        workspace = self.get_owned_workspace()
+        serializer = BulkMembershipSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        user_ids, not_found = serializer.resolve_users()
+        removed = set(access.remove_members(workspace.pk, user_ids))
+        return Response({
+            'removed': [user_id for user_id in user_ids if user_id in removed],
+            'not_members': [user_id for user_id in user_ids if user_id not in removed],
+            'not_found': not_found,
+        })
+
+class AgentAssignmentViewSet(viewsets.ModelViewSet):
+    """
+    Agent roster across the workspaces the user can access. Filter with
+    ?workspace=<id>, ?status= and ?agent_type=; all filtering and paging
+    happens in SQL.
+    """
+    serializer_class = AgentAssignmentSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = AgentPagination
+    filter_params = ('workspace', 'status', 'agent_type')
+
+    def get_queryset(self):
+        accessible = WorkspaceAccess.objects.filter(user=self.request.user).values('workspace_id')
+        queryset = AgentAssignment.objects.filter(workspace_id__in=accessible)
+        for param in self.filter_params:
+            value = self.request.query_params.get(param)
+            if value:
+                try:
+                    queryset = queryset.filter(**{param: value})
+                except DjangoValidationError as e:
+                    raise ValidationError({param: e.messages})
+        return queryset
+
+    # Every roster write re-derives its workspace's active_agents in the
+    # same transaction (see app/roster.py)
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            agent = serializer.save()
+            roster.refresh_active_agents([agent.workspace_id])
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            agent = serializer.save()
+            roster.refresh_active_agents([agent.workspace_id])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            roster.refresh_active_agents([instance.workspace_id])
+
+    @action(detail=False, methods=['post'], url_path='set-status')
+    def set_status(self, request):
+        serializer = AgentStatusUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        # One UPDATE, limited to agents in the user's workspaces
+        agents = self.get_queryset().filter(pk__in=serializer.validated_data['ids'])
+        with transaction.atomic():
+            workspace_ids = set(agents.values_list('workspace_id', flat=True))
+            updated = agents.update(status=serializer.validated_data['status'], updated_at=timezone.now())
+            roster.refresh_active_agents(workspace_ids)
+        return Response({'updated': updated})
+
+class BulkUserProvisionView(generics.GenericAPIView):
+    # JSON {"users": [...], "workspace": id}, or CSV rows with ?workspace=id
+    permission_classes = (permissions.IsAdminUser,)
+    serializer_class = BulkUserProvisionSerializer
+    parser_classes = (FastJSONParser, provisioning.CSVParser)
+
+    def post(self, request):
+        data = request.data
+        if isinstance(data, list):
+            data = {'users': data}
+            if request.query_params.get('workspace'):
+                data['workspace'] = request.query_params['workspace']
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            results = provisioning.provision(serializer.validated_data['users'], serializer.validated_data.get('workspace'))
+        except IntegrityError:
+            # A username or email was taken by someone else after validation
+            return Response({'detail': 'Some users were created concurrently, please retry.'}, status=status.HTTP_409_CONFLICT)
+        created = sum(result['status'] == 'created' for result in results)
+        return Response({
+            'created': created,
+            'invalid': len(results) - created,
+            'results': results,
+        })
+
 class RequestPasswordResetView(generics.GenericAPIView):
     permission_classes = (permissions.AllowAny,)
+    throttle_classes = (PasswordResetRateThrottle,)
     serializer_class = PasswordResetRequestSerializer
 
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            email = serializer.validated_data['email']
-            user = User.objects.filter(email=email).first()
-            if user:
-                token = PasswordResetTokenGenerator().make_token(user)
-                uidb64 = urlsafe_base64_encode(force_bytes(user.pk))
-                # For now, printing link to console or sending real email
-                reset_link = f"http://localhost:3000/reset-password?uid={uidb64}&token={token}"
-                
-                # Send Email
-                try:
-                    send_mail(
-                        'Password Reset Request',
-                        f'Click the link to reset your password: {reset_link}',
-                        'noreply@aisyntheticworkforce.com',
-                        [email],
-                        fail_silently=False,
-                    )
-                except Exception as e:
-                    return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
+            # Same single INSERT whether or not the account exists; the
+            # outbox worker looks the user up and sends the link.
+            outbox.enqueue('password_reset', {'email': serializer.validated_data['email']})
+
             # For security, always return success message 
             return Response({'detail': 'If an account exists, a reset link has been sent.'}, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -101,34 +442,41 @@ class MFASetupView(generics.GenericAPIView):
     serializer_class = MFASetupSerializer
 
     def get(self, request):
-        # Generate Secret
-        secret = pyotp.random_base32()
-        
-        # Generate QR Code
-        totp = pyotp.TOTP(secret)
-        provisioning_uri = totp.provisioning_uri(name=request.user.email, issuer_name="AI Synthetic Workforce")
-        
-        qr = qrcode.make(provisioning_uri)
-        buffered = io.BytesIO()
-        qr.save(buffered, format="PNG")
-        qr_image_base64 = base64.b64encode(buffered.getvalue()).decode()
-        
-        # Generate Backup Codes (10 codes of 8 digits)
-        backup_codes = [pyotp.random_base32()[:8] for _ in range(10)]
-        
-        # Save secret temporarily? 
-        # Actually standard practice: save secret but don't enable MFA yet.
-        # Allow user to scan, then VERIFY to enable.
-        request.user.mfa_secret = secret
-        request.user.backup_codes = backup_codes
-        request.user.save()
+        # The pending secret lives in the cache until MFAVerifyView confirms it,
+        # so refreshing this page neither rotates the secret nor touches the user row
+        enrollment = mfa.start_enrollment(request.user)
+        secret = enrollment['secret']
 
         return Response({
             'secret': secret,
-            'qr_image': qr_image_base64,
-            'backup_codes': backup_codes
+            'qr_svg': mfa.render_qr(request.user, secret, 'svg').decode(),
+            'qr_url': reverse('mfa_setup_qr', request=request),
+            'backup_codes': enrollment['backup_codes'],
+            'expires_in': mfa.enrollment_ttl(),
         })
 
+class MFASetupQRView(APIView):
+    """QR code for the pending enrollment as an image (?image_format=svg|png)."""
+    permission_classes = (permissions.IsAuthenticated,)
+
+    @extend_schema(
+        parameters=[OpenApiParameter('image_format', str, enum=list(mfa.QR_FORMATS), default='svg')],
+        responses={(200, media_type): OpenApiTypes.BINARY for media_type in mfa.QR_FORMATS.values()},
+    )
+    def get(self, request):
+        enrollment = mfa.get_enrollment(request.user)
+        if enrollment is None:
+            return Response({"detail": "MFA setup not initiated."}, status=status.HTTP_404_NOT_FOUND)
+
+        image_format = request.query_params.get('image_format', 'svg')
+        if image_format not in mfa.QR_FORMATS:
+            return Response({"detail": "Unsupported format."}, status=status.HTTP_400_BAD_REQUEST)
+
+        image = mfa.render_qr(request.user, enrollment['secret'], image_format)
+        response = HttpResponse(image, content_type=mfa.QR_FORMATS[image_format])
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
 class MFAVerifyView(generics.GenericAPIView):
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = MFAVerifySerializer
@@ -137,48 +485,45 @@ class MFAVerifyView(generics.GenericAPIView):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             code = serializer.validated_data['code']
-            if not request.user.mfa_secret:
+            enrollment = mfa.get_enrollment(request.user)
+            if enrollment is None:
                  return Response({"detail": "MFA setup not initiated."}, status=status.HTTP_400_BAD_REQUEST)
-            
-            totp = pyotp.TOTP(request.user.mfa_secret)
+
+            totp = pyotp.TOTP(enrollment['secret'])
             if totp.verify(code):
-                request.user.mfa_enabled = True
-                request.user.save()
+                # The only write of the enrollment: secret, codes and flag together
+                user = request.user
+                user.mfa_secret = enrollment['secret']
+                user.mfa_enabled = True
+                with transaction.atomic():
+                    user.save(update_fields=['mfa_secret', 'mfa_enabled'])
+                    MFABackupCode.objects.replace(user, enrollment['backup_codes'])
+                mfa.finish_enrollment(user)
                 return Response({"detail": "MFA enabled successfully."})
             return Response({"detail": "Invalid code"}, status=status.HTTP_400_BAD_REQUEST)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class CustomTokenObtainPairView(TokenObtainPairView):
+    # LoginSerializer checks the credentials once and returns either the
+    # MFA temp token or the real token pair, so there is no second pass.
+    serializer_class = LoginSerializer
+    throttle_classes = (LoginRateThrottle,)
+
     def post(self, request, *args, **kwargs):
-        # Allow standard login logic to check credentials first
-        # SimpleJWT's TokenObtainPairView uses a serializer to validate credentials
-        # We can inspect the serializer after validation
         serializer = self.get_serializer(data=request.data)
-        
+
         try:
             serializer.is_valid(raise_exception=True)
-        except Exception as e:
-             return Response(serializer.errors, status=status.HTTP_401_UNAUTHORIZED)
-             
-        user = serializer.user
-        
-        if user.mfa_enabled:
-            # Issue a temporary token (subset of Access Token with specific scope/claim)
-            # Or just a signed JWT meant for MFA exchange
-            temp_token = AccessToken.for_user(user)
-            # We can start the token with a short lifetime
-            temp_token.set_exp(lifetime=timedelta(minutes=5))
-            temp_token['mfa_pending'] = True
-            
-            return Response({
-                'mfa_required': True,
-                'temp_token': str(temp_token)
-            })
-            
-        return super().post(request, *args, **kwargs)
+        except ValidationError:
+            return Response(serializer.errors, status=status.HTTP_401_UNAUTHORIZED)
+        except TokenError as e:
+            raise InvalidToken(e.args[0]) from e
+
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
 
 class MFALoginConfirmView(generics.GenericAPIView):
     permission_classes = (permissions.AllowAny,)
+    throttle_classes = (MFALoginRateThrottle,)
     serializer_class = MFALoginSerializer
 
     def post(self, request):
@@ -206,11 +551,7 @@ class MFALoginConfirmView(generics.GenericAPIView):
                 if totp.verify(code):
                     is_valid = True
             elif backup_code:
-                if backup_code in user.backup_codes:
-                    # Remove used backup code
-                    user.backup_codes.remove(backup_code)
-                    user.save()
-                    is_valid = True
+                is_valid = MFABackupCode.objects.consume(user, backup_code)
             
             if is_valid:
                 # Generate real tokens
@@ -222,3 +563,52 @@ class MFALoginConfirmView(generics.GenericAPIView):
             
             return Response({"detail": "Invalid code"}, status=status.HTTP_400_BAD_REQUEST)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+class DatabaseHealthView(APIView):
+    """Liveness of the database connection plus this process's pool counters."""
+    permission_classes = (permissions.AllowAny,)
+    authentication_classes = ()
+
+    @extend_schema(responses={200: OpenApiTypes.OBJECT, 503: OpenApiTypes.OBJECT})
+    def get(self, request):
+        info = db.connection_info()
+        try:
+            info['latency_ms'] = round(db.ping(), 2)
+        except DatabaseError as exc:
+            info.update(status='unavailable', error=str(exc))
+            return Response(info, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        info['status'] = 'ok'
+        return Response(info)
+
+class MetricsView(APIView):
+    """Prometheus text exposition of this process's request and subsystem metrics."""
+    authentication_classes = (MetricsTokenAuthentication, CachedJWTAuthentication)
+
+    def check_permissions(self, request):
+        if request.auth != 'metrics' and not request.user.is_staff:
+            self.permission_denied(request)
+
+    @extend_schema(responses={(200, 'text/plain'): OpenApiTypes.STR})
+    def get(self, request):
+        return HttpResponse(instrumentation.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class OpenAPISchemaView(APIView):
+    """The prebuilt OpenAPI schema (app.schema), compressed per Accept-Encoding."""
+    permission_classes = (permissions.AllowAny,)
+    authentication_classes = ()
+    schema = None
+
+    def get(self, request):
+        artifact = schema.get_schema_artifact()
+        if etag_matches(request, artifact.etag):
+            response = HttpResponseNotModified()
+        else:
+            encoding = negotiate_encoding(request.headers.get('Accept-Encoding'), artifact.variants)
+            response = HttpResponse(artifact.variants.get(encoding, artifact.body), content_type=schema.MEDIA_TYPE)
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = artifact.etag
+        response['Vary'] = 'Accept-Encoding'
+        # Cacheable, but revalidated each time: a deploy changes it
+        response['Cache-Control'] = 'no-cache'
+        return response
@@ -42,7 +42,17 @@ CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS', 'http://localhost:3000'
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'app.authentication.CachedJWTAuthentication',
+    ),
+    # orjson-backed when installed, DRF's stdlib JSON classes otherwise
+    'DEFAULT_RENDERER_CLASSES': (
+        'app.fastjson.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'app.fastjson.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
 }
 
@@ -52,6 +62,19 @@ SPECTACULAR_SETTINGS = {
     'VERSION': '1.0.0',
 }
 
+# Responses of at least RESPONSE_COMPRESSION_MIN_SIZE bytes are gzip- or
+# brotli-compressed for clients that accept it.
+RESPONSE_COMPRESSION = {
+    'MIN_SIZE': int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', '1024')),
+}
+
+# Where `manage.py build_schema` writes the prebuilt schema that
+# /api/schema/json/ serves (ignored under DEBUG). Without a built copy each
+# process generates it once, on first request.
+OPENAPI_SCHEMA = {
+    'DIR': os.getenv('OPENAPI_SCHEMA_DIR', str(BASE_DIR / 'var' / 'openapi')),
+}
+
 
 # Application definition
 
@@ -70,6 +93,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so its timings cover the whole stack (see app/instrumentation.py)
+    'app.instrumentation.RequestMetricsMiddleware',
+    # gzip/brotli per Accept-Encoding (see app/compression.py)
+    'app.compression.CompressionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -109,8 +136,11 @@ database_url = os.getenv('DATABASE_URL')
 if database_url:
     DATABASES['default'] = dj_database_url.parse(
         database_url,
-        conn_max_age=600,
-        ssl_require=True,
+        conn_max_age=int(os.getenv('DB_CONN_MAX_AGE', 600)),
+        # Pre-ping: persistent connections are checked before reuse, pooled
+        # ones on checkout, so connections dropped while idle get replaced
+        conn_health_checks=True,
+        ssl_require=database_url.startswith('postgres'),
     )
 else:
     DATABASES['default'] = {
@@ -118,6 +148,65 @@ else:
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 
+# How Postgres connections are managed (see README, "Database Connections"):
+#   pool        - psycopg connection pool per process (default)
+#   transaction - behind a transaction-mode pooler (PgBouncer, Neon's -pooler host)
+#   persistent  - one long-lived connection per thread (CONN_MAX_AGE)
+DATABASE_POOL_MODE = None
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    DATABASE_POOL_MODE = os.getenv('DB_POOL_MODE', 'pool')
+    if DATABASE_POOL_MODE == 'pool':
+        # The pool owns connection lifetimes, so Django must not persist them
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            # Seconds a request waits for a free connection before erroring
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 300)),
+            'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', 1800)),
+        }
+    elif DATABASE_POOL_MODE == 'transaction':
+        # Consecutive queries may land on different server connections, so
+        # nothing may outlive a transaction: no server-side (named) cursors.
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+elif DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default']['OPTIONS'] = {
+        # WAL lets readers proceed during a write; IMMEDIATE takes the write
+        # lock up front so concurrent writers wait out the busy timeout
+        # (seconds) instead of failing with "database is locked".
+        'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        'transaction_mode': 'IMMEDIATE',
+        'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', 20)),
+    }
+
+
+# Caches
+# Redis (REDIS_URL) is shared across workers; without it each process gets
+# its own in-memory cache, which is fine for local development.
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# User snapshot cache used by CachedJWTAuthentication (see app/user_cache.py)
+USER_SNAPSHOT_CACHE = {
+    'LOCAL_MAX_ENTRIES': int(os.getenv('USER_CACHE_LOCAL_MAX_ENTRIES', 1024)),
+    'LOCAL_TTL': int(os.getenv('USER_CACHE_LOCAL_TTL', 60)),
+    'SHARED_CACHE_ALIAS': 'default' if REDIS_URL else None,
+    'SHARED_TTL': int(os.getenv('USER_CACHE_SHARED_TTL', 300)),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -170,11 +259,89 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'UPDATE_LAST_LOGIN': True,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Rotated refresh tokens are revoked through app.revocation
+    'TOKEN_REFRESH_SERIALIZER': 'app.revocation.RevocableTokenRefreshSerializer',
+}
+
+# Revoked refresh-token JTIs are buffered and inserted in batches; a Bloom
+# filter (sized for BLOOM_CAPACITY live revocations) skips the table lookup
+# for tokens that were never revoked. See app.revocation for the trade-offs.
+TOKEN_REVOCATION = {
+    'BATCH_SIZE': int(os.getenv('TOKEN_REVOCATION_BATCH_SIZE', 100)),
+    'FLUSH_INTERVAL': float(os.getenv('TOKEN_REVOCATION_FLUSH_INTERVAL', 1.0)),
+    'SYNC_INTERVAL': float(os.getenv('TOKEN_REVOCATION_SYNC_INTERVAL', 5.0)),
+    'BLOOM_CAPACITY': int(os.getenv('TOKEN_REVOCATION_BLOOM_CAPACITY', 1_000_000)),
 }
 
 # Password Reset Settings
 PASSWORD_RESET_TIMEOUT = 1800  # 30 minutes in seconds
 
+# Frontend base URL used in emailed links
+FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:3000')
+
+# Celery (only used when a broker is configured)
+CELERY_BROKER_URL = REDIS_URL
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_BEAT_SCHEDULE = {
+    # Picks up retries whose backoff has elapsed
+    'send-outbox': {'task': 'app.tasks.send_outbox', 'schedule': 30.0},
+    'purge-revoked-tokens': {'task': 'app.tasks.purge_revoked_tokens', 'schedule': 60 * 60.0},
+}
+
+# Email outbox (see app/outbox.py). Without a broker, an in-process
+# thread delivers mail after the request has returned.
+OUTBOX = {
+    'MODE': os.getenv('OUTBOX_MODE', 'celery' if REDIS_URL else 'thread'),
+    'BATCH_SIZE': int(os.getenv('OUTBOX_BATCH_SIZE', 50)),
+    'MAX_ATTEMPTS': int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8)),
+}
+
+# Auth endpoint rate limits, checked before any password hashing. 'shared'
+# keeps counters in the default cache so limits hold across workers.
+AUTH_RATE_LIMITS = {
+    'BACKEND': os.getenv('AUTH_RATE_LIMIT_BACKEND', 'shared' if REDIS_URL else 'local'),
+    # Reverse proxies in front of the app that append to X-Forwarded-For.
+    # 0 keys limits on REMOTE_ADDR; set it only if every request passes
+    # through that many proxies, or clients can spoof their IP.
+    'NUM_PROXIES': int(os.getenv('AUTH_RATE_LIMIT_NUM_PROXIES', 0)),
+    'RATES': {
+        'login': {'ip': '60/min', 'username': '10/min'},
+        'mfa_login': {'ip': '60/min', 'subject': '5/min'},
+        'password_reset': {'ip': '20/hour', 'email': '5/hour'},
+        'register': {'ip': '20/hour'},
+    },
+}
+
+# Serve register/login/password-reset/MFA login from the async views in
+# app.async_views (for ASGI), with hashing and TOTP checks on a bounded pool.
+ASYNC_AUTH_VIEWS = os.getenv('ASYNC_AUTH_VIEWS', 'False') == 'True'
+AUTH_WORKER_POOL = {
+    'KIND': os.getenv('AUTH_POOL_KIND', 'thread'),
+    'MAX_WORKERS': int(os.getenv('AUTH_POOL_MAX_WORKERS', os.cpu_count() or 2)),
+    'MAX_QUEUE': int(os.getenv('AUTH_POOL_MAX_QUEUE', 100)),
+}
+
+# Password hashing pool for POST /api/users/bulk/ (app.provisioning).
+# 'thread' suits PBKDF2, which releases the GIL; 'process' spawns workers
+BULK_PROVISIONING = {
+    'KIND': os.getenv('BULK_PROVISIONING_POOL_KIND', 'thread'),
+    'MAX_WORKERS': int(os.getenv('BULK_PROVISIONING_MAX_WORKERS', os.cpu_count() or 2)),
+}
+
+# Per-endpoint metrics at /api/metrics/ (staff users, or a scraper sending
+# "Authorization: Bearer $METRICS_TOKEN"). Requests slower than
+# SLOW_REQUEST_THRESHOLD seconds get their slowest queries logged.
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+slow_request_threshold = os.getenv('SLOW_REQUEST_THRESHOLD')
+REQUEST_METRICS = {
+    'SLOW_REQUEST_THRESHOLD': float(slow_request_threshold) if slow_request_threshold else None,
+    'SLOW_SAMPLE_RATE': float(os.getenv('SLOW_REQUEST_SAMPLE_RATE', 1.0)),
+    'SLOW_TOP_QUERIES': 5,
+}
+
+# Seconds a pending MFA enrollment (secret, backup codes, QR) stays in the cache
+MFA_ENROLLMENT_TTL = int(os.getenv('MFA_ENROLLMENT_TTL', 600))
+
 # Email Backend (Console for Dev)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 # For Production (SMTP example):
@@ -18,22 +18,25 @@ from django.contrib import admin
 from django.urls import path, include
 
 # OpenAPI / Swagger
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
-from drf_spectacular.renderers import OpenApiJsonRenderer
-
-# Extra endpoint that forces JSON renderer so browser displays schema inline
+from drf_spectacular.views import SpectacularSwaggerView
 
 from rest_framework.routers import DefaultRouter
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from app.views import RegisterView, WorkspaceViewSet, RequestPasswordResetView, SetNewPasswordView, MFASetupView, MFAVerifyView, CustomTokenObtainPairView, MFALoginConfirmView
+from django.conf import settings
+from app.views import RegisterView, WorkspaceViewSet, AgentAssignmentViewSet, RequestPasswordResetView, SetNewPasswordView, MFASetupView, MFASetupQRView, MFAVerifyView, CustomTokenObtainPairView, MFALoginConfirmView, DatabaseHealthView, MetricsView, OpenAPISchemaView, BulkUserProvisionView
+
+# ASGI deployments can serve the hashing-heavy auth endpoints from async views
+if settings.ASYNC_AUTH_VIEWS:
+    from app.async_views import AsyncRegisterView as RegisterView, AsyncLoginView as CustomTokenObtainPairView, AsyncRequestPasswordResetView as RequestPasswordResetView, AsyncSetNewPasswordView as SetNewPasswordView, AsyncMFALoginConfirmView as MFALoginConfirmView
 
 router = DefaultRouter()
 router.register(r'workspaces', WorkspaceViewSet, basename='workspace')
+router.register(r'agents', AgentAssignmentViewSet, basename='agent')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    # Schema generation
-    path('api/schema/json/', SpectacularAPIView.as_view(), name='schema-json'),
+    # Schema, built once per process (app/schema.py) and served as JSON
+    path('api/schema/json/', OpenAPISchemaView.as_view(), name='schema-json'),
     # Swagger UI
     path('api/docs/', SpectacularSwaggerView.as_view(url_name='schema-json'), name='swagger-ui'),
     
@@ -46,9 +49,16 @@ urlpatterns = [
     
     # 2FA Endpoints
     path('api/auth/mfa/setup/', MFASetupView.as_view(), name='mfa_setup'),
+    path('api/auth/mfa/setup/qr/', MFASetupQRView.as_view(), name='mfa_setup_qr'),
     path('api/auth/mfa/verify/', MFAVerifyView.as_view(), name='mfa_verify'),
     path('api/auth/mfa/login/', MFALoginConfirmView.as_view(), name='mfa_login_confirm'),
     
+    # Staff-only bulk user creation
+    path('api/users/bulk/', BulkUserProvisionView.as_view(), name='users_bulk_provision'),
+
+    path('api/health/db/', DatabaseHealthView.as_view(), name='health_db'),
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
+
     # Workspace Endpoints (Router)
     path('api/', include(router.urls)),
 ]